@@ -1,117 +1,175 @@
 """AI agent and chat processing logic."""
-import json
+import asyncio
+import contextlib
 import random
-from typing import Annotated, Tuple, Dict
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.agents import create_agent
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
-from langchain.agents.middleware import SummarizationMiddleware
+import threading
+import uuid
+from typing import Annotated, AsyncIterator, Callable, Optional, Tuple, Dict
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage, RemoveMessage
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
+from langgraph.config import get_stream_writer
 from typing_extensions import TypedDict
 from langsmith import traceable
 import os
 
 from prompts.main_agent_sys_prompt import SYSTEM_PROMPT
-from prompts.input_validation_prompt import INPUT_VALIDATION_PROMPT
-from prompts.summary_prompt import SUMMARY_PROMPT
 from prompt_tool import prompts
+from conversation_store import (
+    CheckpointerBackend,
+    create_checkpointer_backend,
+    create_conversation_store,
+    load_history_from_db,
+)
+from conversation_context import context_config, context_key, create_context_manager
+from input_validation import (
+    InputValidationResult,
+    StructuredInputValidator,
+    ValidationUnavailable,
+    input_validator,
+)
+from llm_gateway import GatewayMiddleware, LLMUnavailable, llm_gateway
 
 gemini_api_key = os.getenv('GEMINI_API_KEY')
 
+# off: no input validation; sequential: validate, then generate;
+# speculative: validate while generating and release the reply only if valid
+INPUT_VALIDATION_MODE = os.getenv('INPUT_VALIDATION_MODE', 'off').strip().lower()
+
 
 
 # ==================== Input Validation ====================
 
-class InputValidationResult(TypedDict):
-    is_valid: bool
-    reason: str
-    should_continue: bool
+# Models, the agent and the compiled graph are built on first use rather than
+# at import, so importing this module (API startup, worker spawn, scripts) does
+# not pay for the Gemini client import or require GEMINI_API_KEY.
+# Assigning these module globals (e.g. a fake model in a benchmark) replaces
+# the lazily built instance.
+gemini_model = None
+validation_model = None
+agent = None
+graph = None
+_build_lock = threading.Lock()
 
 
-# LLM Model setup
-gemini_model = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    google_api_key=gemini_api_key,
-    temperature=0.7,
-)
+def _lazy(name: str, build):
+    """Return the module global `name`, building it once under the lock if unset."""
+    value = globals()[name]
+    if value is None:
+        with _build_lock:
+            value = globals()[name]
+            if value is None:
+                value = build()
+                globals()[name] = value
+    return value
+
+
+def _build_chat_model(temperature: float, api_key: Optional[str] = None) -> BaseChatModel:
+    # Imported here: langchain_google_genai dominates this module's import time
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        google_api_key=api_key,
+        temperature=temperature,
+        # Retries are left to llm_gateway (1 means a single attempt here)
+        max_retries=1,
+    )
+
+
+def get_chat_model() -> BaseChatModel:
+    """LLM used by the journaling agent."""
+    return _lazy("gemini_model", lambda: _build_chat_model(0.7, gemini_api_key))
+
+
+def get_validation_model() -> BaseChatModel:
+    """Validation LLM (lower temperature for consistency)."""
+    return _lazy("validation_model", lambda: _build_chat_model(0.3))
 
-# Validation LLM (lower temperature for consistency)
-validation_model = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.3,
-)
 
 @tool
 def get_a_prompt() -> str:
     """Generate a random journaling prompt to inspire reflection and self-discovery."""
     return random.choice(prompts)
 
-# Create agent with summarization middleware built-in
-agent = create_agent(
-    model=gemini_model, 
-    tools=[get_a_prompt],
-    system_prompt=SYSTEM_PROMPT,
-    middleware=[
-        SummarizationMiddleware(
-            model=validation_model,
-            summary_prompt = SUMMARY_PROMPT,
-            trigger=("tokens", 60000),
-            keep=("messages", 20),  
-        )
-    ]
+
+def _build_agent():
+    from langchain.agents import create_agent
+
+    # Older history is summarized by context_manager before each call
+    return create_agent(
+        model=get_chat_model(), 
+        tools=[get_a_prompt],
+        system_prompt=SYSTEM_PROMPT,
+        middleware=[GatewayMiddleware(llm_gateway, "chat")],
+    )
+
+
+def get_agent():
+    """The journaling agent, created on first use."""
+    return _lazy("agent", _build_agent)
+
+
+# Rolling summary + recent messages per session, in place of resending the whole history
+context_manager = create_context_manager(get_validation_model)
+
+
+# Schema-constrained validation LLM with a bounded retry budget
+llm_validator = StructuredInputValidator(
+    get_validation_model,
+    max_retries=int(os.getenv("INPUT_VALIDATION_MAX_RETRIES", "2")),
+    batch_size=int(os.getenv("INPUT_VALIDATION_BATCH_SIZE", "20"))
 )
 
 
+def _fallback_validation(user_message: str, error: Exception) -> InputValidationResult:
+    """Permissive result used when the validation service itself fails."""
+    print(f"Warning: Input validation failed with error: {error}, allowing message through")
+    # If validation fails, be permissive and allow the message; source marks it for a retry
+    return InputValidationResult(
+        is_valid=len(user_message.strip()) > 0,
+        reason="Validation service unavailable",
+        should_continue=len(user_message.strip()) > 0,
+        source="fallback"
+    )
+
+
 def validate_user_input(user_message: str) -> InputValidationResult:
     """
     Validate user input using LLM to check if it's appropriate for journaling.
     Returns whether the input should be processed.
     
     This function:
-    1. Checks for spam, gibberish, or empty messages
-    2. Ensures input expresses some thought/feeling/reflection
-    3. Uses the validation LLM for intelligent filtering
+    1. Decides obvious cases (empty, spam, gibberish, plain reflections) locally
+    2. Reuses the verdict for text that was validated before
+    3. Uses the validation LLM, with structured output, for the remaining inputs
     """
-  
-    prompt = INPUT_VALIDATION_PROMPT.format(
-        user_message = user_message,
-    )
+    verdict = input_validator.check(user_message)
+    if verdict is not None:
+        return verdict
     
     try:
-        response = validation_model.invoke([HumanMessage(content=prompt)])
-        response_text = response.content if hasattr(response, 'content') else str(response)
-        
-        # Parse JSON response
-        # Try to extract JSON from response
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}') + 1
-        
-        if json_start != -1 and json_end > json_start:
-            json_str = response_text[json_start:json_end]
-            validation_result = json.loads(json_str)
-            
-            return InputValidationResult(
-                is_valid=validation_result.get("is_valid", True),
-                reason=validation_result.get("reason", ""),
-                should_continue=validation_result.get("is_valid", True)
-            )
-        else:
-            # If JSON parsing fails, do basic validation
-            return InputValidationResult(
-                is_valid=len(user_message.strip()) > 0,
-                reason="Basic validation passed",
-                should_continue=len(user_message.strip()) > 0
-            )
-    except Exception as e:
-        print(f"Warning: Input validation failed with error: {e}, allowing message through")
-        # If validation fails, be permissive and allow the message
-        return InputValidationResult(
-            is_valid=len(user_message.strip()) > 0,
-            reason="Validation service unavailable",
-            should_continue=len(user_message.strip()) > 0
-        )
+        result = llm_validator.validate(user_message)
+    except ValidationUnavailable as e:
+        return _fallback_validation(user_message, e)
+    input_validator.remember(user_message, result)
+    return result
+
+
+async def avalidate_user_input(user_message: str) -> InputValidationResult:
+    """Async variant of validate_user_input that does not block the event loop."""
+    verdict = input_validator.check(user_message)
+    if verdict is not None:
+        return verdict
+    
+    try:
+        result = await llm_validator.avalidate(user_message)
+    except ValidationUnavailable as e:
+        return _fallback_validation(user_message, e)
+    input_validator.remember(user_message, result)
+    return result
 
 
 # ==================== Agent State and Graph ====================
@@ -122,7 +180,29 @@ class AgentState(TypedDict):
     validation_reason: str
 
 
-graph_builder = StateGraph(AgentState)
+def _last_human_input(state: AgentState) -> str | None:
+    """Return the content of the last message if it is a human message."""
+    if not state["messages"]:
+        return None
+    
+    last_message = state["messages"][-1]
+    
+    # Only validate human messages
+    if not isinstance(last_message, HumanMessage):
+        return None
+    
+    return last_message.content
+
+
+def _validation_update(state: AgentState, user_input: str, validation_result: InputValidationResult) -> AgentState:
+    """Build the state update produced by the input validation node."""
+    print(f"[Input Validation] Message: {user_input[:50]}... | Valid: {validation_result['should_continue']} | Reason: {validation_result['reason']}")
+    
+    return {
+        **state,
+        "validation_passed": validation_result["should_continue"],
+        "validation_reason": validation_result["reason"]
+    }
 
 
 def input_validation_node(state: AgentState) -> AgentState:
@@ -134,141 +214,520 @@ def input_validation_node(state: AgentState) -> AgentState:
     2. Validates the input using the LLM-based validator
     3. Sets validation state flags for routing
     """
-    if not state["messages"]:
+    user_input = _last_human_input(state)
+    if user_input is None:
         return state
     
-    last_message = state["messages"][-1]
-    
-    # Only validate human messages
-    if not isinstance(last_message, HumanMessage):
+    validation_result = validate_user_input(user_input)
+    return _validation_update(state, user_input, validation_result)
+
+
+async def ainput_validation_node(state: AgentState) -> AgentState:
+    """Async variant of input_validation_node."""
+    user_input = _last_human_input(state)
+    if user_input is None:
         return state
     
-    user_input = last_message.content
-    validation_result = validate_user_input(user_input)
+    validation_result = await avalidate_user_input(user_input)
+    return _validation_update(state, user_input, validation_result)
+
+
+def _token_text(token) -> str:
+    """Extract the text carried by a streamed agent token."""
+    text = ""
+    # Handle different response formats
+    if isinstance(token, dict):
+        # Handle dict response (like {'type': 'text', 'text': '...', 'extras': {...}})
+        if 'text' in token:
+            text += token['text']
+        elif 'content' in token:
+            text += token['content']
+    elif hasattr(token, 'content') and token.content:
+        # Handle content that could be a string or a list
+        if isinstance(token.content, str):
+            text += token.content
+        elif isinstance(token.content, list):
+            for item in token.content:
+                if isinstance(item, dict) and 'text' in item:
+                    text += item['text']
+                else:
+                    text += str(item)
+    elif hasattr(token, 'content_blocks'):
+        for block in token.content_blocks:
+            text += str(block)
+    return text
+
+
+def _validation_error_response(state: AgentState) -> AgentState:
+    """Response returned instead of the agent output when validation failed."""
+    reason = state.get("validation_reason", "Invalid input")
+    error_response = f"I couldn't process that input. {reason}"
+    return {"messages": [AIMessage(content=error_response)]}
+
+
+def _chat_output(full_response: str) -> AgentState:
+    """Wrap the accumulated agent response as a state update."""
+    if full_response:
+        return {"messages": [AIMessage(content=full_response)]}
+    return {"messages": []}
+
+
+def _agent_reply(state: AgentState, config: RunnableConfig) -> str:
+    """Run the agent on the session context and return its reply."""
+    messages = context_manager.prepare(context_key(config), state["messages"])
+    response = get_agent().stream(
+        {"messages": messages},
+        stream_mode="messages",
+    )
     
-    print(f"[Input Validation] Message: {user_input[:50]}... | Valid: {validation_result['should_continue']} | Reason: {validation_result['reason']}")
+    full_response = ""
+    for token, metadata in response:
+        context_manager.record_response(token)
+        full_response += _token_text(token)
+    return full_response
+
+
+async def _aagent_reply(state: AgentState, config: RunnableConfig, on_token: Callable[[str], None]) -> str:
+    """Async variant of _agent_reply; on_token receives each text token as it is generated."""
+    messages = await context_manager.aprepare(context_key(config), state["messages"])
+    response = get_agent().astream(
+        {"messages": messages},
+        stream_mode="messages",
+    )
     
-    return {
-        **state,
-        "validation_passed": validation_result["should_continue"],
-        "validation_reason": validation_result["reason"]
-    }
+    parts = []
+    async for token, metadata in response:
+        context_manager.record_response(token)
+        text = _token_text(token)
+        if text:
+            on_token(text)
+        parts.append(text)
+    return "".join(parts)
 
 
-def chat_node(state: AgentState) -> AgentState:
+def chat_node(state: AgentState, config: RunnableConfig) -> AgentState:
     """
-    Chat node that processes messages through the agent with summarization middleware.
+    Chat node that processes messages through the agent.
     
     This node:
     1. Checks if input validation passed
-    2. Uses the agent with built-in summarization middleware
+    2. Replaces older history with the session's rolling summary
     3. Returns the agent's response or validation error message
     """
     # Check if validation passed
     if not state.get("validation_passed", True):
-        reason = state.get("validation_reason", "Invalid input")
-        error_response = f"I couldn't process that input. {reason}"
-        return {"messages": [AIMessage(content=error_response)]}
+        return _validation_error_response(state)
     
-    # Process through agent with summarization middleware built-in
-    response = agent.stream(
-        {"messages": state["messages"]},
-        stream_mode="messages",
-    )
+    return _chat_output(_agent_reply(state, config))
+
+
+async def achat_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """
+    Async variant of chat_node.
     
-    full_response = ""
-    for token, metadata in response:
-        # Handle different response formats
-        if isinstance(token, dict):
-            # Handle dict response (like {'type': 'text', 'text': '...', 'extras': {...}})
-            if 'text' in token:
-                full_response += token['text']
-            elif 'content' in token:
-                full_response += token['content']
-        elif hasattr(token, 'content') and token.content:
-            # Handle content that could be a string or a list
-            if isinstance(token.content, str):
-                full_response += token.content
-            elif isinstance(token.content, list):
-                for item in token.content:
-                    if isinstance(item, dict) and 'text' in item:
-                        full_response += item['text']
-                    else:
-                        full_response += str(item)
-        elif hasattr(token, 'content_blocks'):
-            for block in token.content_blocks:
-                full_response += str(block)
+    Streams the agent with astream so that waiting on Gemini yields to the
+    event loop instead of blocking every other request on the worker.
+    """
+    if not state.get("validation_passed", True):
+        return _validation_error_response(state)
     
-    if full_response:
-        return {"messages": [AIMessage(content=full_response)]}
-    return {"messages": []}
+    # Forward each token to graph.astream(stream_mode="custom") consumers;
+    # this is a no-op when the graph is run with ainvoke
+    writer = get_stream_writer()
+    
+    full_response = await _aagent_reply(state, config, lambda text: writer({"token": text}))
+    return _chat_output(full_response)
+
+
+# ==================== Speculative Validation ====================
+# Validation and generation start together; the reply is released only once
+# validation passes, and generation is cancelled as soon as it fails. The
+# turn then takes max(validation, generation) instead of their sum.
+# Only the async path speculates: a sync model stream cannot be cancelled
+# mid-call, so the sync node validates first.
+
+_speculation_lock = threading.Lock()
+_speculation_stats = {"turns": 0, "passed": 0, "rejected": 0, "generations_cancelled": 0}
+
+
+def _count_speculation(passed: bool, cancelled: bool) -> None:
+    with _speculation_lock:
+        _speculation_stats["turns"] += 1
+        _speculation_stats["passed" if passed else "rejected"] += 1
+        if cancelled:
+            _speculation_stats["generations_cancelled"] += 1
 
 
-def should_continue_to_chat(state: AgentState) -> str:
+def _speculative_result(state: AgentState, user_input: str, validation_result: InputValidationResult, full_response: str) -> AgentState:
+    """State update of a speculative turn: the validation flags plus the reply or the error."""
+    update = _validation_update(state, user_input, validation_result)
+    output = _chat_output(full_response) if update["validation_passed"] else _validation_error_response(update)
+    return {
+        "validation_passed": update["validation_passed"],
+        "validation_reason": update["validation_reason"],
+        **output
+    }
+
+
+def speculative_chat_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """
+    Sync counterpart of aspeculative_chat_node (CLI).
+    
+    Validates before generating, as in sequential mode, so a rejected
+    message costs only the validation call.
+    """
+    user_input = _last_human_input(state)
+    if user_input is None:
+        return chat_node(state, config)
+    
+    validation_result = validate_user_input(user_input)
+    passed = validation_result["should_continue"]
+    full_response = _agent_reply(state, config) if passed else ""
+    _count_speculation(passed, cancelled=False)
+    return _speculative_result(state, user_input, validation_result, full_response)
+
+
+async def aspeculative_chat_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """
+    Async variant of speculative_chat_node.
+    
+    Streamed tokens are held back until validation passes, then flushed and
+    forwarded live, so a rejected message never shows partial output.
+    """
+    user_input = _last_human_input(state)
+    if user_input is None:
+        return await achat_node(state, config)
+    
+    writer = get_stream_writer()
+    held = []
+    released = False
+    
+    def on_token(text: str) -> None:
+        if released:
+            writer({"token": text})
+        else:
+            held.append(text)
+    
+    generation = asyncio.create_task(_aagent_reply(state, config, on_token))
+    try:
+        validation_result = await avalidate_user_input(user_input)
+    except BaseException:
+        generation.cancel()
+        raise
+    
+    if not validation_result["should_continue"]:
+        cancelled = generation.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await generation
+        _count_speculation(False, cancelled)
+        return _speculative_result(state, user_input, validation_result, "")
+    
+    released = True
+    for text in held:
+        writer({"token": text})
+    full_response = await generation
+    _count_speculation(True, False)
+    return _speculative_result(state, user_input, validation_result, full_response)
+
+
+def speculation_stats() -> Dict:
+    """Counters for speculative validation."""
+    with _speculation_lock:
+        return {"mode": INPUT_VALIDATION_MODE, **_speculation_stats}
+
+
+def create_graph_builder(validation_mode: str = INPUT_VALIDATION_MODE) -> StateGraph:
     """
-    Conditional routing function: proceed to chat only if validation passed.
+    Build the chat graph for an input validation mode.
+    
+    Args:
+        validation_mode: "off" (chat only), "sequential" (validate, then
+            chat) or "speculative" (validate while the agent generates)
     """
-    if state.get("validation_passed", True):
-        return "chat"
+    if validation_mode not in ("off", "sequential", "speculative"):
+        raise ValueError(f"Unknown INPUT_VALIDATION_MODE: {validation_mode}")
+    
+    builder = StateGraph(AgentState)
+    
+    # Each node carries a sync and an async implementation so the same graph
+    # serves graph.invoke (CLI) and graph.ainvoke (API)
+    if validation_mode == "speculative":
+        builder.add_node("chat", RunnableLambda(speculative_chat_node, afunc=aspeculative_chat_node))
+    else:
+        builder.add_node("chat", RunnableLambda(chat_node, afunc=achat_node))
+    
+    if validation_mode == "sequential":
+        # chat_node answers with the validation error itself, so always continue to it
+        builder.add_node("input_validation", RunnableLambda(input_validation_node, afunc=ainput_validation_node))
+        builder.add_edge(START, "input_validation")
+        builder.add_edge("input_validation", "chat")
+    else:
+        builder.add_edge(START, "chat")
+    builder.add_edge("chat", END)
+    return builder
+
+
+graph_builder = create_graph_builder()
+
+
+def get_graph():
+    """The compiled graph without a checkpointer, compiled on first use."""
+    return _lazy("graph", graph_builder.compile)
+
+
+# Store conversation state per (user_id, session_id), bounded and rehydrated from the DB on a miss
+conversation_store = create_conversation_store()
+
+# Optional persistent state shared across workers (CONVERSATION_CHECKPOINTER=sqlite|postgres).
+# When set, the API paths run checkpointed_graph instead of using the in-process store.
+checkpointer_backend = create_checkpointer_backend()
+checkpointed_graph = None
+_checkpointer_setup_lock = asyncio.Lock()
+
+
+async def setup_conversation_backend() -> None:
+    """Prepare the persistent conversation backend, if configured (call on startup)."""
+    global checkpointed_graph
+    if checkpointer_backend is None or checkpointed_graph is not None:
+        return
+    async with _checkpointer_setup_lock:
+        if checkpointed_graph is None:
+            await checkpointer_backend.setup()
+            checkpointed_graph = graph_builder.compile(checkpointer=checkpointer_backend.saver)
+
+
+async def close_conversation_backend() -> None:
+    """Release the persistent conversation backend, if configured (call on shutdown)."""
+    global checkpointed_graph
+    if checkpointer_backend is not None:
+        await checkpointer_backend.close()
+        checkpointed_graph = None
+
+
+async def adelete_conversation(user_id: Optional[int], session_id: str) -> None:
+    """Forget the stored conversation state of a session."""
+    if checkpointer_backend is not None:
+        await setup_conversation_backend()
+        thread_id = CheckpointerBackend.thread_config(user_id, session_id)["configurable"]["thread_id"]
+        await checkpointer_backend.saver.adelete_thread(thread_id)
     else:
-        return "end"
+        conversation_store.delete((user_id, session_id))
+    await context_manager.adelete((user_id, session_id))
 
 
-# Add nodes to the graph
-graph_builder.add_node("input_validation", input_validation_node)
-graph_builder.add_node("chat", chat_node)
+def conversation_stats() -> Dict:
+    """Describe the active conversation state backend."""
+    if checkpointer_backend is not None:
+        return {
+            "backend": "checkpointer",
+            "kind": checkpointer_backend.kind,
+            "durability": checkpointer_backend.durability
+        }
+    return conversation_store.stats()
 
-# Add edges with validation check
-# graph_builder.add_edge(START, "input_validation")
-# graph_builder.add_conditional_edges(
-#     "input_validation",
-#     should_continue_to_chat,
-#     {"chat": "chat", "end": END}
-# )
-graph_builder.add_edge(START, "chat")
-graph_builder.add_edge("chat", END)
 
-# Compile the graph
-graph = graph_builder.compile()
+def context_stats() -> Dict:
+    """Per-turn input token accounting and rolling summary counters."""
+    return context_manager.stats()
 
-# Store conversation state per session
-conversation_states = {}
+
+def _session_state(user_id: Optional[int], session_id: str, user_message: str) -> AgentState:
+    """Get (or rehydrate) the session state and append the new user message."""
+    conversation_state = conversation_store.get_or_load((user_id, session_id))
+    
+    # Add user message
+    conversation_state["messages"].append(HumanMessage(content=user_message))
+    return conversation_state
+
+
+async def _asession_state(user_id: Optional[int], session_id: str, user_message: str) -> AgentState:
+    """Async variant of _session_state."""
+    conversation_state = await conversation_store.aget_or_load((user_id, session_id))
+    conversation_state["messages"].append(HumanMessage(content=user_message))
+    return conversation_state
+
+
+async def _acheckpointed_input(user_id: Optional[int], session_id: str, user_message: str) -> Tuple[AgentState, Dict]:
+    """
+    Build the graph input and run options for a checkpointed turn.
+    
+    Only the new message is sent; the checkpointer supplies the history.
+    Threads without a checkpoint yet are seeded from journal_entries.
+    """
+    await setup_conversation_backend()
+    config = CheckpointerBackend.thread_config(user_id, session_id)
+    # An explicit id lets _adiscard_checkpointed_message remove it again
+    messages = [HumanMessage(content=user_message, id=str(uuid.uuid4()))]
+    
+    snapshot = await checkpointed_graph.aget_state(config)
+    if not snapshot.values:
+        history = await asyncio.to_thread(load_history_from_db, user_id, session_id)
+        messages = history + messages
+    
+    graph_input = AgentState(messages=messages, validation_passed=True, validation_reason="")
+    return graph_input, {"config": config, "durability": checkpointer_backend.durability}
+
+
+def _discard_user_message(conversation_state: AgentState, message: BaseMessage) -> None:
+    """
+    Take back the user message of a turn that produced no stored reply.
+    
+    The LLM could not serve the turn (the API answers with a 503) or the
+    client disconnected mid-stream. Either way the client sends the message
+    again, which would otherwise store it (and show it to the model) twice.
+    """
+    messages = conversation_state["messages"]
+    if messages and messages[-1] is message:
+        messages.pop()
+
+
+async def _adiscard_checkpointed_message(run_options: Dict, message: BaseMessage) -> None:
+    """Checkpointed variant of _discard_user_message."""
+    config = run_options["config"]
+    snapshot = await checkpointed_graph.aget_state(config)
+    if any(stored.id == message.id for stored in snapshot.values.get("messages", [])):
+        await checkpointed_graph.aupdate_state(config, {"messages": [RemoveMessage(id=message.id)]}, as_node="chat")
+
+
+def _new_messages(conversation_state: AgentState, output: AgentState) -> list[BaseMessage]:
+    """Messages the graph added on top of the input state."""
+    # The graph returns the full message list, input history included
+    return output["messages"][len(conversation_state["messages"]):]
+
+
+def _finish_turn(user_id: Optional[int], session_id: str, conversation_state: AgentState, new_messages: list[BaseMessage]) -> str:
+    """Record the turn's new messages in the session state and return the AI reply."""
+    conversation_state["messages"].extend(new_messages)
+    # Re-measure the grown state so the store can enforce its memory budget
+    conversation_store.put((user_id, session_id), conversation_state)
+    return _reply_text(new_messages)
+
+
+def _reply_text(new_messages: list[BaseMessage]) -> str:
+    """Extract the AI reply from a turn's new messages."""
+    ai_response = None
+    if new_messages and isinstance(new_messages[-1], AIMessage):
+        last_msg = new_messages[-1]
+        ai_response = last_msg.content if hasattr(last_msg, 'content') else str(last_msg)
+    
+    if not ai_response:
+        print("[ERROR] No response from agent - output:", new_messages)
+        raise ValueError("No response from agent")
+    
+    return ai_response
 
 
 @traceable(name="agent")
-def process_chat(user_message: str, session_id: str) -> Tuple[str, Dict]:
+def process_chat(user_message: str, session_id: str, user_id: Optional[int] = None) -> Tuple[str, Dict]:
     """Process a chat message through the agent with LangSmith tracing."""
     try:
-        # Initialize or get existing conversation state
-        if session_id not in conversation_states:
-            conversation_states[session_id] = AgentState(
-                messages=[],
-                validation_passed=True,
-                validation_reason=""
-            )
-        
-        conversation_state = conversation_states[session_id]
-        
-        # Add user message
-        conversation_state["messages"].append(HumanMessage(content=user_message))
+        conversation_state = _session_state(user_id, session_id, user_message)
+        user_turn = conversation_state["messages"][-1]
         
         # Get agent response (includes validation and chat nodes)
-        output = graph.invoke(conversation_state)
-        conversation_state["messages"].extend(output["messages"])
+        try:
+            output = get_graph().invoke(conversation_state, config=context_config(user_id, session_id))
+        except LLMUnavailable:
+            _discard_user_message(conversation_state, user_turn)
+            raise
+        ai_response = _finish_turn(user_id, session_id, conversation_state, _new_messages(conversation_state, output))
         
-        # Extract the last AI message
-        ai_response = None
-        if output["messages"]:
-            last_msg = output["messages"][-1]
-            ai_response = last_msg.content if hasattr(last_msg, 'content') else str(last_msg)
+        return ai_response, {"session_id": session_id}
+    except Exception as e:
+        print(f"[ERROR] process_chat failed: {type(e).__name__}: {str(e)}")
+        import traceback
+        print(traceback.format_exc())
+        raise
+
+
+@traceable(name="agent")
+async def aprocess_chat(user_message: str, session_id: str, user_id: Optional[int] = None) -> Tuple[str, Dict]:
+    """
+    Async variant of process_chat used by the API.
+    
+    Runs the graph with ainvoke so the event loop keeps serving other
+    conversations while this one waits on the LLM.
+    """
+    try:
+        if checkpointer_backend is not None:
+            graph_input, run_options = await _acheckpointed_input(user_id, session_id, user_message)
+            try:
+                output = await checkpointed_graph.ainvoke(graph_input, **run_options)
+            except LLMUnavailable:
+                await _adiscard_checkpointed_message(run_options, graph_input["messages"][-1])
+                raise
+            # The checkpointed output holds the whole thread; the reply is last
+            ai_response = _reply_text(output["messages"][-1:])
+            return ai_response, {"session_id": session_id}
+        
+        conversation_state = await _asession_state(user_id, session_id, user_message)
+        user_turn = conversation_state["messages"][-1]
         
-        if not ai_response:
-            print("[ERROR] No response from agent - output:", output)
-            raise ValueError("No response from agent")
+        try:
+            output = await get_graph().ainvoke(conversation_state, config=context_config(user_id, session_id))
+        except LLMUnavailable:
+            _discard_user_message(conversation_state, user_turn)
+            raise
+        ai_response = _finish_turn(user_id, session_id, conversation_state, _new_messages(conversation_state, output))
         
         return ai_response, {"session_id": session_id}
     except Exception as e:
-        print(f"[ERROR] process_chat failed: {type(e).__name__}: {str(e)}")
+        print(f"[ERROR] aprocess_chat failed: {type(e).__name__}: {str(e)}")
         import traceback
         print(traceback.format_exc())
         raise
+
+
+async def astream_chat(user_message: str, session_id: str, user_id: Optional[int] = None) -> AsyncIterator[Dict]:
+    """
+    Stream a chat turn token by token.
+    
+    Yields {"token": str} events as the agent generates them, followed by a
+    single {"response": str} event carrying the complete reply once the graph
+    has finished and the session state has been updated.
+    """
+    if checkpointer_backend is not None:
+        conversation_state = None
+        graph_input, run_options = await _acheckpointed_input(user_id, session_id, user_message)
+        user_turn = graph_input["messages"][-1]
+        stream = checkpointed_graph.astream(graph_input, stream_mode=["custom", "updates"], **run_options)
+    else:
+        conversation_state = await _asession_state(user_id, session_id, user_message)
+        user_turn = conversation_state["messages"][-1]
+        stream = get_graph().astream(
+            conversation_state,
+            stream_mode=["custom", "updates"],
+            config=context_config(user_id, session_id)
+        )
+    
+    new_messages = []
+    streamed = False
+    try:
+        async for mode, chunk in stream:
+            if mode == "custom":
+                streamed = True
+                yield chunk
+            elif mode == "updates":
+                for update in chunk.values():
+                    if update and update.get("messages"):
+                        new_messages.extend(update["messages"])
+    except (LLMUnavailable, GeneratorExit, asyncio.CancelledError):
+        # The LLM gave up or the client disconnected mid-turn; no reply will
+        # be stored, so the user message must not stay behind without one
+        await stream.aclose()
+        if conversation_state is None:
+            await _adiscard_checkpointed_message(run_options, user_turn)
+        else:
+            _discard_user_message(conversation_state, user_turn)
+        raise
+    
+    if conversation_state is None:
+        ai_response = _reply_text(new_messages)
+    else:
+        ai_response = _finish_turn(user_id, session_id, conversation_state, new_messages)
+    
+    # Validation failures produce a reply without going through the agent
+    if not streamed:
+        yield {"token": ai_response}
+    
+    yield {"response": ai_response}
@@ -0,0 +1,221 @@
+"""Cache of Trace Me analyses keyed by a fingerprint of the analyzed entries."""
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import AnalysisResult, JournalEntry, SessionLocal
+from trace_analysis import get_analysis_summary
+
+
+def entry_set_fingerprint(db: Session, user_id: int, days: int) -> tuple[int, str]:
+    """
+    Fingerprint the entries an analysis of the last `days` days would read.
+
+    Adding or deleting an entry changes the count or the newest id, and
+    entries aging out of the window change the count, so an unchanged
+    fingerprint means the analysis input is unchanged.
+
+    Returns:
+        Tuple of (entry count, fingerprint string)
+    """
+    start_date = datetime.utcnow() - timedelta(days=days)
+    count, max_id, max_created_at = db.query(
+        func.count(JournalEntry.id),
+        func.max(JournalEntry.id),
+        func.max(JournalEntry.created_at)
+    ).filter(
+        JournalEntry.user_id == user_id,
+        JournalEntry.created_at >= start_date
+    ).one()
+
+    newest = max_created_at.isoformat() if max_created_at else ""
+    return count, f"{count}:{max_id or 0}:{newest}"
+
+
+class AnalysisCache:
+    """
+    Two-level (memory LRU + analysis_results table) cache of analyses.
+
+    A request whose fingerprint matches the cached one is answered without
+    calling the LLM. If the entries changed but the cached analysis is younger
+    than max_stale_seconds, it is served immediately (marked "stale") while a
+    background worker recomputes it; otherwise the analysis is computed inline.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        max_stale_seconds: float = 86400,
+        refresh_workers: int = 2,
+        compute: Callable[..., dict] = get_analysis_summary
+    ):
+        self.max_size = max_size
+        self.max_stale_seconds = max_stale_seconds
+        self.compute = compute
+
+        # (user_id, days) -> (fingerprint, result, computed_at)
+        self._memory: OrderedDict = OrderedDict()
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="analysis-refresh")
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def _remember(self, key: tuple, fingerprint: str, result: dict, computed_at: datetime) -> None:
+        with self._lock:
+            self._memory[key] = (fingerprint, result, computed_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, db: Session, key: tuple) -> Optional[tuple]:
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                return cached
+
+        user_id, days = key
+        row = db.query(AnalysisResult).filter(
+            AnalysisResult.user_id == user_id,
+            AnalysisResult.days == days
+        ).first()
+        if row is None:
+            return None
+
+        cached = (row.fingerprint, json.loads(row.result), row.computed_at)
+        self._remember(key, *cached)
+        return cached
+
+    def _store(self, db: Session, key: tuple, fingerprint: str, result: dict) -> None:
+        user_id, days = key
+        computed_at = datetime.utcnow()
+        values = {"fingerprint": fingerprint, "result": json.dumps(result), "computed_at": computed_at}
+
+        updated = db.query(AnalysisResult).filter(
+            AnalysisResult.user_id == user_id,
+            AnalysisResult.days == days
+        ).update(values, synchronize_session=False)
+        if not updated:
+            db.add(AnalysisResult(user_id=user_id, days=days, **values))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker stored the same window first; keep theirs and
+            # cache it, so memory matches the table
+            db.rollback()
+            with self._lock:
+                self._memory.pop(key, None)
+            self._lookup(db, key)
+            return
+
+        self._remember(key, fingerprint, result, computed_at)
+
+    def _compute(self, db: Session, key: tuple) -> dict:
+        user_id, days = key
+        # Fingerprint before computing, so entries written meanwhile trigger a refresh next time
+        _, fingerprint = entry_set_fingerprint(db, user_id, days)
+        result = self.compute(user_id=user_id, days=days, db=db)
+        if result.get("success"):
+            self._store(db, key, fingerprint, result)
+        return result
+
+    def _refresh(self, key: tuple) -> None:
+        db = SessionLocal()
+        try:
+            self._compute(db, key)
+            with self._lock:
+                self.refreshes += 1
+        except Exception as e:
+            with self._lock:
+                self.refresh_errors += 1
+            print(f"Analysis refresh failed for {key}: {str(e)}")
+        finally:
+            db.close()
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _schedule_refresh(self, key: tuple) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._executor.submit(self._refresh, key)
+
+    def get(self, user_id: int, days: int, allow_stale: bool = True) -> dict:
+        """
+        Return the analysis for a user's window, computing it only when needed.
+
+        Blocking (database and LLM calls); run it in the threadpool from
+        async code.
+
+        Args:
+            user_id: The user's ID
+            days: Number of days to analyze
+            allow_stale: Serve an outdated result while refreshing it in the
+                background; if False, outdated results are recomputed inline
+
+        Returns:
+            The analysis summary with a "cache" field: "hit", "stale" or "miss"
+        """
+        key = (user_id, days)
+        db = SessionLocal()
+        try:
+            count, fingerprint = entry_set_fingerprint(db, user_id, days)
+            cached = self._lookup(db, key) if count else None
+
+            if cached is not None:
+                cached_fingerprint, result, computed_at = cached
+                if cached_fingerprint == fingerprint:
+                    with self._lock:
+                        self.hits += 1
+                    return {**result, "cache": "hit"}
+                if allow_stale and (datetime.utcnow() - computed_at).total_seconds() <= self.max_stale_seconds:
+                    with self._lock:
+                        self.stale_served += 1
+                    self._schedule_refresh(key)
+                    return {**result, "cache": "stale"}
+
+            with self._lock:
+                self.misses += 1
+            return {**self._compute(db, key), "cache": "miss"}
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._memory),
+                "max_size": self.max_size,
+                "max_stale_seconds": self.max_stale_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_served": self.stale_served,
+                "refreshing": len(self._refreshing),
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors
+            }
+
+
+analysis_cache = AnalysisCache(
+    max_size=int(os.getenv("ANALYSIS_CACHE_SIZE", "1024")),
+    max_stale_seconds=float(os.getenv("ANALYSIS_CACHE_MAX_STALE_SECONDS", "86400")),
+    refresh_workers=int(os.getenv("ANALYSIS_REFRESH_WORKERS", "2"))
+)
+
+
+def get_cached_analysis(user_id: int, days: int = 30, allow_stale: bool = True) -> dict:
+    """Analysis summary for the user's last `days` days, served from the cache when possible."""
+    return analysis_cache.get(user_id, days, allow_stale=allow_stale)
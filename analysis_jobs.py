@@ -0,0 +1,165 @@
+"""In-process background jobs for Trace Me analysis."""
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Optional
+
+from analysis_cache import get_cached_analysis
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+@dataclass
+class AnalysisJob:
+    """One requested analysis of a user's window."""
+    id: str
+    user_id: int
+    days: int
+    status: str = QUEUED
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # time.monotonic() at finish; retention is measured on this clock, not on the naive UTC timestamps
+    finished_monotonic: Optional[float] = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "days": self.days,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class AnalysisJobQueue:
+    """
+    Local worker pool that runs analyses outside the request cycle.
+
+    Submitting while an identical job (same user and window) is queued or
+    running returns that job instead of starting another. Finished jobs are
+    kept for retention_seconds so clients can poll for the result, and at
+    most max_jobs are retained.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[int, int], dict],
+        workers: int = 2,
+        retention_seconds: float = 3600,
+        max_jobs: int = 10000
+    ):
+        self.run = run
+        self.retention_seconds = retention_seconds
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis-job")
+
+        self._jobs: OrderedDict = OrderedDict()  # job_id -> AnalysisJob
+        self._in_flight: dict = {}  # (user_id, days) -> job_id
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.deduplicated = 0
+
+    def submit(self, user_id: int, days: int) -> tuple[AnalysisJob, bool]:
+        """
+        Queue an analysis, or join the identical one already in flight.
+
+        Returns:
+            Tuple of (job, created) where created is False for a duplicate
+        """
+        key = (user_id, days)
+        with self._lock:
+            self._prune()
+            job_id = self._in_flight.get(key)
+            if job_id is not None:
+                self.deduplicated += 1
+                return self._jobs[job_id], False
+
+            job = AnalysisJob(id=uuid.uuid4().hex, user_id=user_id, days=days)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job.id
+            self.submitted += 1
+
+        self._executor.submit(self._execute, job)
+        return job, True
+
+    def get(self, job_id: str, user_id: int) -> Optional[AnalysisJob]:
+        """Return the job if it exists and belongs to user_id."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def _execute(self, job: AnalysisJob) -> None:
+        job.status = RUNNING
+        job.started_at = datetime.utcnow()
+        try:
+            job.result = self.run(job.user_id, job.days)
+            job.status = SUCCEEDED
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {str(e)}"
+            job.status = FAILED
+            print(f"Analysis job {job.id} failed: {job.error}")
+            print(traceback.format_exc())
+        finally:
+            job.finished_at = datetime.utcnow()
+            job.finished_monotonic = time.monotonic()
+            with self._lock:
+                self._in_flight.pop((job.user_id, job.days), None)
+
+    def _prune(self) -> None:
+        """Forget finished jobs past retention, and the oldest finished ones beyond max_jobs."""
+        cutoff = time.monotonic() - self.retention_seconds
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            expired = job.finished_monotonic is not None and job.finished_monotonic < cutoff
+            overflow = job.done and len(self._jobs) > self.max_jobs
+            if expired or overflow:
+                del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+            for job in self._jobs.values():
+                statuses[job.status] += 1
+            return {
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "jobs": statuses
+            }
+
+    def shutdown(self) -> None:
+        """Stop accepting work and drop queued jobs; running jobs finish."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_analysis(user_id: int, days: int) -> dict:
+    # A job exists to produce an up-to-date result, so never hand back a stale one
+    return get_cached_analysis(user_id, days, allow_stale=False)
+
+
+analysis_jobs = AnalysisJobQueue(
+    run=_run_analysis,
+    workers=int(os.getenv("ANALYSIS_JOB_WORKERS", "2")),
+    retention_seconds=float(os.getenv("ANALYSIS_JOB_RETENTION_SECONDS", "3600"))
+)
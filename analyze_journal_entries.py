@@ -1,99 +1,148 @@
 """Script to analyze and label all journal entries with sentiment."""
-import json
-import os
-from datetime import datetime
-import tensorflow as tf
+import argparse
+import time
 from sqlalchemy.orm import Session
 from database import SessionLocal, JournalEntry, init_db
+from sentiment_stats import (
+    get_sentiment_distribution,
+    rebuild_sentiment_aggregates,
+    store_sentiment_labels,
+)
+from sentiment_service import get_sentiment_analyzer
 
-# Load the trained model
-model_path = './sentiment_model_tf/sentiment_model.keras'
-if not os.path.exists(model_path):
-    raise FileNotFoundError(f"Trained model not found at {model_path}. Please train the model first.")
 
-print("Loading trained model...")
-model = tf.keras.models.load_model(model_path)
-print("Model loaded successfully!")
+def analyze_texts(texts: list[str]) -> list[dict]:
+    """Analyze a batch of texts with a single vectorized model call."""
+    analyzer = get_sentiment_analyzer()
+    return [analyzer.label(scores) for scores in analyzer.analyze_batch(texts)]
 
-# Load sentiment groups
-with open('./sentiment_groups.json', 'r') as f:
-    sentiment_groups = json.load(f)
-
-group_names = list(sentiment_groups.keys())
-print(f"Sentiment groups: {group_names}")
 
 def analyze_text(text: str) -> dict:
     """Analyze text and return sentiment predictions."""
-    predictions = model.predict(tf.constant([text], dtype=tf.string), verbose=0)[0]
+    return analyze_texts([text])[0]
+
+
+def _label_batch(rows) -> list[tuple]:
+    """Predict a page of entry rows and pair each row with its label."""
+    try:
+        results = analyze_texts([row.user_message for row in rows])
+        return list(zip(rows, results))
+    except Exception as e:
+        # Isolate the bad row(s) instead of losing the whole batch
+        print(f"Batch prediction failed ({str(e)}), retrying entries individually...")
+        pairs = []
+        for row in rows:
+            try:
+                pairs.append((row, analyze_text(row.user_message)))
+            except Exception as entry_error:
+                print(f"Error analyzing entry {row.id}: {str(entry_error)}")
+        return pairs
+
+
+def label_unlabelled_entries(
+    db: Session,
+    batch_size: int = 256,
+    start_after_id: int = 0,
+    limit: int | None = None
+) -> dict:
+    """
+    Label unanalyzed entries in batches, committing after every batch.
+    
+    Pages through rows with sentiment_analyzed_at IS NULL using keyset
+    pagination on id, runs one vectorized predict per page and bulk-updates
+    the page, together with its sentiment aggregates, in its own
+    transaction. Committed pages are no longer NULL, so
+    re-running after a crash resumes where the last commit left off.
     
-    # Get all sentiments above threshold
-    threshold = 0.5
-    active_sentiments = []
-    sentiment_scores = {}
+    Args:
+        db: Database session
+        batch_size: Entries per predict call and per commit
+        start_after_id: Only consider entries with a larger id
+        limit: Stop after this many entries (None for all)
     
-    for i, group in enumerate(group_names):
-        score = float(predictions[i])
-        sentiment_scores[group] = score
-        if score > threshold:
-            active_sentiments.append(group)
+    Returns:
+        Dictionary with processed/labelled counts, last id and throughput
+    """
+    last_id = start_after_id
+    processed = 0
+    labelled = 0
+    start = time.perf_counter()
     
-    # Get primary sentiment (highest score)
-    primary_sentiment = group_names[predictions.argmax()] if len(predictions) > 0 else None
+    while limit is None or processed < limit:
+        page_size = batch_size if limit is None else min(batch_size, limit - processed)
+        rows = db.query(
+            JournalEntry.id,
+            JournalEntry.user_id,
+            JournalEntry.session_id,
+            JournalEntry.created_at,
+            JournalEntry.user_message
+        ).filter(
+            JournalEntry.sentiment_analyzed_at.is_(None),
+            JournalEntry.id > last_id
+        ).order_by(JournalEntry.id).limit(page_size).all()
+        
+        if not rows:
+            break
+        
+        pairs = _label_batch(rows)
+        # Labels and session/day/week aggregates in the same transaction;
+        # entries labelled meanwhile by the API are skipped
+        page_labelled = store_sentiment_labels(db, pairs) if pairs else 0
+        db.commit()
+        
+        last_id = rows[-1].id
+        processed += len(rows)
+        labelled += page_labelled
+        
+        elapsed = time.perf_counter() - start
+        print(f"Processed {processed} entries (last id {last_id}) - {processed / elapsed:.1f} entries/sec")
     
+    elapsed = time.perf_counter() - start
     return {
-        "labels": active_sentiments,
-        "scores": sentiment_scores,
-        "primary": primary_sentiment
+        "processed": processed,
+        "labelled": labelled,
+        "last_id": last_id,
+        "seconds": elapsed,
+        "entries_per_second": processed / elapsed if elapsed > 0 else 0.0
     }
 
-def analyze_all_entries():
+
+def analyze_all_entries(batch_size: int = 256, start_after_id: int = 0, limit: int | None = None):
     """Analyze all journal entries and update the database."""
     db: Session = SessionLocal()
     
     try:
-        # Get all entries without sentiment analysis
-        entries = db.query(JournalEntry).filter(
-            JournalEntry.sentiment_analyzed_at.is_(None)
-        ).all()
+        pending = db.query(JournalEntry).filter(
+            JournalEntry.sentiment_analyzed_at.is_(None),
+            JournalEntry.id > start_after_id
+        ).count()
         
-        if not entries:
+        if not pending:
             print("No entries to analyze.")
             return
         
-        print(f"\nAnalyzing {len(entries)} journal entries...")
+        # Load the trained model only when there is something to label
+        # (shared loader with the API's sentiment service)
+        print("Loading trained model...")
+        print(f"Sentiment groups: {get_sentiment_analyzer().group_names}")
         
-        for i, entry in enumerate(entries, 1):
-            try:
-                # Analyze the entry
-                result = analyze_text(entry.user_message)
-                
-                # Update the entry
-                entry.sentiment_labels = json.dumps(result["labels"])
-                entry.sentiment_scores = json.dumps(result["scores"])
-                entry.primary_sentiment = result["primary"]
-                entry.sentiment_analyzed_at = datetime.utcnow()
-                
-                if i % 10 == 0:
-                    print(f"Processed {i}/{len(entries)} entries...")
-                    
-            except Exception as e:
-                print(f"Error analyzing entry {entry.id}: {str(e)}")
-                continue
+        print(f"\nAnalyzing {pending} journal entries in batches of {batch_size}...")
         
-        # Commit all changes
-        db.commit()
-        print(f"\n✓ Successfully analyzed {len(entries)} entries!")
+        stats = label_unlabelled_entries(db, batch_size=batch_size, start_after_id=start_after_id, limit=limit)
+        print(
+            f"\n✓ Successfully analyzed {stats['labelled']}/{stats['processed']} entries "
+            f"in {stats['seconds']:.1f}s ({stats['entries_per_second']:.1f} entries/sec)"
+        )
         
         # Show some statistics
         print("\n" + "="*60)
         print("SENTIMENT DISTRIBUTION:")
         print("="*60)
         
-        for group in group_names:
-            count = db.query(JournalEntry).filter(
-                JournalEntry.primary_sentiment == group
-            ).count()
-            print(f"{group:15}: {count} entries")
+        distribution = get_sentiment_distribution(db)
+        for group, stats in distribution["groups"].items():
+            avg_score = f"avg score {stats['average_score']:.2f}" if stats["average_score"] is not None else ""
+            print(f"{group:15}: {stats['count']} entries {avg_score}")
             
     except Exception as e:
         db.rollback()
@@ -103,7 +152,23 @@ def analyze_all_entries():
         db.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Label journal entries with sentiment.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Entries per predict call and per commit")
+    parser.add_argument("--start-after-id", type=int, default=0, help="Skip entries with id <= this value")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of entries to process")
+    parser.add_argument("--rebuild-aggregates", action="store_true", help="Recompute session/day/week aggregates from labelled entries")
+    args = parser.parse_args()
+    
     print("="*60)
     print("JOURNAL SENTIMENT ANALYSIS")
     print("="*60)
-    analyze_all_entries()
+    init_db()
+    if args.rebuild_aggregates:
+        db = SessionLocal()
+        try:
+            count = rebuild_sentiment_aggregates(db)
+            print(f"✓ Rebuilt sentiment aggregates from {count} labelled entries")
+        finally:
+            db.close()
+    else:
+        analyze_all_entries(batch_size=args.batch_size, start_after_id=args.start_after_id, limit=args.limit)
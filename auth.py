@@ -1,12 +1,17 @@
 """Authentication and authorization utilities."""
 import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import HTTPException, Depends, status, Header
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import jwt
 
-from database import User, get_db
+from database import User, get_async_db
 from models import UserResponse, Token
 
 # Configuration
@@ -15,6 +20,110 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
 
 
+# ==================== User Cache ====================
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """Detached snapshot of the user fields request handlers read."""
+    id: int
+    username: str
+    email: str
+    full_name: str
+    language: str
+    created_at: datetime
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "AuthenticatedUser":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            full_name=user.full_name,
+            language=user.language,
+            created_at=user.created_at,
+            is_active=user.is_active
+        )
+
+
+class UserCache:
+    """
+    Size-bounded, short-TTL cache of user snapshots keyed by user id.
+
+    Lets authenticated requests skip the user lookup after the first one.
+    Changes made through the ORM in this process invalidate the entry
+    immediately; changes from other processes show up within the TTL.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 30):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # user_id -> (snapshot, expires_at)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> Optional[AuthenticatedUser]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user: AuthenticatedUser) -> None:
+        if self.ttl_seconds <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[user.id] = (user, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
+
+
+user_cache = UserCache(
+    max_size=int(os.getenv("USER_CACHE_MAX_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target: User) -> None:
+    """Drop the cached snapshot whenever a user row is changed through the ORM."""
+    user_cache.invalidate(target.id)
+
+
+def user_cache_stats() -> dict:
+    """Hit/miss counters for the authentication user cache."""
+    return user_cache.stats()
+
+
 def create_access_token(user_id: int) -> str:
     """Create JWT access token."""
     expires = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
@@ -23,8 +132,8 @@ def create_access_token(user_id: int) -> str:
     return token
 
 
-def verify_token(token: str, db: Session) -> User:
-    """Verify JWT token and return user."""
+async def verify_token(token: str, db: AsyncSession) -> AuthenticatedUser:
+    """Verify JWT token and return the user, from the cache when possible."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: int = payload.get("user_id")
@@ -35,16 +144,23 @@ def verify_token(token: str, db: Session) -> User:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user or not user.is_active:
+    user = user_cache.get(user_id)
+    if user is None:
+        db_user = await db.scalar(select(User).where(User.id == user_id))
+        if not db_user:
+            raise HTTPException(status_code=401, detail="User not found or inactive")
+        user = AuthenticatedUser.from_user(db_user)
+        user_cache.put(user)
+    
+    if not user.is_active:
         raise HTTPException(status_code=401, detail="User not found or inactive")
     return user
 
 
-def get_current_user(
+async def get_current_user(
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
-) -> User:
+    db: AsyncSession = Depends(get_async_db)
+) -> AuthenticatedUser:
     """Dependency to get current authenticated user."""
     if not authorization:
         raise HTTPException(
@@ -60,4 +176,4 @@ def get_current_user(
     except ValueError:
         raise HTTPException(status_code=401, detail="Invalid authorization header")
     
-    return verify_token(token, db)
+    return await verify_token(token, db)
@@ -0,0 +1 @@
+"""Benchmarks for the Trace backend. Run each module with `python -m benchmarks.<name>`."""
@@ -0,0 +1,140 @@
+"""
+Benchmark: Trace Me data preparation for a large window.
+
+Builds a throwaway SQLite database with one user and N entries inside the
+analysis window, then times everything get_analysis_summary does before the
+LLM call. The original pipeline fetched the window twice as ORM objects,
+converted them to dicts and built the prompt with +=; the current one
+fetches column rows once and joins the prompt.
+
+Usage:
+    python -m benchmarks.bench_analysis_prompt --entries 10000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Point the app at a scratch database before importing it
+_scratch = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["DATABASE_URL"] = f"sqlite:///{_scratch.name}"
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder")
+# The fake models have no quota; do not pace them through the LLM gateway
+os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "0")
+
+from sqlalchemy import event, insert
+
+from database import JournalEntry, SessionLocal, User, engine, init_db
+from prompts.trace_analysis_prompt import TRACE_ANALYSIS_PROMPT
+from trace_analysis import build_analysis_prompt, get_user_journal_entries
+
+
+def seed(db, entries: int) -> int:
+    user = User(username="bench", email="bench@example.com", password_hash="x", full_name="Bench")
+    db.add(user)
+    db.commit()
+
+    now = datetime.utcnow()
+    step = timedelta(days=29) / entries
+    message = "Today I went for a walk, thought about work and felt a little calmer than yesterday. " * 3
+    db.execute(insert(JournalEntry), [
+        {
+            "user_id": user.id,
+            "session_id": f"session_{i // 10}",
+            "user_message": message,
+            "ai_response": "That sounds like a meaningful day. What made the walk feel calming?",
+            "created_at": now - step * i
+        }
+        for i in range(entries)
+    ])
+    db.commit()
+    return user.id
+
+
+def legacy_entries(db, user_id: int, days: int) -> list[dict]:
+    """The original fetch: full ORM objects converted to dicts."""
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=days)
+    entries = db.query(JournalEntry).filter(
+        JournalEntry.user_id == user_id,
+        JournalEntry.created_at >= start_date,
+        JournalEntry.created_at <= end_date
+    ).order_by(JournalEntry.created_at.desc()).all()
+    return [
+        {
+            "timestamp": entry.created_at.isoformat(),
+            "user_message": entry.user_message,
+            "ai_response": entry.ai_response,
+            "id": entry.id
+        }
+        for entry in entries
+    ]
+
+
+def legacy_prepare(db, user_id: int, days: int) -> str:
+    """The original pipeline: fetch for the summary, fetch again for the analysis, += formatting."""
+    legacy_entries(db, user_id, days)
+    db.expunge_all()
+    entries = legacy_entries(db, user_id, days)
+
+    formatted_text = f"Total entries analyzed: {len(entries)}\n\n"
+    for i, entry in enumerate(entries, 1):
+        formatted_text += f"--- Entry {i} ({entry['timestamp']}) ---\n"
+        formatted_text += f"Your thoughts: {entry['user_message']}\n"
+        formatted_text += f"Response: {entry['ai_response']}\n\n"
+
+    return f"""{TRACE_ANALYSIS_PROMPT}
+    Here are the journal entries to analyze:
+    {formatted_text}
+    Please provide a thoughtful analysis of these entries, identifying the key patterns and insights."""
+
+
+def current_prepare(db, user_id: int, days: int) -> str:
+    # Without a budget, so both pipelines build the same prompt
+    prompt, _ = build_analysis_prompt(get_user_journal_entries(user_id, days, db), token_budget=None)
+    return prompt
+
+
+def measure(fn, db, user_id: int, days: int, repeat: int) -> tuple[float, int, int]:
+    """Best wall time, query count and prompt length."""
+    queries = 0
+
+    def count(*args):
+        nonlocal queries
+        queries += 1
+
+    best = float("inf")
+    for _ in range(repeat):
+        db.expunge_all()
+        queries = 0
+        event.listen(engine, "before_cursor_execute", count)
+        start = time.perf_counter()
+        prompt = fn(db, user_id, days)
+        best = min(best, time.perf_counter() - start)
+        event.remove(engine, "before_cursor_execute", count)
+    return best, queries, len(prompt)
+
+
+def main(entries: int, days: int, repeat: int) -> None:
+    init_db()
+    db = SessionLocal()
+    try:
+        user_id = seed(db, entries)
+        print(f"Seeded {entries} entries within the last {days} days")
+        print(f"{'pipeline':>10} {'time (ms)':>10} {'queries':>8} {'prompt chars':>13}")
+        for name, fn in (("legacy", legacy_prepare), ("current", current_prepare)):
+            seconds, queries, length = measure(fn, db, user_id, days, repeat)
+            print(f"{name:>10} {seconds * 1000:>10.1f} {queries:>8} {length:>13}")
+    finally:
+        db.close()
+        os.unlink(_scratch.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.entries, args.days, args.repeat)
@@ -0,0 +1,78 @@
+"""
+Benchmark: concurrent chat turns through the sync and async chat paths.
+
+Swaps the Gemini-backed agent for a local fake model with a fixed latency,
+then fires N concurrent conversations from inside one event loop, the way
+uvicorn serves them. The "sync" column reproduces the old route, which
+called process_chat directly in an async handler; the "async" column uses
+aprocess_chat.
+
+Usage:
+    python -m benchmarks.bench_chat_concurrency --delay 0.5 --concurrency 1 10 50 100
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder")
+# The fake models have no quota; do not pace them through the LLM gateway
+os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "0")
+
+from langchain.agents import create_agent
+
+import agent_core
+from benchmarks.fake_llm import FakeChatModel
+from prompts.main_agent_sys_prompt import SYSTEM_PROMPT
+
+
+def install_fake_agent(delay: float) -> None:
+    """Replace the Gemini agent with one backed by the fake model."""
+    agent_core.agent = create_agent(
+        model=FakeChatModel(first_token_delay=delay),
+        tools=[agent_core.get_a_prompt],
+        system_prompt=SYSTEM_PROMPT,
+    )
+
+
+async def run_sync_path(concurrency: int, run_id: str) -> float:
+    """Old behaviour: blocking process_chat called inside async handlers."""
+    async def handler(i: int):
+        return agent_core.process_chat("I had a long day at work.", f"{run_id}_sync_{i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handler(i) for i in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def run_async_path(concurrency: int, run_id: str) -> float:
+    """New behaviour: aprocess_chat awaited inside async handlers."""
+    async def handler(i: int):
+        return await agent_core.aprocess_chat("I had a long day at work.", f"{run_id}_async_{i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handler(i) for i in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def main(delay: float, levels: list[int]) -> None:
+    install_fake_agent(delay)
+    
+    print(f"Fake LLM latency: {delay:.2f}s per turn")
+    print(f"{'concurrency':>12} {'sync wall (s)':>14} {'async wall (s)':>15} {'sync turns/s':>13} {'async turns/s':>14}")
+    for level in levels:
+        run_id = f"bench_{level}_{int(time.time())}"
+        sync_wall = await run_sync_path(level, run_id)
+        async_wall = await run_async_path(level, run_id)
+        print(
+            f"{level:>12} {sync_wall:>14.2f} {async_wall:>15.2f} "
+            f"{level / sync_wall:>13.1f} {level / async_wall:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=0.5, help="Fake LLM latency in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100])
+    args = parser.parse_args()
+    asyncio.run(main(args.delay, args.concurrency))
@@ -0,0 +1,116 @@
+"""
+Benchmark: /api/chat-sessions listing for a user with many sessions.
+
+Builds a throwaway SQLite database with one user, N sessions and a few
+entries per session, then times the original N+1 listing (one grouped
+query plus one title query per session) against the window-function derivation from
+journal_entries and the chat_sessions table lookup used by
+list_chat_sessions, both for the full list and for the first cursor page.
+
+Usage:
+    python -m benchmarks.bench_chat_sessions --sessions 10000 --entries-per-session 3
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Point the app at a scratch database before importing it
+_scratch = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["DATABASE_URL"] = f"sqlite:///{_scratch.name}"
+
+from sqlalchemy import func, insert
+
+from chat_sessions import backfill_chat_sessions, list_chat_sessions, summarize_sessions_from_entries
+from database import JournalEntry, SessionLocal, User, init_db
+
+
+def seed(db, sessions: int, entries_per_session: int) -> int:
+    user = User(username="bench", email="bench@example.com", password_hash="x", full_name="Bench")
+    db.add(user)
+    db.commit()
+    
+    start = datetime.utcnow() - timedelta(days=365)
+    rows = []
+    for s in range(sessions):
+        session_id = f"session_{user.id}_{s}"
+        for e in range(entries_per_session):
+            rows.append({
+                "user_id": user.id,
+                "session_id": session_id,
+                # The first entry of every session is the greeting
+                "user_message": "" if e == 0 else f"Entry {e} of session {s}: today I thought about a lot of things",
+                "ai_response": "Tell me more.",
+                "created_at": start + timedelta(minutes=s * 10 + e)
+            })
+    db.execute(insert(JournalEntry), rows)
+    db.commit()
+    return user.id
+
+
+def legacy_listing(db, user_id: int) -> list[dict]:
+    """The original implementation: one grouped query, then one query per session."""
+    sessions = db.query(
+        JournalEntry.session_id,
+        func.min(JournalEntry.created_at).label('created_at'),
+        func.max(JournalEntry.created_at).label('updated_at'),
+        func.count(JournalEntry.id).label('message_count')
+    ).filter(
+        JournalEntry.user_id == user_id
+    ).group_by(
+        JournalEntry.session_id
+    ).order_by(
+        func.max(JournalEntry.created_at).desc()
+    ).all()
+    
+    result = []
+    for session in sessions:
+        first_user_msg = db.query(JournalEntry).filter(
+            JournalEntry.user_id == user_id,
+            JournalEntry.session_id == session.session_id,
+            JournalEntry.user_message != ""
+        ).order_by(JournalEntry.created_at.asc()).first()
+        title = first_user_msg.user_message[:50] if first_user_msg else "Chat"
+        result.append({"session_id": session.session_id, "title": title})
+    return result
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sessions: int, entries_per_session: int, page_size: int, repeat: int) -> None:
+    init_db()
+    db = SessionLocal()
+    try:
+        user_id = seed(db, sessions, entries_per_session)
+        backfill_chat_sessions(db)
+        print(f"Seeded {sessions} sessions x {entries_per_session} entries")
+        
+        results = [
+            ("legacy N+1 (all)", timed(lambda: legacy_listing(db, user_id), 1)),
+            ("windowed (all)", timed(lambda: summarize_sessions_from_entries(db, user_id), repeat)),
+            ("chat_sessions (all)", timed(lambda: list_chat_sessions(db, user_id), repeat)),
+            (f"chat_sessions (page of {page_size})", timed(lambda: list_chat_sessions(db, user_id, limit=page_size), repeat)),
+        ]
+        for name, seconds in results:
+            print(f"{name:>28}: {seconds * 1000:9.1f} ms")
+    finally:
+        db.close()
+        os.unlink(_scratch.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--entries-per-session", type=int, default=3)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.sessions, args.entries_per_session, args.page_size, args.repeat)
@@ -0,0 +1,68 @@
+"""
+Benchmark: time-to-first-token of /chat versus /chat/stream.
+
+Uses the local fake chat model with separate first-token and per-token
+delays. The buffered path (aprocess_chat) can only show something once the
+whole reply is generated; the streaming path (astream_chat) surfaces the
+first token as soon as the model emits it.
+
+Usage:
+    python -m benchmarks.bench_chat_ttft --first-token-delay 0.3 --token-delay 0.05
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder")
+# The fake models have no quota; do not pace them through the LLM gateway
+os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "0")
+
+from langchain.agents import create_agent
+
+import agent_core
+from benchmarks.fake_llm import FakeChatModel
+from prompts.main_agent_sys_prompt import SYSTEM_PROMPT
+
+
+async def buffered_turn(session_id: str) -> float:
+    start = time.perf_counter()
+    await agent_core.aprocess_chat("Today felt heavy.", session_id)
+    return time.perf_counter() - start
+
+
+async def streamed_turn(session_id: str) -> tuple[float, float]:
+    start = time.perf_counter()
+    first_token = None
+    async for event in agent_core.astream_chat("Today felt heavy.", session_id):
+        if first_token is None and "token" in event:
+            first_token = time.perf_counter() - start
+    return first_token, time.perf_counter() - start
+
+
+async def main(first_token_delay: float, token_delay: float, turns: int) -> None:
+    agent_core.agent = create_agent(
+        model=FakeChatModel(first_token_delay=first_token_delay, token_delay=token_delay),
+        tools=[agent_core.get_a_prompt],
+        system_prompt=SYSTEM_PROMPT,
+    )
+    
+    buffered = [await buffered_turn(f"ttft_buffered_{i}") for i in range(turns)]
+    streamed = [await streamed_turn(f"ttft_streamed_{i}") for i in range(turns)]
+    
+    print(f"Fake LLM: first token after {first_token_delay:.2f}s, {token_delay * 1000:.0f}ms per token")
+    print(f"{'path':>10} {'first token (s)':>16} {'complete (s)':>13}")
+    avg_buffered = sum(buffered) / turns
+    print(f"{'/chat':>10} {avg_buffered:>16.2f} {avg_buffered:>13.2f}")
+    avg_first = sum(s[0] for s in streamed) / turns
+    avg_total = sum(s[1] for s in streamed) / turns
+    print(f"{'/stream':>10} {avg_first:>16.2f} {avg_total:>13.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.first_token_delay, args.token_delay, args.turns))
@@ -0,0 +1,116 @@
+"""
+Benchmark: /api/journal latency under concurrency with the configured pool.
+
+Seeds a user with some journal entries, then fires concurrent authenticated
+GET /api/journal requests through httpx and reports p50/p99 latency,
+throughput and the pool metrics from /api/metrics/db-pool.
+
+By default requests go to the app in-process. Pass --base-url to hit a
+running server instead; the benchmark must then share the server's
+DATABASE_URL and SECRET_KEY so that the seeded user and token are valid.
+Pool settings come from the usual environment variables, e.g. compare:
+
+    DB_POOL_SIZE=0 DATABASE_URL=postgresql://... python -m benchmarks.bench_db_pool
+    DB_POOL_SIZE=10 DATABASE_URL=postgresql://... python -m benchmarks.bench_db_pool
+
+Usage:
+    python -m benchmarks.bench_db_pool --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder")
+
+import httpx
+
+from auth import create_access_token
+from database import DATABASE_URL, JournalEntry, SessionLocal, User, init_db
+
+
+def seed(entries: int) -> int:
+    db = SessionLocal()
+    try:
+        suffix = uuid.uuid4().hex[:8]
+        user = User(
+            username=f"bench_{suffix}",
+            email=f"bench_{suffix}@example.com",
+            password_hash="x",
+            full_name="Bench"
+        )
+        db.add(user)
+        db.commit()
+        db.add_all([
+            JournalEntry(
+                user_id=user.id,
+                session_id="bench",
+                user_message=f"Entry {i}: today I thought about a lot of things",
+                ai_response="Tell me more."
+            )
+            for i in range(entries)
+        ])
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+async def run(client: httpx.AsyncClient, token: str, requests: int, concurrency: int) -> list[float]:
+    headers = {"Authorization": f"Bearer {token}"}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get("/api/journal", headers=headers)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+
+async def main(base_url: str | None, requests: int, concurrency: int, entries: int) -> None:
+    init_db()
+    token = create_access_token(seed(entries))
+
+    if base_url:
+        client = httpx.AsyncClient(base_url=base_url, timeout=60)
+    else:
+        from main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    async with client:
+        # Warm up connections and imports before measuring
+        await run(client, token, concurrency, concurrency)
+
+        start = time.perf_counter()
+        latencies = await run(client, token, requests, concurrency)
+        elapsed = time.perf_counter() - start
+
+        pool = (await client.get("/api/metrics/db-pool")).json()
+
+    print(f"Database: {DATABASE_URL.split('@')[-1]}")
+    print(f"{requests} requests, concurrency {concurrency}, {entries} entries")
+    print(f"throughput: {requests / elapsed:8.1f} req/s")
+    print(f"p50:        {percentile(latencies, 0.50) * 1000:8.1f} ms")
+    print(f"p99:        {percentile(latencies, 0.99) * 1000:8.1f} ms")
+    print(f"pool:       {pool}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=None, help="Running server to benchmark (default: in-process app)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--entries", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.base_url, args.requests, args.concurrency, args.entries))
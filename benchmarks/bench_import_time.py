@@ -0,0 +1,94 @@
+"""
+Benchmark: cold import time of the API and its agent modules.
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters,
+takes the median cumulative import time of each tracked module and compares
+it with benchmarks/import_time_budget.json. Modules listed under "deferred"
+(the Gemini client, TensorFlow) must not be imported at all: they are only
+needed once a model is actually called.
+
+Exits non-zero when a budget is exceeded or a deferred module is imported,
+so it can run as a CI step. --update rewrites the budgets from this run
+(with the file's headroom factor applied).
+
+Usage:
+    python -m benchmarks.bench_import_time
+    python -m benchmarks.bench_import_time --runs 5 --update
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BUDGET_FILE = Path(__file__).resolve().parent / "import_time_budget.json"
+
+
+def import_times(module: str, env: dict) -> dict[str, int]:
+    """Cumulative import time in microseconds of every module imported by `import module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(runs: int, update: bool) -> int:
+    budget = json.loads(BUDGET_FILE.read_text())
+
+    # No API key and a scratch database: importing must not need either
+    scratch = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{scratch.name}", "GEMINI_API_KEY": ""}
+
+    failures = []
+    measured = {}
+    try:
+        print(f"{'module':>16} {'median (ms)':>12} {'budget (ms)':>12}")
+        for module, limit_ms in budget["modules"].items():
+            samples = [import_times(module, env) for _ in range(runs)]
+            median_ms = statistics.median(sample[module] for sample in samples) / 1000
+            measured[module] = median_ms
+            marker = "" if median_ms <= limit_ms else "  OVER BUDGET"
+            print(f"{module:>16} {median_ms:>12.0f} {limit_ms:>12.0f}{marker}")
+            if median_ms > limit_ms:
+                failures.append(f"{module} took {median_ms:.0f} ms (budget {limit_ms} ms)")
+
+            imported = set().union(*samples)
+            for deferred in budget["deferred"]:
+                if deferred in imported:
+                    failures.append(f"import {module} pulled in {deferred}")
+    finally:
+        os.unlink(scratch.name)
+
+    if update:
+        headroom = budget["headroom"]
+        budget["modules"] = {module: int(round(ms * headroom, -1)) for module, ms in measured.items()}
+        BUDGET_FILE.write_text(json.dumps(budget, indent=2) + "\n")
+        print(f"Budgets updated in {BUDGET_FILE.name}")
+        return 0
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--update", action="store_true", help="Rewrite the budgets from this run")
+    args = parser.parse_args()
+    sys.exit(main(args.runs, args.update))
@@ -0,0 +1,94 @@
+"""
+Benchmark: a burst of LLM calls against a quota-limited stub, with and without the gateway.
+
+Fires --requests concurrent calls at a local fake model that accepts
+--quota requests per second and answers the rest with 429
+RESOURCE_EXHAUSTED. "direct" calls the model as the API used to, so every
+call over the quota fails. "backoff only" uses an LLMGateway without a rate
+limit, relying on jittered retries; "gateway" also paces calls with the
+token bucket at the quota. The last run points the gateway at a stub that
+always answers 503 and shows the circuit breaker failing calls fast instead
+of retrying each one.
+
+Usage:
+    python -m benchmarks.bench_llm_gateway --requests 30 --quota 5
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder")
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.fake_llm import QuotaLimitedChatModel
+from llm_gateway import LLMGateway
+
+PROMPT = [HumanMessage(content="Coffee meeting went well.")]
+
+
+async def burst(model: QuotaLimitedChatModel, gateway: LLMGateway | None, requests: int) -> dict:
+    async def one() -> float | None:
+        start = time.perf_counter()
+        try:
+            if gateway is None:
+                await model.ainvoke(PROMPT)
+            else:
+                await gateway.acall("benchmark", model.ainvoke, PROMPT)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    served = sorted(latency for latency in latencies if latency is not None)
+    return {
+        "served": len(served),
+        "failed": requests - len(served),
+        "provider_429s": model.rejected,
+        "p50": served[len(served) // 2] if served else 0.0,
+        "max": served[-1] if served else 0.0,
+        "seconds": elapsed
+    }
+
+
+async def main(requests: int, quota: int, delay: float) -> None:
+    def stub(**kwargs) -> QuotaLimitedChatModel:
+        return QuotaLimitedChatModel(quota=quota, window_seconds=1.0, first_token_delay=delay, **kwargs)
+
+    runs = {
+        "direct": None,
+        "backoff only": LLMGateway(requests_per_minute=0, max_concurrency=0, max_retries=8, backoff_max=4.0, queue_timeout=30),
+        "gateway": LLMGateway(requests_per_minute=quota * 60, burst=quota, max_concurrency=quota, queue_timeout=30)
+    }
+
+    print(f"{requests} concurrent calls, stub quota {quota}/s, stub latency {delay:.2f}s")
+    print(f"{'mode':>13} {'served':>7} {'failed':>7} {'429s':>5} {'p50 (s)':>8} {'max (s)':>8} {'total (s)':>10}")
+    for name, gateway in runs.items():
+        result = await burst(stub(), gateway, requests)
+        print(
+            f"{name:>13} {result['served']:>7} {result['failed']:>7} {result['provider_429s']:>5} "
+            f"{result['p50']:>8.2f} {result['max']:>8.2f} {result['seconds']:>10.2f}"
+        )
+
+    gateway = LLMGateway(requests_per_minute=0, max_retries=2, backoff_base=0.05, failure_threshold=5, reset_seconds=30)
+    start = time.perf_counter()
+    result = await burst(stub(unavailable=True), gateway, requests)
+    circuit = gateway.stats()["circuit"]
+    attempts = gateway.stats()["callers"]["benchmark"]["attempts"]
+    print(
+        f"\nProvider down: {result['failed']}/{requests} failed in {time.perf_counter() - start:.2f}s, "
+        f"{attempts} provider attempts instead of {requests * (gateway.max_retries + 1)}, "
+        f"circuit {circuit['state']} ({circuit['rejected']} retries rejected fast)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--quota", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.quota, args.delay))
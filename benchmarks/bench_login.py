@@ -0,0 +1,106 @@
+"""
+Benchmark: login throughput and event-loop responsiveness during a login burst.
+
+Seeds one user, then sends concurrent POST /api/auth/login requests to the
+in-process app while measuring event-loop lag (how late a 10 ms timer
+fires). With bcrypt on the worker pool the loop stays responsive; --inline
+verifies passwords on the event loop (the original behaviour) for
+comparison.
+
+The cost factor and pool size come from BCRYPT_ROUNDS and
+PASSWORD_HASH_CONCURRENCY.
+
+Usage:
+    python -m benchmarks.bench_login --logins 200 --concurrency 50
+    python -m benchmarks.bench_login --logins 200 --concurrency 50 --inline
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# Point the app at a scratch database before importing it
+_scratch = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["DATABASE_URL"] = f"sqlite:///{_scratch.name}"
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder")
+
+import httpx
+
+import passwords
+import routes.auth
+from database import SessionLocal, User, init_db
+
+PASSWORD = "correct horse battery staple"
+
+
+def seed() -> None:
+    db = SessionLocal()
+    try:
+        db.add(User(
+            username="bench",
+            email="bench@example.com",
+            password_hash=passwords.hash_password(PASSWORD),
+            full_name="Bench"
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+async def main(logins: int, concurrency: int, inline: bool) -> None:
+    init_db()
+    seed()
+
+    if inline:
+        async def verify_inline(password: str, password_hash: str) -> bool:
+            return passwords.verify_password(password, password_hash)
+        routes.auth.averify_password = verify_inline
+
+    from main import app
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        done = asyncio.Event()
+        lags = []
+
+        async def login():
+            async with semaphore:
+                response = await client.post("/api/auth/login", json={"username": "bench", "password": PASSWORD})
+                response.raise_for_status()
+
+        async def measure_lag():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - start - 0.01)
+
+        monitor = asyncio.create_task(measure_lag())
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await monitor
+
+    mode = "inline (event loop)" if inline else f"pool of {passwords.PASSWORD_HASH_CONCURRENCY}"
+    print(f"bcrypt rounds {passwords.BCRYPT_ROUNDS}, {mode}")
+    print(f"{logins} logins, concurrency {concurrency}")
+    print(f"login throughput: {logins / elapsed:8.1f} logins/s")
+    print(f"loop lag p50:     {percentile(lags, 0.50) * 1000:8.1f} ms")
+    print(f"loop lag p99:     {percentile(lags, 0.99) * 1000:8.1f} ms")
+    print(f"loop lag max:     {max(lags) * 1000:8.1f} ms")
+    os.unlink(_scratch.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--inline", action="store_true", help="Verify passwords on the event loop")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.inline))
@@ -0,0 +1,63 @@
+"""
+Benchmark: sentiment inference throughput with and without micro-batching.
+
+By default the model is replaced with a synthetic predict function whose
+cost is a fixed per-call overhead plus a small per-text cost, which is the
+shape of a TensorFlow graph dispatch. Pass --real-model to load
+sentiment_model_tf instead.
+
+Usage:
+    python -m benchmarks.bench_sentiment_batching --concurrency 1 16 64 256
+"""
+import argparse
+import asyncio
+import time
+
+from sentiment_service import MicroBatcher, get_sentiment_analyzer
+
+
+def synthetic_predict(call_overhead: float, per_text: float):
+    def predict(texts: list[str]) -> list[list[float]]:
+        time.sleep(call_overhead + per_text * len(texts))
+        return [[0.5] * 6 for _ in texts]
+    return predict
+
+
+async def unbatched(predict, concurrency: int) -> float:
+    """One predict per request, each in a worker thread (the naive endpoint)."""
+    start = time.perf_counter()
+    await asyncio.gather(*(asyncio.to_thread(predict, ["entry"]) for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def batched(predict, concurrency: int, max_batch_size: int, max_wait: float) -> tuple[float, float]:
+    batcher = MicroBatcher(predict, max_batch_size=max_batch_size, max_wait=max_wait)
+    start = time.perf_counter()
+    await asyncio.gather(*(batcher.submit("entry") for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await batcher.close()
+    return elapsed, batcher.stats()["average_batch_size"]
+
+
+async def main(args) -> None:
+    if args.real_model:
+        predict = get_sentiment_analyzer().analyze_batch
+    else:
+        predict = synthetic_predict(args.call_overhead, args.per_text)
+    
+    print(f"{'concurrency':>12} {'unbatched req/s':>16} {'batched req/s':>14} {'avg batch':>10}")
+    for level in args.concurrency:
+        plain = await unbatched(predict, level)
+        coalesced, avg_batch = await batched(predict, level, args.max_batch_size, args.max_wait_ms / 1000)
+        print(f"{level:>12} {level / plain:>16.1f} {level / coalesced:>14.1f} {avg_batch:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--call-overhead", type=float, default=0.02, help="Synthetic seconds per predict call")
+    parser.add_argument("--per-text", type=float, default=0.0002, help="Synthetic seconds per text")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--real-model", action="store_true", help="Use sentiment_model_tf instead of the synthetic model")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,76 @@
+"""
+Benchmark: turn latency with sequential versus speculative input validation.
+
+Builds the chat graph for each INPUT_VALIDATION_MODE with fake agent and
+validation models of configurable latency, and runs turns whose validation
+passes or fails. Sequential validation adds the validator's latency to every
+turn. Speculative validation takes max(validate, generate) when the input is
+valid, and returns right after validation when it is not, because the
+generation is then cancelled.
+
+Local validation tiers are disabled so every turn reaches the fake validator.
+
+Usage:
+    python -m benchmarks.bench_speculative_validation --validate-delay 0.4 --generate-delay 0.8
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder")
+# The fake models have no quota; do not pace them through the LLM gateway
+os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "0")
+
+from langchain.agents import create_agent
+from langchain_core.messages import HumanMessage
+
+import agent_core
+from benchmarks.fake_llm import FakeChatModel
+from conversation_context import context_config
+from input_validation import TieredInputValidator
+from prompts.main_agent_sys_prompt import SYSTEM_PROMPT
+
+VERDICTS = {
+    "valid": '{"is_valid": true, "reason": "Journaling content"}',
+    "invalid": '{"is_valid": false, "reason": "Question for an assistant"}'
+}
+
+
+async def turn_latency(graph, turns: int) -> float:
+    total = 0.0
+    for i in range(turns):
+        state = {"messages": [HumanMessage(content="Coffee meeting went well.")], "validation_passed": True, "validation_reason": ""}
+        start = time.perf_counter()
+        await graph.ainvoke(state, config=context_config(None, f"bench_{i}"))
+        total += time.perf_counter() - start
+    return total / turns
+
+
+async def main(validate_delay: float, generate_delay: float, turns: int) -> None:
+    agent_core.agent = create_agent(
+        model=FakeChatModel(first_token_delay=generate_delay),
+        tools=[agent_core.get_a_prompt],
+        system_prompt=SYSTEM_PROMPT,
+    )
+    agent_core.input_validator = TieredInputValidator(cache_size=0, heuristics=False)
+
+    print(f"Fake validator {validate_delay:.2f}s, fake agent {generate_delay:.2f}s, {turns} turns per cell")
+    print(f"{'mode':>12} {'valid (s)':>10} {'invalid (s)':>12}")
+    for mode in ("off", "sequential", "speculative"):
+        graph = agent_core.create_graph_builder(mode).compile()
+        row = []
+        for reply in VERDICTS.values():
+            agent_core.validation_model = FakeChatModel(reply=reply, first_token_delay=validate_delay)
+            row.append(await turn_latency(graph, turns))
+        print(f"{mode:>12} {row[0]:>10.2f} {row[1]:>12.2f}")
+    print(f"Speculation counters: {agent_core.speculation_stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--validate-delay", type=float, default=0.4)
+    parser.add_argument("--generate-delay", type=float, default=0.8)
+    parser.add_argument("--turns", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.validate_delay, args.generate_delay, args.turns))
@@ -0,0 +1,159 @@
+"""Local fake chat model used by the benchmarks instead of Gemini."""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import PrivateAttr
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers with a fixed reply after a configurable delay.
+    
+    The delay is split into a time-to-first-token part and a per-token part so
+    benchmarks can reason about both latency and streaming behaviour. Sync
+    calls block with time.sleep, async calls yield with asyncio.sleep, which
+    mirrors how a real network-bound client behaves.
+    """
+    reply: str = "That sounds like a meaningful day. What stood out to you the most?"
+    first_token_delay: float = 0.5
+    token_delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        """Tools are accepted but never called."""
+        return self
+
+    def with_structured_output(self, schema, *, include_raw: bool = False, **kwargs):
+        """Parse the reply as JSON into schema, like a provider's native JSON-schema mode."""
+        def parse(message: AIMessage) -> dict:
+            try:
+                return {"raw": message, "parsed": schema.model_validate_json(message.text), "parsing_error": None}
+            except ValueError as e:
+                return {"raw": message, "parsed": None, "parsing_error": e}
+
+        chain = self | RunnableLambda(parse)
+        return chain if include_raw else chain | RunnableLambda(lambda output: output["parsed"])
+
+    def _tokens(self) -> List[str]:
+        words = self.reply.split(" ")
+        return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.first_token_delay + self.token_delay * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.first_token_delay + self.token_delay * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_delay)
+        for token in self._tokens():
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_delay)
+        for token in self._tokens():
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeProviderError(Exception):
+    """Error shaped like a provider HTTP error: a status code plus a message."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class QuotaLimitedChatModel(FakeChatModel):
+    """
+    FakeChatModel behind a simulated provider quota.
+
+    At most quota requests are accepted per window_seconds; the rest fail at
+    once with a 429 RESOURCE_EXHAUSTED error, like Gemini does when a
+    project's requests-per-minute quota is spent. With unavailable set every
+    request fails with a 503 instead, for exercising the circuit breaker.
+    """
+    quota: int = 5
+    window_seconds: float = 1.0
+    unavailable: bool = False
+    _accepted: deque = PrivateAttr(default_factory=deque)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    rejected: int = 0
+
+    def _admit(self) -> None:
+        if self.unavailable:
+            raise FakeProviderError(503, "UNAVAILABLE. The model is overloaded.")
+        now = time.monotonic()
+        with self._lock:
+            while self._accepted and now - self._accepted[0] >= self.window_seconds:
+                self._accepted.popleft()
+            if len(self._accepted) >= self.quota:
+                self.rejected += 1
+                raise FakeProviderError(429, "RESOURCE_EXHAUSTED. You exceeded your current quota.")
+            self._accepted.append(now)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._admit()
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._admit()
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        self._admit()
+        yield from super()._stream(messages, stop, run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        self._admit()
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
@@ -0,0 +1,311 @@
+"""Chat session metadata: write-time maintenance, listing and backfill."""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, case, delete, exists, func, insert, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from database import ChatSession, JournalEntry
+
+TITLE_LENGTH = 50
+DEFAULT_TITLE = "Chat"
+
+
+def make_title(first_user_message: Optional[str]) -> str:
+    """Create a session title from its first user message, or use a default."""
+    if first_user_message and first_user_message.strip():
+        title = first_user_message[:TITLE_LENGTH]
+        if len(first_user_message) > TITLE_LENGTH:
+            title = title + "..."
+        return title
+    return DEFAULT_TITLE
+
+
+def encode_cursor(updated_at: datetime, session_id: str) -> str:
+    """Opaque pagination cursor pointing just past a session in the listing order."""
+    payload = json.dumps([updated_at.isoformat(), session_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        updated_at, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(updated_at), session_id
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _upsert(db: Session):
+    """The dialect's INSERT construct, which supports ON CONFLICT."""
+    return {"postgresql": postgresql.insert, "sqlite": sqlite.insert}[db.get_bind().dialect.name](ChatSession)
+
+
+def record_chat_entry(
+    db: Session,
+    user_id: int,
+    session_id: Optional[str],
+    user_message: str,
+    created_at: datetime
+) -> None:
+    """
+    Account for a new journal entry in its session's metadata row.
+    
+    Runs in the caller's transaction, so the entry and the metadata are
+    committed (or rolled back) together. A single INSERT ... ON CONFLICT DO
+    UPDATE creates the row or bumps its counter in SQL, so concurrent turns
+    on one session neither lose updates nor race on the first insert. The
+    first non-empty user message sets the title.
+    
+    Args:
+        db: Database session the entry was added to
+        user_id: Owner of the session
+        session_id: Chat session ID (entries without one belong to no session)
+        user_message: The entry's user message ("" for the greeting)
+        created_at: The entry's timestamp
+    """
+    if session_id is None:
+        return
+    
+    title = make_title(user_message) if user_message else None
+    
+    statement = _upsert(db).values(
+        user_id=user_id,
+        session_id=session_id,
+        title=title,
+        message_count=1,
+        created_at=created_at,
+        updated_at=created_at
+    )
+    db.execute(statement.on_conflict_do_update(
+        index_elements=["user_id", "session_id"],
+        set_={
+            "message_count": ChatSession.message_count + 1,
+            "updated_at": statement.excluded.updated_at,
+            "title": func.coalesce(ChatSession.title, statement.excluded.title)
+        }
+    ))
+
+
+def remove_chat_session(db: Session, user_id: int, session_id: str) -> bool:
+    """
+    Delete a session's metadata row in the caller's transaction.
+    
+    Returns:
+        False if the user has no such session
+    """
+    result = db.execute(
+        delete(ChatSession)
+        .where(ChatSession.user_id == user_id, ChatSession.session_id == session_id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+def list_chat_sessions(
+    db: Session,
+    user_id: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+) -> dict:
+    """
+    List a user's chat sessions, most recently updated first.
+    
+    Reads the chat_sessions table through its (user_id, updated_at,
+    session_id) index, so a page costs a range scan of that many rows
+    however long the user's history is.
+    
+    Args:
+        db: Database session
+        user_id: Owner of the sessions
+        limit: Maximum sessions to return (None for all)
+        cursor: next_cursor value from a previous page
+    
+    Returns:
+        Dictionary with "sessions" and "next_cursor" (None on the last page)
+    """
+    query = select(
+        ChatSession.session_id,
+        ChatSession.title,
+        ChatSession.created_at,
+        ChatSession.updated_at,
+        ChatSession.message_count
+    ).where(
+        ChatSession.user_id == user_id
+    ).order_by(
+        ChatSession.updated_at.desc(), ChatSession.session_id.desc()
+    )
+    
+    if cursor:
+        cursor_updated_at, cursor_session_id = decode_cursor(cursor)
+        query = query.where(or_(
+            ChatSession.updated_at < cursor_updated_at,
+            and_(ChatSession.updated_at == cursor_updated_at, ChatSession.session_id < cursor_session_id)
+        ))
+    
+    if limit is not None:
+        # Fetch one extra row to know whether another page exists
+        query = query.limit(limit + 1)
+    
+    rows = db.execute(query).all()
+    
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].updated_at, rows[-1].session_id)
+    
+    sessions = [
+        {
+            "session_id": row.session_id,
+            "title": row.title or DEFAULT_TITLE,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+            "message_count": row.message_count
+        }
+        for row in rows
+    ]
+    
+    return {"sessions": sessions, "next_cursor": next_cursor}
+
+
+def summarize_sessions_from_entries(
+    db: Session,
+    user_id: Optional[int] = None,
+    missing_only: bool = False
+) -> list:
+    """
+    Derive session metadata directly from journal_entries.
+    
+    A single pass of window functions yields each session's counts,
+    timestamps and title (its first non-empty user message). This is the
+    source of truth the chat_sessions table is rebuilt from.
+    
+    Args:
+        db: Database session
+        user_id: Restrict to one user's sessions (None for all users)
+        missing_only: Only sessions that have no chat_sessions row yet
+    
+    Returns:
+        Rows with user_id, session_id, created_at, updated_at,
+        message_count and user_message (the title source)
+    """
+    session_window = {"partition_by": (JournalEntry.user_id, JournalEntry.session_id)}
+    ranked = select(
+        JournalEntry.user_id.label("user_id"),
+        JournalEntry.session_id.label("session_id"),
+        func.min(JournalEntry.created_at).over(**session_window).label("created_at"),
+        func.max(JournalEntry.created_at).over(**session_window).label("updated_at"),
+        func.count(JournalEntry.id).over(**session_window).label("message_count"),
+        JournalEntry.user_message.label("user_message"),
+        # Rank non-empty user messages first so position 1 carries the title
+        func.row_number().over(
+            partition_by=(JournalEntry.user_id, JournalEntry.session_id),
+            order_by=(
+                case((JournalEntry.user_message == "", 1), else_=0),
+                JournalEntry.created_at.asc(),
+                JournalEntry.id.asc()
+            )
+        ).label("position")
+    ).where(
+        # Entries without a session ID have no chat_sessions row
+        JournalEntry.session_id.isnot(None)
+    )
+    if user_id is not None:
+        ranked = ranked.where(JournalEntry.user_id == user_id)
+    if missing_only:
+        ranked = ranked.where(~exists().where(
+            ChatSession.user_id == JournalEntry.user_id,
+            ChatSession.session_id == JournalEntry.session_id
+        ))
+    ranked = ranked.subquery()
+    
+    query = select(
+        ranked.c.user_id,
+        ranked.c.session_id,
+        ranked.c.created_at,
+        ranked.c.updated_at,
+        ranked.c.message_count,
+        ranked.c.user_message
+    ).where(
+        ranked.c.position == 1
+    )
+    
+    return db.execute(query).all()
+
+
+def backfill_chat_sessions(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    Rebuild chat_sessions rows from journal_entries and commit.
+    
+    Use once after creating the table on an existing database, or to repair
+    drift. Existing rows in scope are replaced.
+    
+    Args:
+        db: Database session
+        user_id: Rebuild only this user's sessions (None for all users)
+    
+    Returns:
+        Number of sessions written
+    """
+    rows = summarize_sessions_from_entries(db, user_id)
+    
+    clear = delete(ChatSession)
+    if user_id is not None:
+        clear = clear.where(ChatSession.user_id == user_id)
+    db.execute(clear)
+    
+    if rows:
+        db.execute(insert(ChatSession), _session_rows(rows))
+    
+    db.commit()
+    return len(rows)
+
+
+def backfill_missing_chat_sessions(db: Session) -> int:
+    """
+    Add chat_sessions rows for sessions that only exist in journal_entries and commit.
+    
+    Called from init_db, so sessions written before the table existed are
+    listed and deletable without a manual backfill. Existing rows are left
+    alone, and a row a concurrent writer (or another worker starting up)
+    inserts first wins.
+    
+    Returns:
+        Number of sessions added
+    """
+    rows = summarize_sessions_from_entries(db, missing_only=True)
+    if rows:
+        db.execute(
+            _upsert(db).on_conflict_do_nothing(index_elements=["user_id", "session_id"]),
+            _session_rows(rows)
+        )
+    db.commit()
+    return len(rows)
+
+
+def _session_rows(rows: list) -> list[dict]:
+    return [
+        {
+            "user_id": row.user_id,
+            "session_id": row.session_id,
+            "title": make_title(row.user_message) if row.user_message else None,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+            "message_count": row.message_count
+        }
+        for row in rows
+    ]
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, init_db
+    
+    init_db()
+    db = SessionLocal()
+    try:
+        print(f"Backfilled {backfill_chat_sessions(db)} chat sessions")
+    finally:
+        db.close()
@@ -0,0 +1,367 @@
+"""Incremental context for the agent: a rolling summary plus the most recent messages."""
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Hashable, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately, get_buffer_string
+from sqlalchemy.exc import IntegrityError
+
+from database import ConversationSummary, SessionLocal
+from llm_gateway import llm_gateway
+from prompts.summary_prompt import ROLLING_SUMMARY_PROMPT
+
+SUMMARY_PREFIX = "Here is a summary of our conversation so far:"
+
+
+def context_config(user_id: Optional[int], session_id: str) -> dict:
+    """Graph config that tells the chat node which session it is serving."""
+    return {"configurable": {"user_id": user_id, "session_id": session_id}}
+
+
+def context_key(config: Optional[dict]) -> Optional[tuple]:
+    """The (user_id, session_id) a graph run was configured with, if any."""
+    configurable = (config or {}).get("configurable", {})
+    if configurable.get("session_id") is None:
+        return None
+    return configurable.get("user_id"), configurable["session_id"]
+
+
+# Messages hashed into a boundary anchor; more than one so short repeated
+# replies ("ok", "thanks") do not make the boundary ambiguous
+ANCHOR_MESSAGES = 2
+
+
+def boundary_anchor(messages: list[BaseMessage], end: int) -> str:
+    """Stable identity of the messages just before index end, used to find the summary boundary."""
+    digest = hashlib.sha1()
+    for message in messages[max(0, end - ANCHOR_MESSAGES):end]:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        digest.update(f"{message.type}:{content}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _input_tokens(message) -> int:
+    """Prompt tokens reported by the provider on a (streamed) AI message."""
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("input_tokens", 0) if usage else 0
+
+
+@dataclass
+class SessionSummary:
+    """Summary of a session's history up to the boundary identified by `anchor`."""
+    summary: str
+    message_count: int  # Position of the boundary in the history it was last seen in
+    anchor: str
+
+
+class ConversationContextManager:
+    """
+    Builds the messages sent to the agent for one turn.
+
+    The agent sees a summary of the older part of the session followed by
+    every message after the summary boundary. Once more than window_messages
+    + step_messages messages follow the boundary, the oldest of them are
+    folded into the summary with one LLM call over just those messages and
+    the previous summary, leaving the last window_messages in full. The
+    input sent per turn therefore stays bounded instead of growing with the
+    session, and each message is summarized once.
+
+    Summaries of signed-in users' sessions are persisted in
+    conversation_summaries, so a restart or another worker picks them up
+    instead of recomputing. The boundary is located by a hash of the last
+    folded messages, which also works on histories rehydrated from
+    journal_entries that start later than the session did.
+    """
+
+    def __init__(
+        self,
+        summary_model: Callable[[], BaseChatModel],
+        window_messages: int = 20,
+        step_messages: int = 10,
+        cache_size: int = 1000,
+        token_counter: Callable[[list[BaseMessage]], int] = count_tokens_approximately
+    ):
+        self.summary_model = summary_model
+        self.window_messages = window_messages
+        self.step_messages = step_messages
+        self.cache_size = cache_size
+        self.token_counter = token_counter
+
+        # key -> SessionSummary, or None when the session has no summary yet
+        self._summaries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.turns = 0
+        self.input_tokens = 0
+        self.history_tokens = 0
+        self.reported_input_tokens = 0
+        self.max_input_tokens = 0
+        self._recent_input_tokens = deque(maxlen=1024)
+        self.summaries_written = 0
+        self.summary_failures = 0
+        self.summary_input_tokens = 0
+        self.summaries_loaded = 0
+
+    # ---------- Summary storage ----------
+
+    def _cached(self, key: Hashable) -> tuple[bool, Optional[SessionSummary]]:
+        with self._lock:
+            if key not in self._summaries:
+                return False, None
+            self._summaries.move_to_end(key)
+            return True, self._summaries[key]
+
+    def _remember(self, key: Hashable, summary: Optional[SessionSummary]) -> None:
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    @staticmethod
+    def _persisted(key: Hashable) -> bool:
+        # Anonymous sessions (the CLI) keep their summary in memory only
+        return key[0] is not None
+
+    def _load(self, key: Hashable) -> Optional[SessionSummary]:
+        found, summary = self._cached(key)
+        if found or not self._persisted(key):
+            return summary
+
+        user_id, session_id = key
+        db = SessionLocal()
+        try:
+            row = db.query(ConversationSummary).filter(
+                ConversationSummary.user_id == user_id,
+                ConversationSummary.session_id == session_id
+            ).first()
+        finally:
+            db.close()
+
+        summary = None
+        if row is not None:
+            summary = SessionSummary(row.summary, row.message_count, row.anchor)
+            self.summaries_loaded += 1
+        self._remember(key, summary)
+        return summary
+
+    def _save(self, key: Hashable, summary: SessionSummary) -> None:
+        self._remember(key, summary)
+        if not self._persisted(key):
+            return
+
+        user_id, session_id = key
+        values = {
+            "summary": summary.summary,
+            "message_count": summary.message_count,
+            "anchor": summary.anchor,
+            "updated_at": datetime.utcnow()
+        }
+        db = SessionLocal()
+        try:
+            updated = db.query(ConversationSummary).filter(
+                ConversationSummary.user_id == user_id,
+                ConversationSummary.session_id == session_id
+            ).update(values, synchronize_session=False)
+            if not updated:
+                db.add(ConversationSummary(user_id=user_id, session_id=session_id, **values))
+            try:
+                db.commit()
+                return
+            except IntegrityError:
+                db.rollback()
+        finally:
+            db.close()
+
+        # Another worker summarized the same session first; keep theirs and
+        # cache it, so this worker's context matches what is stored
+        with self._lock:
+            self._summaries.pop(key, None)
+        self._load(key)
+
+    def delete(self, key: Hashable) -> None:
+        """Forget the summary of a session."""
+        with self._lock:
+            self._summaries.pop(key, None)
+        if not self._persisted(key):
+            return
+
+        user_id, session_id = key
+        db = SessionLocal()
+        try:
+            db.query(ConversationSummary).filter(
+                ConversationSummary.user_id == user_id,
+                ConversationSummary.session_id == session_id
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def adelete(self, key: Hashable) -> None:
+        """Async variant of delete."""
+        await asyncio.to_thread(self.delete, key)
+
+    # ---------- Context building ----------
+
+    @staticmethod
+    def _boundary(summary: Optional[SessionSummary], messages: list[BaseMessage]) -> int:
+        """Index of the first message not covered by the summary."""
+        if summary is None:
+            return 0
+
+        count = summary.message_count
+        if 0 < count <= len(messages) and boundary_anchor(messages, count) == summary.anchor:
+            return count
+
+        # The history was rehydrated with a different start; search for the anchor
+        for end in range(len(messages), 0, -1):
+            if boundary_anchor(messages, end) == summary.anchor:
+                return end
+
+        # Every message in this history is newer than the summary
+        return 0
+
+    def _fold_end(self, messages: list[BaseMessage], boundary: int) -> Optional[int]:
+        """End of the range to fold into the summary, or None if it is not due yet."""
+        if len(messages) - boundary <= self.window_messages + self.step_messages:
+            return None
+        return len(messages) - self.window_messages
+
+    def _summary_prompt(self, summary: Optional[SessionSummary], folded: list[BaseMessage]) -> list[BaseMessage]:
+        prompt = ROLLING_SUMMARY_PROMPT.format(
+            summary=summary.summary if summary else "(none yet)",
+            messages=get_buffer_string(folded)
+        )
+        return [HumanMessage(content=prompt)]
+
+    def _folded(self, summary_text: str, messages: list[BaseMessage], end: int) -> SessionSummary:
+        return SessionSummary(summary_text, end, boundary_anchor(messages, end))
+
+    def _context(self, summary: Optional[SessionSummary], messages: list[BaseMessage], boundary: int) -> list[BaseMessage]:
+        """Assemble the turn's messages and record their token count."""
+        context = list(messages[boundary:])
+        if summary is not None:
+            context.insert(0, HumanMessage(content=f"{SUMMARY_PREFIX}\n\n{summary.summary}"))
+
+        sent = self.token_counter(context)
+        full = self.token_counter(messages)
+        with self._lock:
+            self.turns += 1
+            self.input_tokens += sent
+            self.history_tokens += full
+            self.max_input_tokens = max(self.max_input_tokens, sent)
+            self._recent_input_tokens.append(sent)
+        return context
+
+    def _fold_failed(self, key: Hashable, error: Exception) -> None:
+        with self._lock:
+            self.summary_failures += 1
+        # Send the unsummarized messages this turn and retry on the next one
+        print(f"Warning: Conversation summary failed for {key}: {error}")
+
+    def prepare(self, key: Optional[Hashable], messages: list[BaseMessage]) -> list[BaseMessage]:
+        """
+        Messages to send to the agent for this turn.
+
+        Args:
+            key: (user_id, session_id), or None to send the history unchanged
+            messages: The session history, ending with the new user message
+
+        Returns:
+            The rolling summary (if any) followed by the unsummarized messages
+        """
+        if key is None:
+            return self._context(None, messages, 0)
+
+        summary = self._load(key)
+        boundary = self._boundary(summary, messages)
+        end = self._fold_end(messages, boundary)
+        if end is not None:
+            prompt = self._summary_prompt(summary, messages[boundary:end])
+            try:
+                response = llm_gateway.call("summary", self.summary_model().invoke, prompt)
+                summary = self._folded(response.text, messages, end)
+                self._record_summary(prompt)
+                self._save(key, summary)
+                boundary = end
+            except Exception as e:
+                self._fold_failed(key, e)
+        return self._context(summary, messages, boundary)
+
+    async def aprepare(self, key: Optional[Hashable], messages: list[BaseMessage]) -> list[BaseMessage]:
+        """Async variant of prepare; database access runs in a worker thread."""
+        if key is None:
+            return self._context(None, messages, 0)
+
+        summary = await asyncio.to_thread(self._load, key)
+        boundary = self._boundary(summary, messages)
+        end = self._fold_end(messages, boundary)
+        if end is not None:
+            prompt = self._summary_prompt(summary, messages[boundary:end])
+            try:
+                response = await llm_gateway.acall("summary", self.summary_model().ainvoke, prompt)
+                summary = self._folded(response.text, messages, end)
+                self._record_summary(prompt)
+                await asyncio.to_thread(self._save, key, summary)
+                boundary = end
+            except Exception as e:
+                self._fold_failed(key, e)
+        return self._context(summary, messages, boundary)
+
+    # ---------- Accounting ----------
+
+    def _record_summary(self, prompt: list[BaseMessage]) -> None:
+        with self._lock:
+            self.summaries_written += 1
+            self.summary_input_tokens += self.token_counter(prompt)
+
+    def record_response(self, message) -> None:
+        """Add the provider-reported prompt tokens of a (streamed) agent message."""
+        tokens = _input_tokens(message)
+        if tokens:
+            with self._lock:
+                self.reported_input_tokens += tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent_input_tokens)
+            return {
+                "window_messages": self.window_messages,
+                "step_messages": self.step_messages,
+                "turns": self.turns,
+                "input_tokens": {
+                    "total": self.input_tokens,
+                    "average": self.input_tokens / self.turns if self.turns else 0.0,
+                    "p50": recent[len(recent) // 2] if recent else 0,
+                    "p99": recent[min(len(recent) - 1, int(len(recent) * 0.99))] if recent else 0,
+                    "max": self.max_input_tokens,
+                    "reported_total": self.reported_input_tokens
+                },
+                # What resending every session's full history would have cost
+                "full_history_tokens": self.history_tokens,
+                "tokens_saved": self.history_tokens - self.input_tokens,
+                "summaries": {
+                    "cached_sessions": len(self._summaries),
+                    "written": self.summaries_written,
+                    "failed": self.summary_failures,
+                    "loaded": self.summaries_loaded,
+                    "input_tokens": self.summary_input_tokens
+                }
+            }
+
+
+def create_context_manager(summary_model: Callable[[], BaseChatModel]) -> ConversationContextManager:
+    """Build the context manager configured through environment variables."""
+    return ConversationContextManager(
+        summary_model=summary_model,
+        window_messages=int(os.getenv("CONTEXT_WINDOW_MESSAGES", "20")),
+        step_messages=int(os.getenv("CONTEXT_SUMMARY_STEP_MESSAGES", "10")),
+        cache_size=int(os.getenv("CONTEXT_SUMMARY_CACHE_SIZE", "1000"))
+    )
@@ -0,0 +1,311 @@
+"""Bounded storage for per-session agent conversation state."""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from database import JournalEntry, SessionLocal
+
+# Approximate per-message overhead (object headers, metadata) on top of its text
+MESSAGE_OVERHEAD_BYTES = 256
+
+HistoryLoader = Callable[[Optional[int], str], list[BaseMessage]]
+
+
+def estimate_state_bytes(state: dict) -> int:
+    """Rough memory footprint of a conversation state, driven by message text."""
+    total = 0
+    for message in state.get("messages", []):
+        content = message.content
+        if isinstance(content, str):
+            total += len(content.encode("utf-8"))
+        else:
+            total += len(str(content).encode("utf-8"))
+        total += MESSAGE_OVERHEAD_BYTES
+    return total
+
+
+def load_history_from_db(user_id: Optional[int], session_id: str, limit: int = 100) -> list[BaseMessage]:
+    """
+    Rebuild a session's message history from its journal entries.
+
+    Args:
+        user_id: Owner of the session (None matches any user)
+        session_id: Chat session ID
+        limit: Maximum number of most recent entries to replay
+
+    Returns:
+        Messages in chronological order
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(
+            JournalEntry.user_message,
+            JournalEntry.ai_response
+        ).filter(JournalEntry.session_id == session_id)
+        if user_id is not None:
+            query = query.filter(JournalEntry.user_id == user_id)
+
+        rows = query.order_by(JournalEntry.created_at.desc(), JournalEntry.id.desc()).limit(limit).all()
+    finally:
+        db.close()
+
+    messages = []
+    for user_message, ai_response in reversed(rows):
+        # The greeting entry that opens a session has no user message
+        if user_message:
+            messages.append(HumanMessage(content=user_message))
+        if ai_response:
+            messages.append(AIMessage(content=ai_response))
+    return messages
+
+
+class InMemoryConversationStore:
+    """
+    LRU + TTL conversation store with a memory budget.
+
+    Keys are (user_id, session_id) tuples. Entries expire after ttl_seconds
+    without access, and the least recently used entries are evicted once
+    either max_sessions or max_bytes is exceeded. On a miss the history is
+    rebuilt through the loader (by default from journal_entries), so an
+    eviction or restart only costs one query.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        ttl_seconds: float = 3600,
+        max_bytes: int = 64 * 1024 * 1024,
+        loader: Optional[HistoryLoader] = load_history_from_db
+    ):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.loader = loader
+
+        # key -> (state, size_bytes, last_access)
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.rehydrations = 0
+        self.evictions = {"lru": 0, "ttl": 0, "memory": 0}
+
+    def _new_state(self, messages: list[BaseMessage]) -> dict:
+        return {
+            "messages": messages,
+            "validation_passed": True,
+            "validation_reason": ""
+        }
+
+    def _lookup(self, key: Hashable) -> Optional[dict]:
+        """Return the cached state on a hit, counting hits and misses."""
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            state, size, _ = entry
+            self._entries[key] = (state, size, time.monotonic())
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return state
+
+    def _load(self, key: Hashable) -> list[BaseMessage]:
+        if self.loader is None:
+            return []
+        user_id, session_id = key
+        messages = self.loader(user_id, session_id)
+        if messages:
+            self.rehydrations += 1
+        return messages
+
+    def get_or_load(self, key: Hashable) -> dict:
+        state = self._lookup(key)
+        if state is None:
+            state = self._new_state(self._load(key))
+            self.put(key, state)
+        return state
+
+    async def aget_or_load(self, key: Hashable) -> dict:
+        state = self._lookup(key)
+        if state is None:
+            # The loader hits the database, so keep it off the event loop
+            messages = await asyncio.to_thread(self._load, key)
+            state = self._new_state(messages)
+            self.put(key, state)
+        return state
+
+    def put(self, key: Hashable, state: dict) -> None:
+        size = estimate_state_bytes(state)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+
+            self._entries[key] = (state, size, time.monotonic())
+            self._bytes += size
+            self._enforce_limits(keep=key)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def _expire(self) -> None:
+        """Drop entries idle for longer than the TTL (oldest first)."""
+        if not self.ttl_seconds:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            key, (_, size, last_access) = next(iter(self._entries.items()))
+            if last_access >= cutoff:
+                break
+            self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions["ttl"] += 1
+
+    def _enforce_limits(self, keep: Hashable) -> None:
+        """Evict least recently used entries until within count and memory limits."""
+        self._expire()
+        while len(self._entries) > self.max_sessions:
+            self._evict_oldest("lru", keep)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._evict_oldest("memory", keep)
+
+    def _evict_oldest(self, reason: str, keep: Hashable) -> None:
+        key = next(iter(self._entries))
+        if key == keep:
+            # Never evict the session currently being written
+            self._entries.move_to_end(key)
+            key = next(iter(self._entries))
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        self.evictions[reason] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "sessions": len(self._entries),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "rehydrations": self.rehydrations,
+                "evictions": dict(self.evictions)
+            }
+
+
+def create_conversation_store() -> InMemoryConversationStore:
+    """Build the conversation store configured through environment variables."""
+    backend = os.getenv("CONVERSATION_STORE", "memory")
+    if backend != "memory":
+        raise ValueError(f"Unknown CONVERSATION_STORE backend: {backend}")
+
+    rehydrate_limit = int(os.getenv("CONVERSATION_REHYDRATE_LIMIT", "100"))
+    return InMemoryConversationStore(
+        max_sessions=int(os.getenv("CONVERSATION_STORE_MAX_SESSIONS", "1000")),
+        ttl_seconds=float(os.getenv("CONVERSATION_STORE_TTL_SECONDS", "3600")),
+        max_bytes=int(os.getenv("CONVERSATION_STORE_MAX_BYTES", str(64 * 1024 * 1024))),
+        loader=lambda user_id, session_id: load_history_from_db(user_id, session_id, rehydrate_limit)
+    )
+
+
+# ==================== LangGraph Checkpointer Backend ====================
+
+class CheckpointerBackend:
+    """
+    Persistent conversation state through a LangGraph checkpointer.
+
+    The compiled graph stores each (user_id, session_id) thread in SQLite or
+    Postgres, so any worker or container can continue any session. Writes are
+    batched per turn: with durability "exit" the graph persists one checkpoint
+    when the run finishes rather than one per super-step.
+    """
+
+    def __init__(self, kind: str, url: str, durability: str = "exit"):
+        if kind not in ("sqlite", "postgres"):
+            raise ValueError(f"Unknown CONVERSATION_CHECKPOINTER: {kind}")
+        self.kind = kind
+        self.url = url
+        self.durability = durability
+        self.saver = None
+        self._pool = None
+
+    async def setup(self) -> None:
+        """
+        Open connections and create checkpoint tables if needed.
+
+        The async savers bind to the running event loop, so they are built
+        here rather than at import time.
+        """
+        if self.saver is not None:
+            return
+
+        if self.kind == "sqlite":
+            import aiosqlite
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+            path = self.url.replace("sqlite:///", "", 1) if self.url.startswith("sqlite:///") else self.url
+            saver = AsyncSqliteSaver(aiosqlite.connect(path))
+        else:
+            from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+            from psycopg.rows import dict_row
+            from psycopg_pool import AsyncConnectionPool
+
+            self._pool = AsyncConnectionPool(
+                conninfo=self.url,
+                max_size=int(os.getenv("CHECKPOINTER_POOL_SIZE", "10")),
+                open=False,
+                kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row}
+            )
+            await self._pool.open()
+            saver = AsyncPostgresSaver(self._pool)
+
+        await saver.setup()
+        self.saver = saver
+
+    async def close(self) -> None:
+        """Release checkpointer connections."""
+        if self.saver is None:
+            return
+        if self._pool is not None:
+            await self._pool.close()
+        else:
+            await self.saver.conn.close()
+        self.saver = None
+
+    @staticmethod
+    def thread_config(user_id: Optional[int], session_id: str) -> dict:
+        """Graph config addressing the thread of one user's session."""
+        # user_id and session_id also address the session's rolling summary
+        return {"configurable": {"thread_id": f"{user_id}:{session_id}", "user_id": user_id, "session_id": session_id}}
+
+
+def create_checkpointer_backend() -> Optional[CheckpointerBackend]:
+    """Build the checkpointer backend if CONVERSATION_CHECKPOINTER is set."""
+    kind = os.getenv("CONVERSATION_CHECKPOINTER", "").strip().lower()
+    if not kind:
+        return None
+
+    database_url = os.getenv("DATABASE_URL", "sqlite:///./trace.db")
+    default_url = database_url if kind == "postgres" else "sqlite:///./checkpoints.db"
+    return CheckpointerBackend(
+        kind=kind,
+        url=os.getenv("CHECKPOINTER_URL", default_url),
+        durability=os.getenv("CHECKPOINTER_DURABILITY", "exit")
+    )
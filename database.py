@@ -1,25 +1,147 @@
 """Database configuration and models for Trace application."""
 import os
+import threading
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index
+from sqlalchemy import create_engine, make_url, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Index
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.pool import NullPool
-import bcrypt
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+import passwords
 
 # Get database URL from environment
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./trace.db")
 
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self._recent_waits = deque(maxlen=1024)
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        
+        # Only successful checkouts count; connect errors would skew the waits
+        wait = time.perf_counter() - start
+        with self._metrics_lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent_waits.append(wait)
+        return connection
+
+    def stats(self) -> dict:
+        with self._metrics_lock:
+            recent = sorted(self._recent_waits)
+            checkouts = self.checkouts
+            total_wait = self.total_wait
+            max_wait = self.max_wait
+            timeouts = self.timeouts
+
+        def percentile(p: float) -> float:
+            if not recent:
+                return 0.0
+            return recent[min(len(recent) - 1, int(p * len(recent)))] * 1000
+
+        return {
+            "pool_size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_ms": {
+                "average": total_wait / checkouts * 1000 if checkouts else 0.0,
+                "p50": percentile(0.50),
+                "p99": percentile(0.99),
+                "max": max_wait * 1000
+            }
+        }
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """Checkout-timing pool for the async engine."""
+
+
+def _engine_options(url: str, is_async: bool = False) -> dict:
+    """
+    Connection pool settings for the application engines.
+
+    Postgres and file-backed SQLite use an instrumented QueuePool sized by
+    DB_POOL_SIZE / DB_MAX_OVERFLOW (each engine gets its own pool). Set
+    DB_POOL_SIZE=0 to open a fresh connection per checkout instead (e.g.
+    behind an external pooler such as PgBouncer).
+    """
+    options = {}
+    if "sqlite" in url:
+        if not is_async:
+            options["connect_args"] = {"check_same_thread": False}
+        if ":memory:" in url or url.rstrip("/").endswith("sqlite:"):
+            # In-memory databases keep SQLAlchemy's single-connection pool
+            return options
+
+    pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+    if pool_size <= 0:
+        options["poolclass"] = NullPool
+        return options
+
+    options.update(
+        poolclass=InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        pool_pre_ping=os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    )
+    return options
+
+
 # Create engine
-engine = create_engine(
-    DATABASE_URL,
-    poolclass=NullPool if "postgresql" in DATABASE_URL else None,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _async_database_url(url: str) -> str:
+    """Swap the sync driver for its asyncio counterpart (asyncpg / aiosqlite)."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        return parsed.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return url
+
+
+# Async engine and session factory used by the API routes
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_database_url(DATABASE_URL))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL, is_async=True))
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Declarative base for models
 Base = declarative_base()
 
@@ -41,16 +163,16 @@ class User(Base):
     # Relationships
     sessions = relationship("Session", back_populates="user", cascade="all, delete-orphan")
     journal_entries = relationship("JournalEntry", back_populates="user", cascade="all, delete-orphan")
+    chat_sessions = relationship("ChatSession", back_populates="user", cascade="all, delete-orphan")
     
     @staticmethod
     def hash_password(password: str) -> str:
-        """Hash a password using bcrypt."""
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        """Hash a password using bcrypt (blocking; use passwords.ahash_password in async code)."""
+        return passwords.hash_password(password)
     
     def verify_password(self, password: str) -> bool:
-        """Verify a password against the hash."""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        """Verify a password against the hash (blocking; use passwords.averify_password in async code)."""
+        return passwords.verify_password(password, self.password_hash)
 
 
 class Session(Base):
@@ -87,8 +209,14 @@ class JournalEntry(Base):
     sentiment_labels = Column(Text)  # JSON string of sentiment labels
     sentiment_scores = Column(Text)  # JSON string of sentiment scores
     primary_sentiment = Column(String(50))  # Primary/dominant sentiment
+    primary_sentiment_score = Column(Float)  # Score of the primary sentiment
     sentiment_analyzed_at = Column(DateTime)  # When sentiment was analyzed
     
+    # Input validation fields (added by migrate_sentiment_columns.py, backfilled by validate_journal_entries.py)
+    validation_is_valid = Column(Boolean)  # Verdict of the input validator
+    validation_reason = Column(Text)  # Validator's explanation
+    validated_at = Column(DateTime)  # When the entry was validated
+    
     # Relationship
     user = relationship("User", back_populates="journal_entries")
     
@@ -96,13 +224,107 @@ class JournalEntry(Base):
     __table_args__ = (
         Index('idx_user_session', 'user_id', 'session_id'),
         Index('idx_user_created', 'user_id', 'created_at'),
+        Index('idx_user_sentiment_created', 'user_id', 'primary_sentiment', 'created_at'),
+    )
+
+
+class ChatSession(Base):
+    """Chat session metadata, kept in step with its journal entries on write."""
+    __tablename__ = "chat_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    session_id = Column(String(255), nullable=False)
+    title = Column(String(255))  # Derived from the first non-empty user message
+    message_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationship
+    user = relationship("User", back_populates="chat_sessions")
+    
+    __table_args__ = (
+        Index('idx_chat_session_user_session', 'user_id', 'session_id', unique=True),
+        Index('idx_chat_session_user_updated', 'user_id', 'updated_at', 'session_id'),
+    )
+
+
+class SentimentAggregate(Base):
+    """Running sentiment totals per user for a session, day or ISO week."""
+    __tablename__ = "sentiment_aggregates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    scope = Column(String(20), nullable=False)  # "session", "day" or "week"
+    scope_key = Column(String(255), nullable=False)  # session_id, "YYYY-MM-DD" or "YYYY-Www"
+    entry_count = Column(Integer, default=0, nullable=False)
+    score_sums = Column(Text)  # JSON object: sentiment group -> sum of scores
+    primary_counts = Column(Text)  # JSON object: sentiment group -> entries where it was primary
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_sentiment_aggregate_key', 'user_id', 'scope', 'scope_key', unique=True),
+    )
+
+
+class AnalysisResult(Base):
+    """Latest Trace Me analysis per user and window, with the entry-set fingerprint it was computed from."""
+    __tablename__ = "analysis_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    days = Column(Integer, nullable=False)
+    fingerprint = Column(String(128), nullable=False)
+    result = Column(Text, nullable=False)  # JSON analysis summary
+    computed_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_analysis_result_key', 'user_id', 'days', unique=True),
+    )
+
+
+class ConversationSummary(Base):
+    """Rolling summary of the older part of a chat session, as sent to the agent."""
+    __tablename__ = "conversation_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    session_id = Column(String(255), nullable=False)
+    summary = Column(Text, nullable=False)
+    message_count = Column(Integer, nullable=False)  # Messages folded into the summary
+    anchor = Column(String(64), nullable=False)  # Hash of the last folded messages
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_conversation_summary_key', 'user_id', 'session_id', unique=True),
     )
 
 
 # Create all tables
 def init_db():
-    """Initialize database tables."""
+    """Initialize database tables and add session metadata missing for older chats."""
     Base.metadata.create_all(bind=engine)
+    
+    from chat_sessions import backfill_missing_chat_sessions
+    db = SessionLocal()
+    try:
+        backfill_missing_chat_sessions(db)
+    finally:
+        db.close()
+
+
+def _pool_stats(pool) -> dict:
+    if isinstance(pool, InstrumentedQueuePool):
+        return {"pool": "queue", **pool.stats()}
+    return {"pool": type(pool).__name__, "status": pool.status()}
+
+
+def pool_stats() -> dict:
+    """Connection pool usage and checkout wait times for the sync and async engines."""
+    return {
+        "sync": _pool_stats(engine.pool),
+        "async": _pool_stats(async_engine.sync_engine.pool)
+    }
 
 
 # Dependency to get DB session
@@ -113,3 +335,10 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Dependency to get an async DB session
+async def get_async_db():
+    """Get async database session."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -33,6 +33,11 @@ CREATE TABLE IF NOT EXISTS journal_entries (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Input validation verdicts (also added to existing databases by migrate_sentiment_columns.py)
+ALTER TABLE journal_entries ADD COLUMN IF NOT EXISTS validation_is_valid BOOLEAN;
+ALTER TABLE journal_entries ADD COLUMN IF NOT EXISTS validation_reason TEXT;
+ALTER TABLE journal_entries ADD COLUMN IF NOT EXISTS validated_at TIMESTAMP;
+
 -- Create indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
@@ -0,0 +1,377 @@
+"""Input validation: local tiers (heuristics, verdict cache) and the structured LLM validator."""
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import HumanMessage
+from pydantic import BaseModel, Field
+from typing_extensions import TypedDict
+
+from llm_gateway import LLMUnavailable, llm_gateway
+from prompts.input_validation_prompt import BATCH_INPUT_VALIDATION_PROMPT, INPUT_VALIDATION_PROMPT
+
+
+class InputValidationResult(TypedDict):
+    is_valid: bool
+    reason: str
+    should_continue: bool
+    source: str  # heuristic, cache, llm or fallback (validator unavailable; worth retrying)
+
+
+def _verdict(is_valid: bool, reason: str, source: str = "heuristic") -> InputValidationResult:
+    return InputValidationResult(is_valid=is_valid, reason=reason, should_continue=is_valid, source=source)
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFKC, case-folded, single-spaced."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def text_hash(text: str) -> str:
+    """Cache key of a message: hash of its normalized text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+# ==================== Heuristics ====================
+# Each rule only claims inputs it is confident about; everything else escalates.
+
+_URL = re.compile(r"(https?://|www\.)\S+|\b[\w-]+\.(com|net|org|io|biz|xyz|shop)\b")
+_SPAM_PHRASES = re.compile(
+    r"\b(buy now|click here|limited offer|free money|discount code|promo code|act now|"
+    r"earn \$?\d+|work from home opportunity|subscribe now|order now)\b"
+)
+_INJECTION = re.compile(
+    r"\b(ignore|disregard|forget) (all |any |the |your )?(previous|prior|above|earlier) "
+    r"(instructions|prompts?|rules)\b|\byou are now\b|\bsystem prompt\b|\bjailbreak\b|"
+    r"\b(approve|accept) (everything|all inputs?)\b"
+)
+# Openers addressed to an assistant rather than to oneself
+_ASSISTANT_OPENER = re.compile(
+    r"^(can you|could you|would you|will you|please|tell me|give me|show me|write|translate|"
+    r"calculate|explain|define|summarize|generate|list|what is|what's|who is|how do you|how to)\b"
+)
+_FIRST_PERSON = re.compile(r"\b(i|i'm|im|i've|i'd|i'll|me|my|mine|myself|we|our|us)\b")
+_SECOND_PERSON = re.compile(r"\b(you|your|yours|yourself|u)\b")
+_WORD = re.compile(r"[^\W\d_]+")
+_VOWELS = set("aeiouyàáâäèéêëìíîïòóôöùúûü")
+
+
+def _is_gibberish(text: str) -> bool:
+    """Keyboard mashing or a repeated character, in Latin-script text."""
+    compact = text.replace(" ", "")
+    if len(compact) >= 5 and len(set(compact)) == 1:
+        return True
+
+    words = _WORD.findall(text)
+    if not words or not all(word.isascii() for word in words):
+        # Other scripts have no vowel signal to go on
+        return False
+    long_words = [word for word in words if len(word) >= 6]
+    if not long_words or len(long_words) < len(words) / 2:
+        return False
+    voiceless = [word for word in long_words if not _VOWELS.intersection(word) or re.search(r"[^aeiouy]{6,}", word)]
+    return len(voiceless) == len(long_words)
+
+
+def heuristic_verdict(text: str) -> tuple[Optional[InputValidationResult], str]:
+    """
+    Decide the obvious cases without a model.
+
+    Returns:
+        Tuple of (verdict or None when the input is ambiguous, rule name)
+    """
+    normalized = normalize_text(text)
+    if not normalized:
+        return _verdict(False, "Empty message"), "empty"
+
+    if not _WORD.search(normalized):
+        # Emojis and "..." can be valid expressions, but so can "$$$ 100%" be noise;
+        # nothing is accepted locally without at least one word
+        return None, "ambiguous"
+
+    if _INJECTION.search(normalized):
+        return _verdict(False, "Attempts to manipulate the validator"), "injection"
+
+    if _URL.search(normalized) and _SPAM_PHRASES.search(normalized):
+        return _verdict(False, "Promotional content"), "spam"
+
+    if _is_gibberish(normalized):
+        return _verdict(False, "Message has no discernible meaning"), "gibberish"
+
+    words = _WORD.findall(normalized)
+    if (
+        len(words) >= 3
+        and _FIRST_PERSON.search(normalized)
+        and "?" not in normalized
+        and not _SECOND_PERSON.search(normalized)
+        and not _URL.search(normalized)
+        and not _ASSISTANT_OPENER.match(normalized)
+    ):
+        return _verdict(True, "Personal reflection"), "first_person"
+
+    return None, "ambiguous"
+
+
+# ==================== Tiered Validator ====================
+
+class TieredInputValidator:
+    """
+    Decides what it can locally and tells the caller when to ask the LLM.
+
+    Tier 1 is heuristic_verdict (microseconds). Tier 2 is an LRU cache of
+    earlier LLM verdicts keyed by the hash of the normalized text. Only
+    inputs that miss both are escalated; the caller stores the LLM verdict
+    back with remember().
+    """
+
+    def __init__(self, cache_size: int = 10000, heuristics: bool = True):
+        self.cache_size = cache_size
+        self.heuristics = heuristics
+
+        self._cache: OrderedDict = OrderedDict()  # text hash -> InputValidationResult
+        self._lock = threading.Lock()
+
+        self.checks = 0
+        self.local = {"valid": 0, "invalid": 0}
+        self.rules: dict = {}
+        self.cache_hits = 0
+        self.escalations = 0
+
+    def check(self, text: str) -> Optional[InputValidationResult]:
+        """Return a local verdict, or None if the input must go to the LLM."""
+        if self.heuristics:
+            verdict, rule = heuristic_verdict(text)
+        else:
+            verdict, rule = None, "disabled"
+
+        if verdict is not None:
+            with self._lock:
+                self.checks += 1
+                self.rules[rule] = self.rules.get(rule, 0) + 1
+                self.local["valid" if verdict["is_valid"] else "invalid"] += 1
+            return verdict
+
+        key = text_hash(text)
+        with self._lock:
+            self.checks += 1
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return {**cached, "source": "cache"}
+
+            self.escalations += 1
+            return None
+
+    def remember(self, text: str, verdict: InputValidationResult) -> None:
+        """Cache an LLM verdict for the normalized text."""
+        key = text_hash(text)
+        with self._lock:
+            self._cache[key] = verdict
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "heuristics": self.heuristics,
+                "checks": self.checks,
+                "local": dict(self.local),
+                "rules": dict(self.rules),
+                "cache_size": len(self._cache),
+                "cache_hits": self.cache_hits,
+                "escalations": self.escalations,
+                "escalation_rate": self.escalations / self.checks if self.checks else 0.0
+            }
+
+
+# ==================== Structured LLM Validator ====================
+
+class ValidationVerdict(BaseModel):
+    """Verdict on one user input."""
+    is_valid: bool = Field(description="Whether the input is valid journaling content")
+    reason: str = Field(description="Brief explanation")
+
+
+class IndexedValidationVerdict(ValidationVerdict):
+    """Verdict on one input of a batch."""
+    index: int = Field(description="Index of the input this verdict is for")
+
+
+class BatchValidationVerdicts(BaseModel):
+    """Verdicts on a batch of user inputs, one per input."""
+    verdicts: list[IndexedValidationVerdict]
+
+
+class ValidationUnavailable(Exception):
+    """The LLM produced no usable verdict within the retry budget."""
+
+
+class StructuredInputValidator:
+    """
+    LLM validator constrained to the ValidationVerdict schema.
+
+    Each call gets 1 + max_retries attempts. An attempt fails when the model
+    errors or its output does not parse into the schema; both are counted.
+    Once the budget is spent ValidationUnavailable is raised, so callers can
+    tell "invalid" from "could not validate" instead of silently passing.
+    Calls go through llm_gateway, which already retries rate-limit and
+    server errors; when it gives up the remaining attempts are skipped.
+
+    validate_batch judges up to batch_size inputs per call, which is how the
+    backfill over stored journal entries stays at a few calls per thousand
+    messages.
+    """
+
+    def __init__(self, model: Callable[[], BaseChatModel], max_retries: int = 2, batch_size: int = 20):
+        self.model = model
+        self.max_retries = max_retries
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "parse_failures": 0,
+            "errors": 0,
+            "exhausted": 0,
+            "batch_calls": 0,
+            "batched_inputs": 0
+        }
+
+    def _count(self, **counters: int) -> None:
+        with self._lock:
+            for name, value in counters.items():
+                self._stats[name] += value
+
+    def _structured(self, schema: type[BaseModel]):
+        # include_raw returns parse errors instead of raising, so they can be counted and retried
+        return self.model().with_structured_output(schema, include_raw=True)
+
+    def _attempt_result(self, output: dict) -> Optional[BaseModel]:
+        if output.get("parsed") is None:
+            self._count(parse_failures=1)
+            return None
+        return output["parsed"]
+
+    def _attempt_failed(self, attempt: int, error: Exception) -> None:
+        self._count(errors=1)
+        print(f"Warning: Validation attempt {attempt + 1} failed: {type(error).__name__}: {error}")
+
+    def _exhausted(self) -> ValidationUnavailable:
+        self._count(exhausted=1)
+        return ValidationUnavailable(f"No valid verdict after {self.max_retries + 1} attempts")
+
+    @staticmethod
+    def _single_prompt(text: str) -> list[HumanMessage]:
+        return [HumanMessage(content=INPUT_VALIDATION_PROMPT.format(user_message=text))]
+
+    @staticmethod
+    def _to_result(verdict: ValidationVerdict) -> InputValidationResult:
+        return _verdict(verdict.is_valid, verdict.reason, source="llm")
+
+    def validate(self, text: str) -> InputValidationResult:
+        """Validate one input; raises ValidationUnavailable once the retry budget is spent."""
+        self._count(calls=1)
+        structured = self._structured(ValidationVerdict)
+        for attempt in range(self.max_retries + 1):
+            self._count(attempts=1, retries=1 if attempt else 0)
+            try:
+                parsed = self._attempt_result(llm_gateway.call("validation", structured.invoke, self._single_prompt(text)))
+            except LLMUnavailable as e:
+                self._attempt_failed(attempt, e)
+                break
+            except Exception as e:
+                self._attempt_failed(attempt, e)
+                continue
+            if parsed is not None:
+                return self._to_result(parsed)
+        raise self._exhausted()
+
+    async def avalidate(self, text: str) -> InputValidationResult:
+        """Async variant of validate."""
+        self._count(calls=1)
+        structured = self._structured(ValidationVerdict)
+        for attempt in range(self.max_retries + 1):
+            self._count(attempts=1, retries=1 if attempt else 0)
+            try:
+                parsed = self._attempt_result(await llm_gateway.acall("validation", structured.ainvoke, self._single_prompt(text)))
+            except LLMUnavailable as e:
+                self._attempt_failed(attempt, e)
+                break
+            except Exception as e:
+                self._attempt_failed(attempt, e)
+                continue
+            if parsed is not None:
+                return self._to_result(parsed)
+        raise self._exhausted()
+
+    def validate_batch(self, texts: list[str]) -> list[Optional[InputValidationResult]]:
+        """
+        Validate many inputs with one LLM call per batch_size inputs.
+
+        Inputs the model skipped or answered unparseably are retried (only
+        those) within the retry budget.
+
+        Returns:
+            One result per input, in order; None where no verdict was obtained
+        """
+        results: list[Optional[InputValidationResult]] = [None] * len(texts)
+        structured = self._structured(BatchValidationVerdicts)
+        for start in range(0, len(texts), self.batch_size):
+            pending = list(range(start, min(start + self.batch_size, len(texts))))
+            self._count(calls=1, batch_calls=1, batched_inputs=len(pending))
+            for attempt in range(self.max_retries + 1):
+                if not pending:
+                    break
+                self._count(attempts=1, retries=1 if attempt else 0)
+                numbered = "\n".join(f'<input index="{i}">\n{texts[i]}\n</input>' for i in pending)
+                prompt = BATCH_INPUT_VALIDATION_PROMPT.format(user_messages=numbered)
+                try:
+                    parsed = self._attempt_result(llm_gateway.call("validation", structured.invoke, [HumanMessage(content=prompt)]))
+                except LLMUnavailable as e:
+                    self._attempt_failed(attempt, e)
+                    break
+                except Exception as e:
+                    self._attempt_failed(attempt, e)
+                    continue
+                if parsed is None:
+                    continue
+                for verdict in parsed.verdicts:
+                    if verdict.index in pending:
+                        results[verdict.index] = self._to_result(verdict)
+                missing = [i for i in pending if results[i] is None]
+                if missing:
+                    # Verdicts were dropped for some inputs; ask again for just those
+                    self._count(parse_failures=1)
+                pending = missing
+            if pending:
+                self._exhausted()
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            "max_retries": self.max_retries,
+            "batch_size": self.batch_size,
+            **stats,
+            "parse_failure_rate": stats["parse_failures"] / stats["attempts"] if stats["attempts"] else 0.0
+        }
+
+
+input_validator = TieredInputValidator(
+    cache_size=int(os.getenv("INPUT_VALIDATION_CACHE_SIZE", "10000")),
+    heuristics=os.getenv("INPUT_VALIDATION_HEURISTICS", "true").lower() in ("1", "true", "yes")
+)
+
+
+def input_validation_stats() -> dict:
+    """Counters for the local validation tiers."""
+    return input_validator.stats()
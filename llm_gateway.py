@@ -0,0 +1,626 @@
+"""Shared gateway for Gemini calls: rate limiting, retries with backoff, a concurrency cap and a circuit breaker."""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+from langchain.agents.middleware import AgentMiddleware
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+# HTTP codes, status names (as Gemini reports them next to the code) and
+# exception types of transient provider errors
+RATE_LIMIT_STATUS_CODES = {429}
+SERVER_STATUS_CODES = {500, 502, 503, 504}
+RATE_LIMIT_STATUSES = {"RESOURCE_EXHAUSTED"}
+SERVER_STATUSES = {"INTERNAL", "UNAVAILABLE", "DEADLINE_EXCEEDED"}
+TRANSIENT_EXCEPTIONS = (TimeoutError, ConnectionError, httpx.TimeoutException, httpx.NetworkError)
+
+# Fallback for errors without a status: a code followed by its status name, or the name alone
+_RATE_LIMIT_TEXT = re.compile(r"\b429\b[\s:.,-]+(?:RESOURCE_EXHAUSTED|Too Many Requests)\b|\bRESOURCE_EXHAUSTED\b")
+_SERVER_TEXT = re.compile(
+    r"\b50[0234]\b[\s:.,-]+(?:INTERNAL|UNAVAILABLE|DEADLINE_EXCEEDED|Internal Server Error|Bad Gateway|Service Unavailable|Gateway Timeout)\b"
+    r"|\b(?:UNAVAILABLE|DEADLINE_EXCEEDED)\b"
+)
+
+# Gemini reports how long to back off as e.g. 'retryDelay': '17s'
+_RETRY_DELAY = re.compile(r"retry[_ ]?delay\W+(\d+(?:\.\d+)?)s", re.IGNORECASE)
+
+
+class LLMUnavailable(Exception):
+    """
+    The gateway gave up on a call: the circuit is open, the queue wait ran
+    out or the retry budget was spent on transient errors.
+
+    retry_after is a hint, in seconds, for when a new call is likely to be served.
+    """
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class StreamInterrupted(Exception):
+    """The provider failed after part of the reply was streamed; a retry would repeat that part."""
+
+
+def _error_chain(error: BaseException):
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+
+def _classify_status(error: BaseException) -> Optional[str]:
+    code = _status_code(error)
+    status = getattr(error, "status", None)
+    if code in RATE_LIMIT_STATUS_CODES or status in RATE_LIMIT_STATUSES:
+        return "rate_limit"
+    if code in SERVER_STATUS_CODES or status in SERVER_STATUSES or isinstance(error, TRANSIENT_EXCEPTIONS):
+        return "server"
+    return None
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """
+    Kind of transient failure an LLM error represents.
+
+    The status code, status name and exception type of the error and its
+    causes decide; the message text is only consulted when none of them is
+    known, and then only for a status as the provider formats it.
+
+    Returns:
+        "rate_limit" for quota errors (429), "server" for overload, 5xx,
+        timeouts and connection failures, or None for errors that a retry
+        would not fix (bad request, authentication, a call the gateway
+        already gave up on, ...)
+    """
+    chain = list(_error_chain(error))
+    if any(isinstance(cause, LLMUnavailable) for cause in chain):
+        return None
+    for cause in chain:
+        kind = _classify_status(cause)
+        if kind is not None:
+            return kind
+    if any(_status_code(cause) is not None for cause in chain):
+        # A status that is not transient (400, 401, 404, ...)
+        return None
+
+    message = str(error)
+    if _RATE_LIMIT_TEXT.search(message):
+        return "rate_limit"
+    if _SERVER_TEXT.search(message):
+        return "server"
+    return None
+
+
+def retry_delay_hint(error: BaseException) -> float:
+    """Back-off delay requested by the provider in the error, or 0 if none was given."""
+    match = _RETRY_DELAY.search(str(error))
+    return float(match.group(1)) if match else 0.0
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations instead of refusing.
+
+    A caller takes a token even when none is left and is told how long to
+    wait for it, so waiting callers are served in arrival order at the
+    configured rate. A rate of 0 disables the limiter.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """
+        Take a token.
+
+        Returns:
+            Seconds to wait before using it, or None (and nothing is taken)
+            if that would be longer than max_wait
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def next_token_in(self) -> float:
+        """Seconds until a new reservation would be served."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def drain(self) -> None:
+        """Drop the burst allowance after the provider rejected a call for quota."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while the provider is down.
+
+    Opens after failure_threshold consecutive server failures. After
+    reset_seconds one trial call is let through (half-open): success closes
+    the circuit, failure opens it for another reset_seconds. A threshold of
+    0 disables the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> Optional[float]:
+        """None if a call may go ahead, otherwise seconds until the next trial call."""
+        if self.failure_threshold <= 0:
+            return None
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_seconds - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    return remaining
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self.rejected += 1
+                    return self.reset_seconds
+                self._trial_in_flight = True
+            return None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def cancel_trial(self) -> None:
+        """Hand back a trial call that allow() granted but was never made."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "opened": self.opened,
+                "rejected": self.rejected
+            }
+
+
+def _hand_over(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(True)
+
+
+class _Slots:
+    """
+    Concurrency cap shared by threads and event loops.
+
+    Threads wait on a condition. Coroutines wait on a future of their own
+    loop; release() hands a freed slot straight to the oldest of them, so
+    nobody polls and a slot cannot be taken in between.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._condition = threading.Condition()
+        self._async_waiters: deque = deque()  # (loop, future)
+
+    def _take(self) -> bool:
+        if self.limit > 0 and self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return True
+
+    def acquire(self, timeout: float) -> bool:
+        with self._condition:
+            return self._condition.wait_for(self._take, timeout=max(0.0, timeout))
+
+    async def aacquire(self, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            if self._take():
+                return True
+            waiter = (loop, loop.create_future())
+            self._async_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), timeout=max(0.0, timeout))
+            return True
+        except BaseException as e:
+            with self._condition:
+                handed_over = waiter not in self._async_waiters
+                if not handed_over:
+                    self._async_waiters.remove(waiter)
+            if handed_over:
+                # release() picked this waiter just as it gave up; the slot is ours
+                if isinstance(e, asyncio.TimeoutError):
+                    return True
+                self.release()
+                raise
+            if isinstance(e, asyncio.TimeoutError):
+                return False
+            raise
+
+    def release(self) -> None:
+        with self._condition:
+            while self._async_waiters:
+                loop, waiter = self._async_waiters.popleft()
+                try:
+                    # in_flight is unchanged: the slot passes to the waiter
+                    loop.call_soon_threadsafe(_hand_over, waiter)
+                    return
+                except RuntimeError:
+                    # The waiter's event loop has been closed
+                    continue
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+class LLMGateway:
+    """
+    Admission control and retries for every call to the LLM provider.
+
+    Each attempt first passes the circuit breaker, then takes a token from
+    the rate limiter and a concurrency slot, waiting for either if needed.
+    Rate-limit errors (429) drain the limiter's burst so the callers behind
+    them slow down, and are retried with jittered exponential backoff (or the
+    delay the provider asks for, if longer). Server errors are retried the
+    same way and count towards opening the circuit. Other errors are raised
+    unchanged.
+
+    A call spends at most queue_timeout seconds waiting in total (queueing
+    plus backoff); beyond that, or once max_retries is spent, LLMUnavailable
+    is raised. Under quota pressure calls therefore queue briefly instead
+    of failing straight away.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 300,
+        burst: int = 20,
+        max_concurrency: int = 8,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        queue_timeout: float = 20.0,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(requests_per_minute / 60, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self._slots = _Slots(max_concurrency)
+        self._lock = threading.Lock()
+        self._callers: dict[str, dict] = {}
+        self._queue = {"waits": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "timeouts": 0}
+
+    # ---------- Accounting ----------
+
+    def _count(self, caller: str, **counters: int) -> None:
+        with self._lock:
+            stats = self._callers.setdefault(caller, {
+                "calls": 0,
+                "attempts": 0,
+                "successes": 0,
+                "retries": 0,
+                "rate_limited": 0,
+                "server_errors": 0,
+                "other_errors": 0,
+                "interrupted": 0,
+                "gave_up": 0
+            })
+            for name, value in counters.items():
+                stats[name] += value
+
+    def _waited(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._queue["waits"] += 1
+            self._queue["wait_seconds"] += seconds
+            self._queue["max_wait_seconds"] = max(self._queue["max_wait_seconds"], seconds)
+
+    def _give_up(self, caller: str, reason: str, retry_after: float, timeout: bool = False) -> LLMUnavailable:
+        self._count(caller, gave_up=1)
+        if timeout:
+            with self._lock:
+                self._queue["timeouts"] += 1
+        return LLMUnavailable(f"LLM unavailable for {caller}: {reason}", retry_after=retry_after)
+
+    # ---------- Attempt lifecycle ----------
+
+    def _admit(self, caller: str, budget: float) -> float:
+        """Pass the breaker and reserve a rate-limit token; returns the wait for the token."""
+        retry_after = self.breaker.allow()
+        if retry_after is not None:
+            raise self._give_up(caller, "circuit open", retry_after)
+        wait = self.bucket.reserve(budget)
+        if wait is None:
+            self.breaker.cancel_trial()
+            raise self._give_up(caller, "rate limit queue full", self.bucket.next_token_in(), timeout=True)
+        self._count(caller, attempts=1)
+        return wait
+
+    def _no_slot(self, caller: str) -> LLMUnavailable:
+        self.breaker.cancel_trial()
+        return self._give_up(caller, f"all {self._slots.limit} concurrent slots busy", self.backoff_base, timeout=True)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter keeps callers that failed together from retrying together
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return min(self.backoff_max, max(delay, retry_delay_hint(error)))
+
+    def _retry_delay(self, caller: str, attempt: int, error: Exception, budget: float) -> float:
+        """Record a failed attempt; returns the backoff before the next one or raises."""
+        kind = classify_error(error)
+        if kind is None:
+            # The provider answered; the request itself is at fault
+            self.breaker.record_success()
+            self._count(caller, other_errors=1)
+            raise error
+        if kind == "rate_limit":
+            self.bucket.drain()
+            self.breaker.record_success()
+            self._count(caller, rate_limited=1)
+        else:
+            self.breaker.record_failure()
+            self._count(caller, server_errors=1)
+
+        delay = self._backoff(attempt, error)
+        if isinstance(error, StreamInterrupted):
+            self._count(caller, interrupted=1)
+            raise self._give_up(caller, f"{kind} error after the reply started streaming", delay) from error
+        if attempt >= self.max_retries:
+            raise self._give_up(caller, f"{kind} errors after {attempt + 1} attempts", delay) from error
+        if delay > budget:
+            raise self._give_up(caller, f"{kind} error and backoff exceeds the queue timeout", delay, timeout=True) from error
+        self._count(caller, retries=1)
+        print(f"Warning: LLM {kind} error for {caller}, retrying in {delay:.1f}s: {type(error).__name__}")
+        return delay
+
+    def _succeeded(self, caller: str) -> None:
+        self.breaker.record_success()
+        self._count(caller, successes=1)
+
+    # ---------- Calls ----------
+
+    def call(self, caller: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) under the gateway's limits.
+
+        Args:
+            caller: Label the call is counted under in stats()
+            fn: The provider call, e.g. model.invoke
+
+        Returns:
+            fn's result
+        """
+        self._count(caller, calls=1)
+        waited = 0.0
+        attempt = 0
+        while True:
+            wait = self._admit(caller, self.queue_timeout - waited)
+            if wait:
+                time.sleep(wait)
+            start = time.monotonic()
+            if not self._slots.acquire(self.queue_timeout - waited - wait):
+                raise self._no_slot(caller)
+            wait += time.monotonic() - start
+            self._waited(wait)
+            waited += wait
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(caller, attempt, e, self.queue_timeout - waited)
+            except BaseException:
+                # Interrupted (e.g. the stream was closed); the outcome says nothing about the provider
+                self.breaker.cancel_trial()
+                raise
+            else:
+                self._succeeded(caller)
+                return result
+            finally:
+                self._slots.release()
+            time.sleep(delay)
+            waited += delay
+            attempt += 1
+
+    async def acall(self, caller: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Async variant of call; fn returns an awaitable, e.g. model.ainvoke."""
+        self._count(caller, calls=1)
+        waited = 0.0
+        attempt = 0
+        while True:
+            wait = self._admit(caller, self.queue_timeout - waited)
+            if wait:
+                await asyncio.sleep(wait)
+            start = time.monotonic()
+            if not await self._slots.aacquire(self.queue_timeout - waited - wait):
+                raise self._no_slot(caller)
+            wait += time.monotonic() - start
+            self._waited(wait)
+            waited += wait
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(caller, attempt, e, self.queue_timeout - waited)
+            except BaseException:
+                # Cancelled (e.g. a rejected speculative generation)
+                self.breaker.cancel_trial()
+                raise
+            else:
+                self._succeeded(caller)
+                return result
+            finally:
+                self._slots.release()
+            await asyncio.sleep(delay)
+            waited += delay
+            attempt += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            callers = {caller: dict(stats) for caller, stats in self._callers.items()}
+            queue = dict(self._queue)
+        queue["average_wait_seconds"] = queue["wait_seconds"] / queue["waits"] if queue["waits"] else 0.0
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "burst": self.bucket.capacity,
+            "max_concurrency": self._slots.limit,
+            "max_retries": self.max_retries,
+            "queue_timeout_seconds": self.queue_timeout,
+            "in_flight": self._slots.in_flight,
+            "max_in_flight": self._slots.max_in_flight,
+            "queue": queue,
+            "circuit": self.breaker.stats(),
+            "callers": callers
+        }
+
+
+class _StreamWatcher(BaseCallbackHandler):
+    """Notes whether a model call has emitted any token yet."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.emitted = False
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.emitted = True
+
+
+# Added to the callbacks of every run started while it is set, including the
+# model call inside an agent's model node
+_stream_watcher: ContextVar[Optional[_StreamWatcher]] = ContextVar("llm_gateway_stream_watcher", default=None)
+register_configure_hook(_stream_watcher, inheritable=True)
+
+
+class GatewayMiddleware(AgentMiddleware):
+    """
+    Agent middleware that sends every model call of the agent through a gateway.
+
+    Streamed tokens reach the client as they are generated, so a call that
+    fails after its first token is not retried (the retry would repeat the
+    tokens already sent); it fails with LLMUnavailable instead.
+    """
+
+    def __init__(self, gateway: LLMGateway, caller: str):
+        super().__init__()
+        self.gateway = gateway
+        self.caller = caller
+
+    @staticmethod
+    def _retryable(watcher: _StreamWatcher, error: Exception) -> bool:
+        return not (watcher.emitted and classify_error(error) is not None)
+
+    def _attempt(self, request, handler):
+        watcher = _StreamWatcher()
+        token = _stream_watcher.set(watcher)
+        try:
+            return handler(request)
+        except Exception as e:
+            if self._retryable(watcher, e):
+                raise
+            raise StreamInterrupted(f"Model call failed after streaming began: {type(e).__name__}: {e}") from e
+        finally:
+            _stream_watcher.reset(token)
+
+    async def _aattempt(self, request, handler):
+        watcher = _StreamWatcher()
+        token = _stream_watcher.set(watcher)
+        try:
+            return await handler(request)
+        except Exception as e:
+            if self._retryable(watcher, e):
+                raise
+            raise StreamInterrupted(f"Model call failed after streaming began: {type(e).__name__}: {e}") from e
+        finally:
+            _stream_watcher.reset(token)
+
+    def wrap_model_call(self, request, handler):
+        return self.gateway.call(self.caller, self._attempt, request, handler)
+
+    async def awrap_model_call(self, request, handler):
+        return await self.gateway.acall(self.caller, self._aattempt, request, handler)
+
+
+# One gateway for the chat, validation and analysis clients: they share the Gemini quota
+llm_gateway = LLMGateway(
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "300")),
+    burst=int(os.getenv("LLM_BURST", "20")),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+    backoff_base=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5")),
+    backoff_max=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "20")),
+    failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5")),
+    reset_seconds=float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+)
+
+
+def llm_gateway_stats() -> dict:
+    """Counters of the shared LLM gateway."""
+    return llm_gateway.stats()
@@ -1,14 +1,18 @@
 """FastAPI application setup and initialization."""
+import math
 import sys
-import time
+import uuid
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from database import init_db
-from routes import auth_router, chat_router, journal_router
-from agent_core import AgentState, graph
+from routes import auth_router, chat_router, journal_router, metrics_router
+from agent_core import AgentState, get_graph, setup_conversation_backend, close_conversation_backend
+from conversation_context import context_config
+from llm_gateway import LLMUnavailable
+from analysis_jobs import analysis_jobs
 from langchain_core.messages import HumanMessage
 
 load_dotenv()
@@ -32,6 +36,20 @@ app.add_middleware(
 app.include_router(auth_router)
 app.include_router(chat_router)
 app.include_router(journal_router)
+app.include_router(metrics_router)
+
+
+@app.on_event("startup")
+async def startup():
+    """Open connections held for the lifetime of the app."""
+    await setup_conversation_backend()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close connections opened on startup and stop background workers."""
+    await close_conversation_backend()
+    analysis_jobs.shutdown()
 
 
 # ==================== Health Check ====================
@@ -51,6 +69,8 @@ def journaling_conversation():
         validation_passed=True,
         validation_reason=""
     )
+    # Anonymous session: the rolling summary is kept in memory only
+    config = context_config(None, f"cli_{uuid.uuid4().hex}")
     
     print("\n🌿 Welcome to Trace - Your Journaling Companion 🌿")
     print("=" * 50)
@@ -76,17 +96,14 @@ def journaling_conversation():
             
             try:
                 # Process through the graph
-                output = graph.invoke(conversation_state)
-                conversation_state["messages"].extend(output["messages"])
+                output = get_graph().invoke(conversation_state, config=config)
+                conversation_state["messages"] = output["messages"]
                 
-            except Exception as e:
-                if "429" in str(e) or "too many requests" in str(e).lower():
-                    print("\n⏳ Rate limit reached. Waiting before retry...")
-                    time.sleep(5)  # Wait 5 seconds before retrying
-                    print("You: ", end="")
-                    continue
-                else:
-                    raise
+            except LLMUnavailable as e:
+                # The gateway already queued and retried; drop the message so it can be sent again
+                conversation_state["messages"].pop()
+                print(f"\n⏳ Trace is busy right now. Please try again in {max(1, math.ceil(e.retry_after))}s.\n")
+                continue
             
             print("\n")
             
@@ -1,4 +1,5 @@
-"""Database migration to add sentiment analysis columns to journal_entries."""
+"""Database migrations to add sentiment analysis and input validation columns to journal_entries, and build sentiment aggregates."""
+import json
 import os
 from sqlalchemy import create_engine, text
 
@@ -60,5 +61,131 @@ def migrate():
                 print(f"Error during migration: {str(e)}")
                 raise
 
+def backfill_primary_scores(conn, batch_size: int = 1000) -> int:
+    """
+    Fill primary_sentiment_score for entries labelled before the column existed.
+    
+    The score is read from the entry's stored sentiment_scores JSON. Pages
+    are read by id, so entries whose JSON lacks the primary score are not
+    revisited.
+    
+    Returns:
+        Number of entries updated
+    """
+    last_id = 0
+    updated = 0
+    while True:
+        rows = conn.execute(text("""
+            SELECT id, sentiment_scores, primary_sentiment
+            FROM journal_entries
+            WHERE primary_sentiment_score IS NULL
+              AND primary_sentiment IS NOT NULL
+              AND sentiment_scores IS NOT NULL
+              AND id > :last_id
+            ORDER BY id
+            LIMIT :batch_size
+        """), {"last_id": last_id, "batch_size": batch_size}).all()
+        if not rows:
+            break
+        
+        scores = []
+        for row in rows:
+            score = json.loads(row.sentiment_scores).get(row.primary_sentiment)
+            if score is not None:
+                scores.append({"id": row.id, "score": score})
+        if scores:
+            conn.execute(text("UPDATE journal_entries SET primary_sentiment_score = :score WHERE id = :id"), scores)
+        conn.commit()
+        
+        last_id = rows[-1].id
+        updated += len(scores)
+    return updated
+
+def migrate_distribution():
+    """Add the primary sentiment score column and the distribution index, and backfill the score."""
+    print("Running sentiment distribution migration...")
+    
+    with engine.connect() as conn:
+        try:
+            if "postgresql" in DATABASE_URL:
+                conn.execute(text("""
+                    ALTER TABLE journal_entries
+                    ADD COLUMN IF NOT EXISTS primary_sentiment_score DOUBLE PRECISION
+                """))
+            else:
+                try:
+                    conn.execute(text("""
+                        ALTER TABLE journal_entries ADD COLUMN primary_sentiment_score FLOAT
+                    """))
+                except Exception as e:
+                    if "duplicate column" not in str(e).lower():
+                        raise
+                    print("Column primary_sentiment_score already exists.")
+            
+            # Same syntax on PostgreSQL and SQLite
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_user_sentiment_created
+                ON journal_entries (user_id, primary_sentiment, created_at)
+            """))
+            conn.commit()
+            
+            # Without this, average scores would only cover entries labelled after the migration
+            print(f"Backfilled primary_sentiment_score for {backfill_primary_scores(conn)} entries")
+            
+            print("✓ Distribution migration completed successfully!")
+            
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+def migrate_validation():
+    """Add the input validation verdict columns."""
+    print("Running input validation migration...")
+    
+    columns = {
+        "validation_is_valid": "BOOLEAN",
+        "validation_reason": "TEXT",
+        "validated_at": "TIMESTAMP"
+    }
+    with engine.connect() as conn:
+        try:
+            for column, column_type in columns.items():
+                if "postgresql" in DATABASE_URL:
+                    conn.execute(text(f"ALTER TABLE journal_entries ADD COLUMN IF NOT EXISTS {column} {column_type}"))
+                else:
+                    try:
+                        conn.execute(text(f"ALTER TABLE journal_entries ADD COLUMN {column} {column_type}"))
+                    except Exception as e:
+                        if "duplicate column" not in str(e).lower():
+                            raise
+                        print(f"Column {column} already exists.")
+            conn.commit()
+            
+            print("✓ Input validation migration completed successfully!")
+            
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            raise
+
+def migrate_aggregates():
+    """Create the sentiment aggregates table and fill it from entries labelled before it existed."""
+    from database import SessionLocal, SentimentAggregate, init_db
+    from sentiment_stats import rebuild_sentiment_aggregates
+    
+    print("Running sentiment aggregates migration...")
+    init_db()
+    db = SessionLocal()
+    try:
+        if db.query(SentimentAggregate.id).first() is not None:
+            print("Sentiment aggregates already exist. Skipping rebuild.")
+            return
+        count = rebuild_sentiment_aggregates(db)
+        print(f"✓ Built sentiment aggregates from {count} labelled entries")
+    finally:
+        db.close()
+
 if __name__ == "__main__":
     migrate()
+    migrate_distribution()
+    migrate_validation()
+    migrate_aggregates()
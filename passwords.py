@@ -0,0 +1,82 @@
+"""Password hashing on a bounded worker pool."""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# bcrypt cost factor for new hashes; existing hashes are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Maximum number of hashes computed at once. bcrypt releases the GIL, so
+# this is effectively the number of CPU cores spent on password work.
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", str(os.cpu_count() or 4)))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="bcrypt")
+_stats_lock = threading.Lock()
+_stats = {"hashes": 0, "verifications": 0, "rehashes": 0, "in_flight": 0}
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    """Hash a password using bcrypt."""
+    salt = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """Verify a password against a bcrypt hash."""
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+def hash_rounds(password_hash: str) -> int:
+    """Cost factor stored in a bcrypt hash ("$2b$<rounds>$...")."""
+    return int(password_hash.split("$")[2])
+
+
+def needs_rehash(password_hash: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    """Whether a hash was produced with a different cost factor than configured."""
+    try:
+        return hash_rounds(password_hash) != rounds
+    except (IndexError, ValueError):
+        return True
+
+
+async def _run(counter: str, fn, *args):
+    with _stats_lock:
+        _stats[counter] += 1
+        _stats["in_flight"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        with _stats_lock:
+            _stats["in_flight"] -= 1
+
+
+async def ahash_password(password: str) -> str:
+    """Hash a password on the bcrypt pool without blocking the event loop."""
+    return await _run("hashes", hash_password, password)
+
+
+async def averify_password(password: str, password_hash: str) -> bool:
+    """Verify a password on the bcrypt pool without blocking the event loop."""
+    return await _run("verifications", verify_password, password, password_hash)
+
+
+async def arehash_if_needed(password: str, password_hash: str) -> str | None:
+    """
+    Return a new hash at the configured cost if the stored one is outdated.
+
+    Call only after the password has been verified against password_hash.
+    Returns None when the stored hash is already current.
+    """
+    if not needs_rehash(password_hash):
+        return None
+    return await _run("rehashes", hash_password, password)
+
+
+def password_hash_stats() -> dict:
+    """Counters for the bcrypt pool."""
+    with _stats_lock:
+        stats = dict(_stats)
+    return {"rounds": BCRYPT_ROUNDS, "concurrency": PASSWORD_HASH_CONCURRENCY, **stats}
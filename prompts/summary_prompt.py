@@ -72,4 +72,25 @@ Example Summary:
 Create a summary that someone reading it weeks later would understand the user's journey. Be thorough but concise. Aim for 30-50% of the original length while keeping all critical information.
 
 Provide your summary now:
-"""
\ No newline at end of file
+"""
+
+ROLLING_SUMMARY_PROMPT = """
+You are a journaling companion's memory system. You keep a running summary of a conversation so that older messages can be dropped from the context while everything important is remembered.
+
+Update the existing summary with the new messages below:
+- Keep everything from the existing summary that is still relevant; do not drop earlier events, people or commitments
+- Merge in significant events, emotional states, people, goals and open questions from the new messages
+- Keep specific names, dates, places and numbers intact, and the user's own words for particularly meaningful phrases
+- Do NOT add interpretations, advice, or commentary
+- Use the sections Key Events & Experiences, Emotional Patterns & States, Important People & Relationships, Goals, Decisions & Commitments, Ongoing Concerns & Questions and Health & Wellbeing Notes where relevant
+
+<existing_summary>
+{summary}
+</existing_summary>
+
+<new_messages>
+{messages}
+</new_messages>
+
+Provide the updated summary now:
+"""
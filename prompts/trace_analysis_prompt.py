@@ -14,3 +14,13 @@ Progress Indicators: Changes in journaling habits or tone (e.g., "You've journal
 
 Output Format:
 Return insights as a well-formatted paragraph in plain text. Do not use markdown formatting (no asterisks, underscores, or other markdown symbols). Use natural language emphasis through word choice and sentence structure instead."""
+
+CHUNK_SUMMARY_PROMPT = """You are summarizing one period of a user's journal for a journaling app called Trace. A later step will combine several period summaries into overall insights, so keep everything that could reveal a pattern across periods.
+
+Your Task:
+In at most 150 words, summarize this period's entries. Cover the dominant emotions and how they shifted, activities and habits mentioned, recurring people, topics and situations, and how often and how deeply the user journaled. Keep specific details (names, activities, times of day) rather than generalizing them away.
+
+Output Format:
+Plain text without markdown formatting. Do not address the user and do not give advice."""
+
+REDUCE_ANALYSIS_INSTRUCTIONS = """You will receive summaries of consecutive periods of the user's journal instead of the raw entries, newest period first. Each period is labelled with a recency weight between 0 and 1. Weigh each period by its recency weight: base your insights mainly on the highest-weighted periods so they reflect who the user is now, and use lower-weighted periods for context, to describe how things have changed over time."""
@@ -2,5 +2,6 @@
 from .auth import router as auth_router
 from .chat import router as chat_router
 from .journal import router as journal_router
+from .metrics import router as metrics_router
 
-__all__ = ["auth_router", "chat_router", "journal_router"]
+__all__ = ["auth_router", "chat_router", "journal_router", "metrics_router"]
@@ -1,21 +1,23 @@
 """Authentication routes."""
 from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import User, get_db
-from auth import create_access_token, get_current_user
+from database import User, get_async_db
+from auth import AuthenticatedUser, create_access_token, get_current_user
+from passwords import ahash_password, arehash_if_needed, averify_password
 from models import UserRegister, UserLogin, Token, UserResponse
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
 
 @router.post("/register", response_model=Token)
-async def register(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register(user_data: UserRegister, db: AsyncSession = Depends(get_async_db)):
     """Register a new user."""
     # Check if user already exists
-    existing_user = db.query(User).filter(
+    existing_user = await db.scalar(select(User).where(
         (User.username == user_data.username) | (User.email == user_data.email)
-    ).first()
+    ).limit(1))
     
     if existing_user:
         raise HTTPException(
@@ -28,13 +30,13 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
         new_user = User(
             username=user_data.username,
             email=user_data.email,
-            password_hash=User.hash_password(user_data.password),
+            password_hash=await ahash_password(user_data.password),
             full_name=user_data.full_name,
             language=user_data.language
         )
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
         
         # Create access token
         access_token = create_access_token(new_user.id)
@@ -45,7 +47,7 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
             user=UserResponse.from_orm(new_user)
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Registration failed: {str(e)}"
@@ -53,11 +55,11 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Login user."""
-    user = db.query(User).filter(User.username == user_data.username).first()
+    user = await db.scalar(select(User).where(User.username == user_data.username))
     
-    if not user or not user.verify_password(user_data.password):
+    if not user or not await averify_password(user_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
@@ -69,6 +71,12 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
             detail="User account is disabled"
         )
     
+    # Upgrade the stored hash if the configured bcrypt cost has changed
+    new_hash = await arehash_if_needed(user_data.password, user.password_hash)
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit()
+    
     # Create access token
     access_token = create_access_token(user.id)
     
@@ -81,7 +89,7 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
-    current_user: User = Depends(get_current_user),
+    current_user: AuthenticatedUser = Depends(get_current_user),
 ):
     """Get current user information."""
     return UserResponse.from_orm(current_user)
@@ -1,13 +1,19 @@
 """Chat routes."""
+import contextlib
+import json
+import math
 import traceback
 import random
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import User, JournalEntry, get_db
-from auth import get_current_user
+from database import JournalEntry, AsyncSessionLocal, get_async_db
+from auth import AuthenticatedUser, get_current_user
 from models import ChatRequest, ChatResponse
-from agent_core import process_chat
+from agent_core import aprocess_chat, astream_chat
+from llm_gateway import LLMUnavailable
+from chat_sessions import record_chat_entry
 from prompt_tool import prompts
 
 router = APIRouter(tags=["chat"])
@@ -19,11 +25,45 @@ async def get_random_prompt():
     return {"prompt": random.choice(prompts)}
 
 
+async def save_journal_entry(
+    db: AsyncSession,
+    user_id: int,
+    session_id: str,
+    user_message: str,
+    ai_response: str
+) -> JournalEntry:
+    """Persist one chat turn as a journal entry and update its session in the same transaction."""
+    journal_entry = JournalEntry(
+        user_id=user_id,
+        session_id=session_id,
+        user_message=user_message,
+        ai_response=ai_response
+    )
+    db.add(journal_entry)
+    await db.flush()
+    await db.run_sync(record_chat_entry, user_id, session_id, user_message, journal_entry.created_at)
+    await db.commit()
+    return journal_entry
+
+
+async def _save_streamed_entry(user_id: int, session_id: str, user_message: str, ai_response: str) -> int:
+    """Save a streamed turn using its own session, since the response outlives the request scope."""
+    async with AsyncSessionLocal() as db:
+        journal_entry = await save_journal_entry(db, user_id, session_id, user_message, ai_response)
+        return journal_entry.id
+
+
+def _sse_event(data: dict, event: str | None = None) -> str:
+    """Format a Server-Sent Events frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Handle chat messages."""
     try:
@@ -33,18 +73,17 @@ async def chat(
         if not user_message:
             raise HTTPException(status_code=400, detail="Empty message")
         
-        # Process through traced function
-        ai_response, metadata = process_chat(user_message, session_id)
+        # Process through traced function without blocking the event loop
+        ai_response, metadata = await aprocess_chat(user_message, session_id, current_user.id)
         
         # Save to database with authenticated user
-        journal_entry = JournalEntry(
-            user_id=current_user.id,
-            session_id=session_id,
-            user_message=user_message,
-            ai_response=ai_response
+        await save_journal_entry(
+            db,
+            current_user.id,
+            session_id,
+            user_message,
+            ai_response
         )
-        db.add(journal_entry)
-        db.commit()
         
         return ChatResponse(
             response=ai_response,
@@ -53,9 +92,71 @@ async def chat(
             
     except HTTPException:
         raise
+    except LLMUnavailable as e:
+        # Quota or provider trouble outlasted the gateway's queueing and retries
+        await db.rollback()
+        print(f"Chat unavailable: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         error_msg = f"{type(e).__name__}: {str(e)}"
         print(f"Chat error: {error_msg}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=error_msg)
+
+
+@router.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """
+    Handle chat messages, streaming the reply as Server-Sent Events.
+    
+    Emits one `data: {"token": ...}` frame per generated token, then an
+    `event: done` frame once the complete turn has been saved as a journal
+    entry, or an `event: error` frame if generation fails.
+    """
+    user_message = request.message.strip()
+    session_id = request.session_id
+    user_id = current_user.id
+    
+    if not user_message:
+        raise HTTPException(status_code=400, detail="Empty message")
+    
+    async def event_stream():
+        try:
+            ai_response = None
+            # Close the turn right away if the client disconnects, so it is rolled back
+            async with contextlib.aclosing(astream_chat(user_message, session_id, user_id)) as events:
+                async for event in events:
+                    if "token" in event:
+                        yield _sse_event({"token": event["token"]})
+                    else:
+                        ai_response = event["response"]
+            
+            entry_id = await _save_streamed_entry(
+                user_id,
+                session_id,
+                user_message,
+                ai_response
+            )
+            yield _sse_event({"session_id": session_id, "entry_id": entry_id, "response": ai_response}, event="done")
+        except LLMUnavailable as e:
+            print(f"Chat stream unavailable: {e}")
+            yield _sse_event({"detail": str(e), "retry_after": e.retry_after}, event="error")
+        except Exception as e:
+            error_msg = f"{type(e).__name__}: {str(e)}"
+            print(f"Chat stream error: {error_msg}")
+            print(traceback.format_exc())
+            yield _sse_event({"detail": error_msg}, event="error")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,19 +1,33 @@
 """Journal and chat session routes."""
+import asyncio
+import json
 import time
 import random
-from fastapi import APIRouter, HTTPException, Depends
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Response, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
-from database import User, JournalEntry, get_db
-from auth import get_current_user
+from database import JournalEntry, get_async_db
+from auth import AuthenticatedUser, get_current_user
 from prompt_tool import prompts
-from trace_analysis import get_analysis_summary
-# from sentiment_service import SentimentAnalyzer
-
-# Initialize sentiment analyzer
-# sentiment_analyzer = SentimentAnalyzer()
+from analysis_cache import get_cached_analysis
+from analysis_jobs import analysis_jobs
+from sentiment_stats import (
+    get_sentiment_aggregate,
+    get_sentiment_distribution,
+    get_sentiment_timeline,
+    labelled_entries_for,
+    store_sentiment_labels,
+    update_sentiment_aggregates,
+)
+from agent_core import adelete_conversation
+from chat_sessions import list_chat_sessions, record_chat_entry, remove_chat_session
+from sentiment_service import SentimentAnalyzer, get_sentiment_analyzer
 
 router = APIRouter(prefix="/api", tags=["journal"])
 
@@ -34,6 +48,15 @@ class SentimentResponse(BaseModel):
 
 # ==================== Sentiment Analysis Endpoints ====================
 
+async def _get_analyzer() -> SentimentAnalyzer:
+    """Get the shared analyzer, loading the model off the event loop on first use."""
+    try:
+        return await run_in_threadpool(get_sentiment_analyzer)
+    except Exception as e:
+        print(f"Sentiment model unavailable: {str(e)}")
+        raise HTTPException(status_code=503, detail="Sentiment analysis is currently unavailable")
+
+
 @router.post("/sentiment/analyze", response_model=SentimentResponse)
 async def analyze_sentiment(request: SentimentRequest):
     """
@@ -45,30 +68,50 @@ async def analyze_sentiment(request: SentimentRequest):
     Returns:
         SentimentResponse with sentiment scores and classifications
     """
-    raise HTTPException(status_code=501, detail="Sentiment analysis is currently disabled")
-    # if not request.text or not request.text.strip():
-    #     raise HTTPException(status_code=400, detail="Text cannot be empty")
-    # 
-    # try:
-    #     scores = sentiment_analyzer.analyze(request.text)
-    #     result = sentiment_analyzer.format_results(scores)
-    #     return SentimentResponse(**result)
-    # except Exception as e:
-    #     raise HTTPException(
-    #         status_code=500,
-    #         detail=f"Sentiment analysis error: {str(e)}"
-    #     )
+    if not request.text or not request.text.strip():
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+    
+    sentiment_analyzer = await _get_analyzer()
+    try:
+        scores = await sentiment_analyzer.analyze_async(request.text)
+        result = sentiment_analyzer.format_results(scores)
+        return SentimentResponse(**result)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Sentiment analysis error: {str(e)}"
+        )
+
+
+async def _label_entries(
+    db: AsyncSession,
+    entries: list[JournalEntry],
+    sentiment_analyzer: SentimentAnalyzer
+) -> None:
+    """Infer, store and aggregate sentiment for entries that were never labelled."""
+    # Submitted together, the messages are scored in shared micro-batches
+    all_scores = await asyncio.gather(
+        *(sentiment_analyzer.analyze_async(entry.user_message) for entry in entries)
+    )
+    
+    pairs = [(entry, sentiment_analyzer.label(scores)) for entry, scores in zip(entries, all_scores)]
+    # Entries a concurrent request labelled first are skipped, so none is aggregated twice
+    await db.run_sync(store_sentiment_labels, pairs)
+    await db.commit()
 
 
 @router.post("/sentiment/entry/{entry_id}")
 async def analyze_entry_sentiment(
     entry_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Analyze sentiment of a stored journal entry.
     
+    Entries that were already labelled are served from their stored scores;
+    only unlabelled entries are run through the model (and then stored).
+    
     Args:
         entry_id: ID of journal entry to analyze
         current_user: Authenticated user
@@ -77,39 +120,48 @@ async def analyze_entry_sentiment(
     Returns:
         Sentiment analysis results for the entry
     """
-    raise HTTPException(status_code=501, detail="Sentiment analysis is currently disabled")
-    # entry = db.query(JournalEntry).filter(
-    #     JournalEntry.id == entry_id,
-    #     JournalEntry.user_id == current_user.id
-    # ).first()
-    # 
-    # if not entry:
-    #     raise HTTPException(status_code=404, detail="Entry not found")
-    # 
-    # try:
-    #     scores = sentiment_analyzer.analyze(entry.user_message)
-    #     result = sentiment_analyzer.format_results(scores)
-    #     
-    #     return {
-    #         "entry_id": entry_id,
-    #         "user_message": entry.user_message,
-    #         **result
-    #     }
-    # except Exception as e:
-    #     raise HTTPException(
-    #         status_code=500,
-    #         detail=f"Sentiment analysis error: {str(e)}"
-    #     )
+    entry = await db.scalar(select(JournalEntry).where(
+        JournalEntry.id == entry_id,
+        JournalEntry.user_id == current_user.id
+    ))
+    
+    if not entry:
+        raise HTTPException(status_code=404, detail="Entry not found")
+    
+    sentiment_analyzer = await _get_analyzer()
+    try:
+        if entry.sentiment_analyzed_at is None:
+            await _label_entries(db, [entry], sentiment_analyzer)
+            # The stored label may be a concurrent request's
+            await db.refresh(entry)
+        
+        scores = json.loads(entry.sentiment_scores or "{}")
+        result = sentiment_analyzer.format_results(scores)
+        
+        return {
+            "entry_id": entry_id,
+            "user_message": entry.user_message,
+            **result
+        }
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Sentiment analysis error: {str(e)}"
+        )
 
 
 @router.get("/sentiment/session/{session_id}")
 async def analyze_session_sentiment(
     session_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Analyze aggregate sentiment for a chat session.
+    Get aggregate sentiment for a chat session.
+    
+    Served from the session's stored aggregate. Messages that have not been
+    labelled yet are inferred first and folded into the aggregate.
     
     Args:
         session_id: Chat session ID
@@ -119,118 +171,139 @@ async def analyze_session_sentiment(
     Returns:
         Aggregate sentiment analysis for the session
     """
-    entries = db.query(JournalEntry).filter(
+    pending = (await db.scalars(select(JournalEntry).where(
         JournalEntry.user_id == current_user.id,
         JournalEntry.session_id == session_id,
-        JournalEntry.user_message != ""  # Only analyze user messages
-    ).all()
-    
-    if not entries:
-        raise HTTPException(status_code=404, detail="Session not found")
+        JournalEntry.user_message != "",  # Only analyze user messages
+        JournalEntry.sentiment_analyzed_at.is_(None)
+    ))).all()
     
+    sentiment_analyzer = await _get_analyzer()
     try:
-        # Aggregate sentiment scores across all messages
-        all_scores = []
-        for entry in entries:
-            if entry.user_message.strip():
-                scores = sentiment_analyzer.analyze(entry.user_message)
-                all_scores.append(scores)
-        
-        # Average the scores
-        if not all_scores:
-            raise ValueError("No valid messages in session")
-        
-        avg_scores = {}
-        for sentiment in sentiment_analyzer.group_names:
-            avg_score = sum(s[sentiment] for s in all_scores) / len(all_scores)
-            avg_scores[sentiment] = avg_score
+        if pending:
+            await _label_entries(db, pending, sentiment_analyzer)
         
-        result = sentiment_analyzer.format_results(avg_scores)
-        
-        return {
-            "session_id": session_id,
-            "message_count": len(entries),
-            "analysis": result
-        }
+        aggregate = await db.run_sync(get_sentiment_aggregate, current_user.id, "session", session_id)
     except Exception as e:
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Session sentiment analysis error: {str(e)}"
         )
+    
+    if not aggregate:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return {
+        "session_id": session_id,
+        "message_count": aggregate["entry_count"],
+        "analysis": sentiment_analyzer.format_results(aggregate["average_scores"])
+    }
+
+
+@router.get("/sentiment/timeline")
+async def get_sentiment_timeline_view(
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    scope: str = "day",
+    limit: int = 30
+):
+    """
+    Get the user's average sentiment per day or ISO week, newest first.
+    
+    Args:
+        current_user: Authenticated user
+        db: Database session
+        scope: "day" or "week"
+        limit: Number of periods to return
+        
+    Returns:
+        Stored per-period aggregates with average scores and primary counts
+    """
+    if scope not in ("day", "week"):
+        raise HTTPException(status_code=400, detail="Scope must be 'day' or 'week'")
+    
+    return {
+        "scope": scope,
+        "periods": await db.run_sync(get_sentiment_timeline, current_user.id, scope=scope, limit=limit)
+    }
+
+
+@router.get("/sentiment/distribution")
+async def get_user_sentiment_distribution(
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    days: Optional[int] = None
+):
+    """
+    Get the distribution of primary sentiments across the user's entries.
+    
+    Args:
+        current_user: Authenticated user
+        db: Database session
+        days: Only include the last N days (default: all time)
+        
+    Returns:
+        Entry counts, percentages and average scores per sentiment group
+    """
+    start_date = datetime.utcnow() - timedelta(days=days) if days else None
+    distribution = await db.run_sync(get_sentiment_distribution, user_id=current_user.id, start_date=start_date)
+    
+    return {
+        "period_days": days,
+        **distribution
+    }
 
 
 @router.get("/journal")
 async def get_journal_entries(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
     limit: int = 50,
     offset: int = 0
 ):
     """Get user's journal entries."""
-    entries = db.query(JournalEntry).filter(
+    entries = (await db.scalars(select(JournalEntry).where(
         JournalEntry.user_id == current_user.id
-    ).order_by(JournalEntry.created_at.desc()).offset(offset).limit(limit).all()
+    ).order_by(JournalEntry.created_at.desc()).offset(offset).limit(limit))).all()
     
     return {
         "entries": entries,
-        "total": db.query(JournalEntry).filter(
+        "total": await db.scalar(select(func.count(JournalEntry.id)).where(
             JournalEntry.user_id == current_user.id
-        ).count()
+        ))
     }
 
 
 @router.get("/chat-sessions")
 async def get_chat_sessions(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
 ):
-    """Get user's chat sessions grouped by session_id."""
-    # Get unique sessions with their metadata
-    sessions = db.query(
-        JournalEntry.session_id,
-        func.min(JournalEntry.created_at).label('created_at'),
-        func.max(JournalEntry.created_at).label('updated_at'),
-        func.count(JournalEntry.id).label('message_count')
-    ).filter(
-        JournalEntry.user_id == current_user.id
-    ).group_by(
-        JournalEntry.session_id
-    ).order_by(
-        func.max(JournalEntry.created_at).desc()
-    ).all()
-    
-    result = []
-    for session in sessions:
-        # Get the first non-empty user message for the title
-        first_user_msg = db.query(JournalEntry).filter(
-            JournalEntry.user_id == current_user.id,
-            JournalEntry.session_id == session.session_id,
-            JournalEntry.user_message != ""
-        ).order_by(JournalEntry.created_at.asc()).first()
-        
-        # Create title from first user message, or use default
-        if first_user_msg and first_user_msg.user_message.strip():
-            title = first_user_msg.user_message[:50]
-            if len(first_user_msg.user_message) > 50:
-                title = title + "..."
-        else:
-            title = "Chat"
-        
-        result.append({
-            "session_id": session.session_id,
-            "title": title,
-            "created_at": session.created_at,
-            "updated_at": session.updated_at,
-            "message_count": session.message_count
-        })
+    """
+    Get user's chat sessions from the chat_sessions table.
+    
+    Args:
+        current_user: Authenticated user
+        db: Database session
+        limit: Page size (default: all sessions)
+        cursor: next_cursor from the previous page
     
-    return {"sessions": result}
+    Returns:
+        Sessions, most recently updated first, and the cursor of the next page
+    """
+    try:
+        return await db.run_sync(list_chat_sessions, current_user.id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/chat-sessions/create")
 async def create_chat_session(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new chat session."""
     session_id = f"session_{current_user.id}_{int(time.time() * 1000)}"
@@ -247,8 +320,9 @@ async def create_chat_session(
         ai_response=greeting_message
     )
     db.add(initial_entry)
-    db.commit()
-    db.refresh(initial_entry)
+    await db.flush()
+    await db.run_sync(record_chat_entry, current_user.id, session_id, "", initial_entry.created_at)
+    await db.commit()
     
     return {
         "session_id": session_id,
@@ -259,14 +333,14 @@ async def create_chat_session(
 @router.get("/chat-history/{session_id}")
 async def get_chat_history(
     session_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get chat history for a specific session."""
-    entries = db.query(JournalEntry).filter(
+    entries = (await db.scalars(select(JournalEntry).where(
         JournalEntry.user_id == current_user.id,
         JournalEntry.session_id == session_id
-    ).order_by(JournalEntry.created_at.asc()).all()
+    ).order_by(JournalEntry.created_at.asc()))).all()
     
     if not entries:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -290,25 +364,40 @@ async def get_chat_history(
 @router.delete("/chat-sessions/{session_id}")
 async def delete_chat_session(
     session_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a chat session and all its entries."""
     print(f"[DELETE] Attempting to delete session: {session_id} for user: {current_user.id}")
     
-    # Delete all entries for this session belonging to the current user
-    deleted_count = db.query(JournalEntry).filter(
+    # The metadata row tells us whether the session exists without scanning entries
+    if not await db.run_sync(remove_chat_session, current_user.id, session_id):
+        print(f"[DELETE] Session {session_id} not found")
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    session_filter = (
         JournalEntry.user_id == current_user.id,
         JournalEntry.session_id == session_id
-    ).delete()
+    )
     
-    db.commit()
+    # Take the session's labelled entries out of the day/week aggregates
+    def subtract_from_aggregates(sync_db: Session) -> None:
+        update_sentiment_aggregates(sync_db, labelled_entries_for(sync_db, *session_filter), sign=-1)
     
-    print(f"[DELETE] Deleted {deleted_count} entries for session {session_id}")
+    await db.run_sync(subtract_from_aggregates)
     
-    if deleted_count == 0:
-        print(f"[DELETE] No entries found for session {session_id}")
-        raise HTTPException(status_code=404, detail="Session not found")
+    # Delete all entries for this session belonging to the current user
+    result = await db.execute(
+        delete(JournalEntry).where(*session_filter).execution_options(synchronize_session=False)
+    )
+    deleted_count = result.rowcount
+    
+    await db.commit()
+    
+    # Drop cached conversation state so it cannot outlive the deleted entries
+    await adelete_conversation(current_user.id, session_id)
+    
+    print(f"[DELETE] Deleted {deleted_count} entries for session {session_id}")
     
     return {
         "message": "Session deleted successfully",
@@ -318,23 +407,27 @@ async def delete_chat_session(
 
 @router.get("/analysis")
 async def get_journal_analysis(
-    current_user: User = Depends(get_current_user),
-    days: int = 30,
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    days: int = 30
 ):
     """
     Get AI-powered analysis of user's journal entries.
     
+    Results are cached per user and window and reused while the entries in
+    the window are unchanged. When they have changed, the previous result is
+    served (with "cache": "stale") while it is recomputed in the background.
+    The analysis makes blocking database and LLM calls, so it runs in the
+    threadpool with its own database session.
+    
     Args:
         current_user: Authenticated user
         days: Number of days to analyze (default: 30)
-        db: Database session
     
     Returns:
         Analysis summary with insights
     """
     try:
-        analysis = get_analysis_summary(user_id=current_user.id, days=days, db=db)
+        analysis = await run_in_threadpool(get_cached_analysis, current_user.id, days)
         
         if not analysis["success"]:
             raise HTTPException(
@@ -360,3 +453,50 @@ async def get_journal_analysis(
             status_code=500,
             detail=f"Error generating analysis: {str(e)}"
         )
+
+
+@router.post("/analysis/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_analysis_job(
+    response: Response,
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    days: int = 30
+):
+    """
+    Start a Trace Me analysis in the background.
+    
+    If the same analysis (user and window) is already queued or running,
+    that job is returned instead of starting another one.
+    
+    Args:
+        current_user: Authenticated user
+        days: Number of days to analyze (default: 30)
+    
+    Returns:
+        The job, to be polled at GET /api/analysis/jobs/{job_id}
+    """
+    job, created = analysis_jobs.submit(current_user.id, days)
+    if not created:
+        response.status_code = status.HTTP_200_OK
+    return job.to_dict()
+
+
+@router.get("/analysis/jobs/{job_id}")
+async def get_analysis_job(
+    job_id: str,
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """
+    Poll an analysis job.
+    
+    Args:
+        job_id: ID returned when the job was created
+        current_user: Authenticated user
+    
+    Returns:
+        Job status ("queued", "running", "succeeded" or "failed"), with the
+        analysis summary as "result" once it has succeeded
+    """
+    job = analysis_jobs.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
@@ -0,0 +1,73 @@
+"""Operational metrics routes."""
+from fastapi import APIRouter
+
+from agent_core import context_stats, conversation_stats, llm_validator, speculation_stats
+from auth import user_cache_stats
+from input_validation import input_validation_stats
+from llm_gateway import llm_gateway_stats
+from database import pool_stats
+from passwords import password_hash_stats
+from sentiment_service import sentiment_service_stats
+from analysis_cache import analysis_cache
+from analysis_jobs import analysis_jobs
+from trace_analysis import analysis_cache_stats
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("/conversation-store")
+async def get_conversation_store_metrics():
+    """Get hit/miss/eviction counters for the conversation state store."""
+    return conversation_stats()
+
+
+@router.get("/context")
+async def get_context_metrics():
+    """Get per-turn input token accounting and rolling summary counters for the agent."""
+    return context_stats()
+
+
+@router.get("/input-validation")
+async def get_input_validation_metrics():
+    """Get local tier, structured LLM (retries, parse failures) and speculation counters for input validation."""
+    return {**input_validation_stats(), "llm": llm_validator.stats(), "speculation": speculation_stats()}
+
+
+@router.get("/sentiment")
+async def get_sentiment_metrics():
+    """Get micro-batching counters for the sentiment inference service."""
+    return sentiment_service_stats()
+
+
+@router.get("/db-pool")
+async def get_db_pool_metrics():
+    """Get connection pool usage and checkout wait times."""
+    return pool_stats()
+
+
+@router.get("/llm-gateway")
+async def get_llm_gateway_metrics():
+    """Get rate limiter, queueing, retry and circuit breaker counters for LLM calls."""
+    return llm_gateway_stats()
+
+
+@router.get("/passwords")
+async def get_password_hashing_metrics():
+    """Get bcrypt pool configuration and counters."""
+    return password_hash_stats()
+
+
+@router.get("/user-cache")
+async def get_user_cache_metrics():
+    """Get hit/miss counters for the authentication user cache."""
+    return user_cache_stats()
+
+
+@router.get("/analysis")
+async def get_analysis_metrics():
+    """Get Trace Me job counters and hit/miss counters for cached results and chunk summaries."""
+    return {
+        "jobs": analysis_jobs.stats(),
+        "results": analysis_cache.stats(),
+        "chunk_summaries": analysis_cache_stats()
+    }
@@ -0,0 +1,215 @@
+"""Sentiment inference service backed by the trained TensorFlow model."""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SENTIMENT_MODEL_PATH = os.getenv('SENTIMENT_MODEL_PATH', os.path.join(BASE_DIR, 'sentiment_model_tf'))
+SENTIMENT_GROUPS_PATH = os.path.join(BASE_DIR, 'sentiment_groups.json')
+
+
+def load_sentiment_model(model_path: str) -> Callable[[list[str]], list[list[float]]]:
+    """
+    Load the sentiment model and return a batch predict function.
+
+    Supports both a Keras model file (.keras) and the SavedModel directory
+    produced by model.export(). TensorFlow is imported here so that importing
+    this module stays cheap.
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Trained model not found at {model_path}. Please train the model first.")
+
+    import tensorflow as tf
+
+    if model_path.endswith('.keras'):
+        model = tf.keras.models.load_model(model_path)
+
+        def predict(texts: list[str]) -> list[list[float]]:
+            return model.predict(tf.constant(texts, dtype=tf.string), batch_size=len(texts), verbose=0).tolist()
+    else:
+        artifact = tf.saved_model.load(model_path)
+
+        def predict(texts: list[str]) -> list[list[float]]:
+            inputs = tf.reshape(tf.constant(texts, dtype=tf.string), [-1, 1])
+            return artifact.serve(inputs).numpy().tolist()
+
+    return predict
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-item requests into batched calls.
+
+    The first queued item opens a batch; the batch is dispatched once it
+    reaches max_batch_size or max_wait seconds have passed, whichever comes
+    first. The batch function runs in a worker thread so the event loop keeps
+    accepting requests while the model is busy.
+    """
+
+    def __init__(self, batch_fn: Callable[[list], list], max_batch_size: int = 64, max_wait: float = 0.01):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, item):
+        """Queue one item and wait for its result."""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                results = await asyncio.to_thread(self.batch_fn, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def close(self) -> None:
+        """Stop the worker task."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "average_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000
+        }
+
+
+class SentimentAnalyzer:
+    """
+    Multi-label sentiment classifier over the groups in sentiment_groups.json.
+
+    Scores are dictionaries mapping each group name to a probability. Use
+    analyze_batch for bulk work, analyze for one-off synchronous calls, and
+    analyze_async from request handlers so that concurrent requests share
+    micro-batched model calls.
+    """
+
+    def __init__(
+        self,
+        model_path: str = SENTIMENT_MODEL_PATH,
+        threshold: float = 0.5,
+        max_batch_size: int = 64,
+        max_wait: float = 0.01
+    ):
+        with open(SENTIMENT_GROUPS_PATH, 'r') as f:
+            self.group_names = list(json.load(f).keys())
+
+        self.threshold = threshold
+        self._predict = load_sentiment_model(model_path)
+        self._batcher = MicroBatcher(self.analyze_batch, max_batch_size=max_batch_size, max_wait=max_wait)
+
+    def analyze_batch(self, texts: list[str]) -> list[dict]:
+        """Score a batch of texts with a single model call."""
+        if not texts:
+            return []
+        predictions = self._predict(texts)
+        return [
+            {group: float(row[i]) for i, group in enumerate(self.group_names)}
+            for row in predictions
+        ]
+
+    def analyze(self, text: str) -> dict:
+        """Score one text synchronously."""
+        return self.analyze_batch([text])[0]
+
+    async def analyze_async(self, text: str) -> dict:
+        """Score one text, coalescing with concurrent callers into a micro-batch."""
+        return await self._batcher.submit(text)
+
+    def label(self, scores: dict) -> dict:
+        """Turn scores into the labels stored on a journal entry."""
+        primary = max(scores, key=scores.get) if scores else None
+        return {
+            "labels": [group for group, score in scores.items() if score > self.threshold],
+            "scores": scores,
+            "primary": primary
+        }
+
+    def format_results(self, scores: dict) -> dict:
+        """Shape scores for the sentiment API responses."""
+        primary_sentiments = [group for group, score in scores.items() if score > self.threshold]
+        if not primary_sentiments and scores:
+            primary_sentiments = [max(scores, key=scores.get)]
+
+        return {
+            "all_sentiments": scores,
+            "primary_sentiments": primary_sentiments,
+            "confidence": max(scores.values()) if scores else 0.0
+        }
+
+    def stats(self) -> dict:
+        return self._batcher.stats()
+
+
+_analyzer: Optional[SentimentAnalyzer] = None
+_analyzer_lock = threading.Lock()
+
+
+def get_sentiment_analyzer() -> SentimentAnalyzer:
+    """Return the process-wide analyzer, loading the model on first use."""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                start = time.perf_counter()
+                _analyzer = SentimentAnalyzer(
+                    max_batch_size=int(os.getenv('SENTIMENT_MAX_BATCH_SIZE', '64')),
+                    max_wait=float(os.getenv('SENTIMENT_MAX_WAIT_MS', '10')) / 1000
+                )
+                print(f"Sentiment model loaded in {time.perf_counter() - start:.1f}s")
+    return _analyzer
+
+
+def sentiment_service_stats() -> dict:
+    """Micro-batching counters, without loading the model if it is not loaded yet."""
+    if _analyzer is None:
+        return {"loaded": False}
+    return {"loaded": True, **_analyzer.stats()}
@@ -0,0 +1,371 @@
+"""Aggregate sentiment statistics over labelled journal entries."""
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from database import JournalEntry, SentimentAggregate
+
+AGGREGATE_SCOPES = ("session", "day", "week")
+
+# Load sentiment group names without pulling in the model
+SENTIMENT_GROUPS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sentiment_groups.json')
+with open(SENTIMENT_GROUPS_PATH, 'r') as f:
+    group_names = list(json.load(f).keys())
+
+
+def get_sentiment_distribution(
+    db: Session,
+    user_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> dict:
+    """
+    Count labelled entries and average scores per primary sentiment.
+    
+    Runs a single grouped query, served by the
+    (user_id, primary_sentiment, created_at) index when scoped to a user.
+    
+    Args:
+        db: Database session
+        user_id: Restrict to one user's entries (None for all users)
+        start_date: Only include entries created at or after this time
+        end_date: Only include entries created at or before this time
+    
+    Returns:
+        Dictionary with the total labelled count and, for every sentiment
+        group, its entry count, share of the total and average score
+    """
+    query = db.query(
+        JournalEntry.primary_sentiment,
+        func.count(JournalEntry.id),
+        func.avg(JournalEntry.primary_sentiment_score)
+    ).filter(JournalEntry.primary_sentiment.isnot(None))
+    
+    if user_id is not None:
+        query = query.filter(JournalEntry.user_id == user_id)
+    if start_date is not None:
+        query = query.filter(JournalEntry.created_at >= start_date)
+    if end_date is not None:
+        query = query.filter(JournalEntry.created_at <= end_date)
+    
+    rows = query.group_by(JournalEntry.primary_sentiment).all()
+    counts = {sentiment: (count, avg_score) for sentiment, count, avg_score in rows}
+    total = sum(count for count, _ in counts.values())
+    
+    groups = {}
+    for group in group_names + [name for name in counts if name not in group_names]:
+        count, avg_score = counts.get(group, (0, None))
+        groups[group] = {
+            "count": count,
+            "percentage": count / total * 100 if total else 0.0,
+            "average_score": float(avg_score) if avg_score is not None else None
+        }
+    
+    return {
+        "total": total,
+        "groups": groups
+    }
+
+
+# ==================== Incremental Aggregates ====================
+
+def sentiment_columns(label: dict, analyzed_at: Optional[datetime] = None) -> dict:
+    """Column values stored on a JournalEntry for a sentiment label."""
+    return {
+        "sentiment_labels": json.dumps(label["labels"]),
+        "sentiment_scores": json.dumps(label["scores"]),
+        "primary_sentiment": label["primary"],
+        "primary_sentiment_score": label["scores"].get(label["primary"]),
+        "sentiment_analyzed_at": analyzed_at or datetime.utcnow()
+    }
+
+
+def aggregate_keys(session_id: Optional[str], created_at: datetime) -> list[tuple[str, str]]:
+    """The (scope, scope_key) aggregates an entry contributes to."""
+    year, week, _ = created_at.isocalendar()
+    keys = [
+        ("day", created_at.strftime("%Y-%m-%d")),
+        ("week", f"{year}-W{week:02d}")
+    ]
+    if session_id:
+        keys.append(("session", session_id))
+    return keys
+
+
+def _scope_criteria(scope: str, scope_key: str) -> list:
+    """JournalEntry filters selecting the entries one aggregate covers (inverse of aggregate_keys)."""
+    if scope == "session":
+        return [JournalEntry.session_id == scope_key]
+    if scope == "day":
+        start = datetime.strptime(scope_key, "%Y-%m-%d")
+        end = start + timedelta(days=1)
+    else:
+        start = datetime.strptime(f"{scope_key}-1", "%G-W%V-%u")
+        end = start + timedelta(weeks=1)
+    return [JournalEntry.created_at >= start, JournalEntry.created_at < end]
+
+
+def _new_totals() -> dict:
+    return {"count": 0, "sums": defaultdict(float), "primary": defaultdict(int)}
+
+
+def _add_entry(totals: dict, user_message: Optional[str], label: dict, sign: int = 1) -> None:
+    # Session greetings carry no user text and are not part of any mood
+    if not user_message or not user_message.strip():
+        return
+    totals["count"] += sign
+    for group, score in label["scores"].items():
+        totals["sums"][group] += sign * score
+    if label["primary"]:
+        totals["primary"][label["primary"]] += sign
+
+
+def _scope_totals(db: Session, user_id: int, scope: str, scope_key: str) -> dict:
+    """Totals of the labelled entries in one aggregate's scope, read from journal_entries."""
+    totals = _new_totals()
+    criteria = _scope_criteria(scope, scope_key)
+    for _, _, _, user_message, label in labelled_entries_for(db, JournalEntry.user_id == user_id, *criteria):
+        _add_entry(totals, user_message, label)
+    return totals
+
+
+def _insert_seeded_row(db: Session, user_id: int, scope: str, scope_key: str) -> bool:
+    """
+    Create a missing aggregate row from the labelled entries already in its scope.
+    
+    Entries labelled before the row existed (e.g. before aggregates were
+    kept) are counted from the start. ON CONFLICT DO NOTHING leaves a row a
+    concurrent writer created first in place.
+    
+    Returns:
+        True if this call inserted the row
+    """
+    totals = _scope_totals(db, user_id, scope, scope_key)
+    insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}[db.get_bind().dialect.name]
+    result = db.execute(insert(SentimentAggregate).values(
+        user_id=user_id,
+        scope=scope,
+        scope_key=scope_key,
+        entry_count=totals["count"],
+        score_sums=json.dumps(totals["sums"]),
+        primary_counts=json.dumps(totals["primary"]),
+        updated_at=datetime.utcnow()
+    ).on_conflict_do_nothing(index_elements=["user_id", "scope", "scope_key"]))
+    return result.rowcount == 1
+
+
+def update_sentiment_aggregates(db: Session, labelled: Iterable[tuple], sign: int = 1, seed: bool = True) -> None:
+    """
+    Fold labelled entries into the per-session/day/week aggregates.
+    
+    Deltas are combined in memory first, so a batch touching a handful of
+    sessions and days costs one read and one write per aggregate row.
+    A missing row is seeded from the labelled entries already in its scope.
+    Those include the entries being added, which must already be stored
+    as labelled, so the delta is not applied on top of the seed. The caller
+    commits.
+    
+    Args:
+        db: Database session
+        labelled: (user_id, session_id, created_at, user_message, label) tuples,
+            where label holds the "scores" and "primary" of the entry
+        sign: 1 to add the entries, -1 to remove them (e.g. on deletion)
+        seed: False to start missing rows empty, when labelled already holds
+            every entry in their scope (rebuild_sentiment_aggregates)
+    """
+    deltas = defaultdict(_new_totals)
+    for user_id, session_id, created_at, user_message, label in labelled:
+        for scope, scope_key in aggregate_keys(session_id, created_at):
+            _add_entry(deltas[(user_id, scope, scope_key)], user_message, label, sign)
+    
+    for (user_id, scope, scope_key), delta in deltas.items():
+        if delta["count"] == 0:
+            continue
+        
+        def locked() -> Optional[SentimentAggregate]:
+            return db.query(SentimentAggregate).filter(
+                SentimentAggregate.user_id == user_id,
+                SentimentAggregate.scope == scope,
+                SentimentAggregate.scope_key == scope_key
+            ).with_for_update().populate_existing().first()
+        
+        aggregate = locked()
+        if aggregate is None:
+            if sign < 0:
+                continue
+            if seed and _insert_seeded_row(db, user_id, scope, scope_key):
+                continue
+            if not seed:
+                db.add(SentimentAggregate(
+                    user_id=user_id,
+                    scope=scope,
+                    scope_key=scope_key,
+                    entry_count=0,
+                    score_sums="{}",
+                    primary_counts="{}"
+                ))
+                db.flush()
+            # Otherwise a concurrent writer created the row first; add to it
+            aggregate = locked()
+        
+        score_sums = json.loads(aggregate.score_sums or "{}")
+        primary_counts = json.loads(aggregate.primary_counts or "{}")
+        for group, value in delta["sums"].items():
+            score_sums[group] = score_sums.get(group, 0.0) + value
+        for group, value in delta["primary"].items():
+            primary_counts[group] = primary_counts.get(group, 0) + value
+        
+        aggregate.entry_count = (aggregate.entry_count or 0) + delta["count"]
+        aggregate.score_sums = json.dumps(score_sums)
+        aggregate.primary_counts = json.dumps(primary_counts)
+        aggregate.updated_at = datetime.utcnow()
+        
+        if aggregate.entry_count <= 0:
+            db.delete(aggregate)
+    
+    # Sessions do not autoflush; make new rows visible to later batches in this transaction
+    db.flush()
+
+
+def store_sentiment_labels(db: Session, pairs: Iterable[tuple], analyzed_at: Optional[datetime] = None) -> int:
+    """
+    Store labels on entries that are still unlabelled and fold exactly those into the aggregates.
+    
+    Each entry is claimed with UPDATE ... WHERE sentiment_analyzed_at IS NULL.
+    When two requests label the same entries at once, only the update that
+    changed a row counts it, so no entry is aggregated twice. The caller
+    commits.
+    
+    Args:
+        db: Database session
+        pairs: (entry, label) pairs; entries need id, user_id, session_id,
+            created_at and user_message
+        analyzed_at: Timestamp stored on the entries (default: now)
+    
+    Returns:
+        Number of entries this call labelled
+    """
+    analyzed_at = analyzed_at or datetime.utcnow()
+    claimed = []
+    for entry, label in pairs:
+        result = db.execute(
+            update(JournalEntry)
+            .where(JournalEntry.id == entry.id, JournalEntry.sentiment_analyzed_at.is_(None))
+            .values(**sentiment_columns(label, analyzed_at))
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            claimed.append((entry.user_id, entry.session_id, entry.created_at, entry.user_message, label))
+    
+    update_sentiment_aggregates(db, claimed)
+    return len(claimed)
+
+
+def labelled_entries_for(db: Session, *criteria) -> list[tuple]:
+    """Load already-labelled entries in the tuple shape used by update_sentiment_aggregates."""
+    rows = db.query(
+        JournalEntry.user_id,
+        JournalEntry.session_id,
+        JournalEntry.created_at,
+        JournalEntry.user_message,
+        JournalEntry.sentiment_scores,
+        JournalEntry.primary_sentiment
+    ).filter(
+        JournalEntry.sentiment_analyzed_at.isnot(None),
+        *criteria
+    ).all()
+    
+    return [
+        (
+            row.user_id,
+            row.session_id,
+            row.created_at,
+            row.user_message,
+            {"scores": json.loads(row.sentiment_scores or "{}"), "primary": row.primary_sentiment}
+        )
+        for row in rows
+    ]
+
+
+def rebuild_sentiment_aggregates(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    Recompute aggregates from labelled entries (for backfills or repairs).
+    
+    Returns:
+        Number of entries folded into the rebuilt aggregates
+    """
+    aggregates = db.query(SentimentAggregate)
+    criteria = []
+    if user_id is not None:
+        aggregates = aggregates.filter(SentimentAggregate.user_id == user_id)
+        criteria.append(JournalEntry.user_id == user_id)
+    aggregates.delete(synchronize_session=False)
+    
+    labelled = labelled_entries_for(db, *criteria)
+    update_sentiment_aggregates(db, labelled, seed=False)
+    db.commit()
+    return len(labelled)
+
+
+def _aggregate_summary(aggregate: SentimentAggregate) -> dict:
+    """Average scores and primary counts of one aggregate row."""
+    count = aggregate.entry_count
+    score_sums = json.loads(aggregate.score_sums or "{}")
+    return {
+        "key": aggregate.scope_key,
+        "entry_count": count,
+        "average_scores": {
+            group: score_sums.get(group, 0.0) / count if count else 0.0
+            for group in group_names
+        },
+        "primary_counts": json.loads(aggregate.primary_counts or "{}"),
+        "updated_at": aggregate.updated_at
+    }
+
+
+def _summarize_entries(db: Session, user_id: int, scope: str, scope_key: str) -> Optional[dict]:
+    """Aggregate summary computed from the labelled entries in a scope."""
+    totals = _scope_totals(db, user_id, scope, scope_key)
+    count = totals["count"]
+    if not count:
+        return None
+    return {
+        "key": scope_key,
+        "entry_count": count,
+        "average_scores": {group: totals["sums"].get(group, 0.0) / count for group in group_names},
+        "primary_counts": dict(totals["primary"]),
+        "updated_at": None
+    }
+
+
+def get_sentiment_aggregate(db: Session, user_id: int, scope: str, scope_key: str) -> Optional[dict]:
+    """
+    Read one stored aggregate, e.g. a session's average sentiment.
+    
+    Scopes labelled before aggregates were kept may have no row; their
+    summary is computed from the entries instead. The row is created,
+    seeded from those entries, on the scope's next label.
+    """
+    aggregate = db.query(SentimentAggregate).filter(
+        SentimentAggregate.user_id == user_id,
+        SentimentAggregate.scope == scope,
+        SentimentAggregate.scope_key == scope_key
+    ).first()
+    if aggregate:
+        return _aggregate_summary(aggregate)
+    return _summarize_entries(db, user_id, scope, scope_key)
+
+
+def get_sentiment_timeline(db: Session, user_id: int, scope: str = "day", limit: int = 30) -> list[dict]:
+    """Most recent day or week aggregates for a user, newest first."""
+    aggregates = db.query(SentimentAggregate).filter(
+        SentimentAggregate.user_id == user_id,
+        SentimentAggregate.scope == scope
+    ).order_by(SentimentAggregate.scope_key.desc()).limit(limit).all()
+    return [_aggregate_summary(aggregate) for aggregate in aggregates]
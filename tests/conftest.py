@@ -0,0 +1,39 @@
+"""Shared fixtures: a throwaway SQLite database and no Gemini key."""
+import os
+import tempfile
+
+# database.py builds its engines at import, so point it at a scratch file first
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='trace-tests-'), 'trace.db')}"
+os.environ.setdefault("GEMINI_API_KEY", "")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import pytest
+
+from database import Base, SessionLocal, User, engine, init_db
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _schema():
+    init_db()
+
+
+@pytest.fixture
+def db():
+    """A database session on empty tables."""
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+        with engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                conn.execute(table.delete())
+
+
+@pytest.fixture
+def user_id(db) -> int:
+    user = User(username="tester", email="tester@example.com", password_hash="x", full_name="Tester")
+    db.add(user)
+    db.commit()
+    return user.id
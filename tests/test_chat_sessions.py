@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from chat_sessions import decode_cursor, encode_cursor, list_chat_sessions, record_chat_entry
+
+
+def test_cursor_round_trip():
+    updated_at = datetime(2026, 10, 18, 9, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(updated_at, "session/with:odd chars")) == (updated_at, "session/with:odd chars")
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "bm90IGpzb24="])
+def test_malformed_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_pages_cover_every_session_once(db, user_id):
+    start = datetime(2026, 10, 1)
+    for i in range(7):
+        # Pairs of sessions share a timestamp, so the session_id tie-break matters
+        record_chat_entry(db, user_id, f"s{i}", f"message {i}", start + timedelta(minutes=i // 2))
+    db.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = list_chat_sessions(db, user_id, limit=3, cursor=cursor)
+        seen += [session["session_id"] for session in page["sessions"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [session["session_id"] for session in list_chat_sessions(db, user_id)["sessions"]]
+    assert sorted(seen) == [f"s{i}" for i in range(7)]
+
+
+def test_record_chat_entry_counts_and_titles(db, user_id):
+    now = datetime(2026, 10, 1)
+    record_chat_entry(db, user_id, "s", "", now)
+    record_chat_entry(db, user_id, "s", "First real message", now + timedelta(minutes=1))
+    record_chat_entry(db, user_id, "s", "Second", now + timedelta(minutes=2))
+    record_chat_entry(db, user_id, None, "No session", now)
+    db.commit()
+
+    [session] = list_chat_sessions(db, user_id)["sessions"]
+    assert (session["title"], session["message_count"]) == ("First real message", 3)
+    assert session["updated_at"] == now + timedelta(minutes=2)
@@ -0,0 +1,276 @@
+import asyncio
+
+import httpx
+import pytest
+
+import llm_gateway
+from llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailable, StreamInterrupted, _Slots, classify_error
+
+
+class ProviderError(Exception):
+    def __init__(self, message: str, code: int | None = None, status: str | None = None):
+        super().__init__(message)
+        if code is not None:
+            self.code = code
+        if status is not None:
+            self.status = status
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_gateway.time, "monotonic", lambda: now[0])
+    return now
+
+
+# ---------- classify_error ----------
+
+@pytest.mark.parametrize("error, kind", [
+    (ProviderError("quota", code=429), "rate_limit"),
+    (ProviderError("quota", status="RESOURCE_EXHAUSTED"), "rate_limit"),
+    (ProviderError("overloaded", code=503), "server"),
+    (ProviderError("busy", status="UNAVAILABLE"), "server"),
+    (TimeoutError(), "server"),
+    (httpx.ConnectError("refused"), "server"),
+    (ProviderError("429 RESOURCE_EXHAUSTED. Quota exceeded"), "rate_limit"),
+    (ProviderError("503 UNAVAILABLE. The model is overloaded."), "server"),
+])
+def test_classify_transient_errors(error, kind):
+    assert classify_error(error) == kind
+
+
+@pytest.mark.parametrize("error", [
+    ProviderError("bad request", code=400),
+    ProviderError("API key not valid", code=401),
+    # A non-transient status wins over matching text
+    ProviderError("invalid argument: mentions 429 RESOURCE_EXHAUSTED", code=400),
+    # Numbers in ordinary messages are not status codes
+    ProviderError("prompt has 503 tokens and 429 words"),
+    ValueError("unparseable output"),
+    LLMUnavailable("LLM unavailable for chat: circuit open", retry_after=5),
+])
+def test_classify_permanent_errors(error):
+    assert classify_error(error) is None
+
+
+def test_classify_uses_the_cause_chain():
+    try:
+        try:
+            raise ProviderError("quota", code=429)
+        except ProviderError as cause:
+            raise RuntimeError("model call failed") from cause
+    except RuntimeError as error:
+        assert classify_error(error) == "rate_limit"
+
+
+def test_classify_never_retries_a_gateway_give_up():
+    try:
+        try:
+            raise ProviderError("overloaded", code=503)
+        except ProviderError as cause:
+            raise LLMUnavailable("gave up") from cause
+    except LLMUnavailable as error:
+        assert classify_error(error) is None
+
+
+# ---------- CircuitBreaker ----------
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    for _ in range(2):
+        assert breaker.allow() is None
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    assert breaker.allow() is None
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() == pytest.approx(30)
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_breaker_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock[0] += 30
+
+    assert breaker.allow() is None
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() is not None  # a second caller waits for the trial
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() is None
+
+
+def test_breaker_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow() is None
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() == pytest.approx(30)
+    assert breaker.stats()["opened"] == 2
+
+
+def test_breaker_cancelled_trial_is_handed_back(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow() is None
+    breaker.cancel_trial()
+    assert breaker.allow() is None
+
+
+def test_breaker_disabled_with_zero_threshold():
+    breaker = CircuitBreaker(failure_threshold=0)
+    for _ in range(10):
+        breaker.record_failure()
+    assert breaker.allow() is None
+
+
+# ---------- LLMGateway ----------
+
+def gateway(**overrides) -> LLMGateway:
+    options = {"requests_per_minute": 0, "max_concurrency": 2, "max_retries": 3, "backoff_base": 0.0, "backoff_max": 0.0}
+    return LLMGateway(**{**options, **overrides})
+
+
+def test_call_retries_transient_errors():
+    failures = [ProviderError("quota", code=429), ProviderError("overloaded", code=503)]
+
+    def flaky():
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+
+    g = gateway()
+    assert g.call("test", flaky) == "ok"
+    stats = g.stats()["callers"]["test"]
+    assert (stats["attempts"], stats["retries"], stats["successes"]) == (3, 2, 1)
+
+
+def test_call_raises_permanent_errors_unchanged():
+    def rejected():
+        raise ProviderError("bad request", code=400)
+
+    g = gateway()
+    with pytest.raises(ProviderError):
+        g.call("test", rejected)
+    assert g.stats()["callers"]["test"]["attempts"] == 1
+
+
+def test_call_gives_up_after_max_retries():
+    g = gateway(max_retries=2, failure_threshold=0)
+
+    def down():
+        raise ProviderError("overloaded", code=503)
+
+    with pytest.raises(LLMUnavailable):
+        g.call("test", down)
+    assert g.stats()["callers"]["test"]["attempts"] == 3
+
+
+def test_call_does_not_retry_an_interrupted_stream():
+    g = gateway()
+    calls = []
+
+    def interrupted():
+        calls.append(1)
+        raise StreamInterrupted("tokens already sent") from ProviderError("overloaded", code=503)
+
+    with pytest.raises(LLMUnavailable):
+        g.call("test", interrupted)
+    assert len(calls) == 1
+
+
+def test_open_circuit_fails_fast():
+    g = gateway(max_retries=5, failure_threshold=2, reset_seconds=60)
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise ProviderError("overloaded", code=503)
+
+    with pytest.raises(LLMUnavailable) as raised:
+        g.call("test", down)
+    assert len(calls) == 2
+    assert raised.value.retry_after > 0
+    assert g.stats()["circuit"]["state"] == CircuitBreaker.OPEN
+
+
+def test_rate_limit_queue_timeout():
+    g = gateway(requests_per_minute=60, burst=1, queue_timeout=0.1)
+    g.call("test", lambda: None)
+    with pytest.raises(LLMUnavailable) as raised:
+        g.call("test", lambda: None)
+    assert raised.value.retry_after > 0
+
+
+# ---------- _Slots ----------
+
+def test_slots_cap_concurrent_coroutines():
+    slots = _Slots(2)
+    running = []
+
+    async def work():
+        assert await slots.aacquire(timeout=5)
+        try:
+            running.append(1)
+            await asyncio.sleep(0.01)
+        finally:
+            slots.release()
+
+    async def main():
+        await asyncio.gather(*(work() for _ in range(8)))
+
+    asyncio.run(main())
+    assert len(running) == 8
+    assert slots.max_in_flight == 2
+    assert slots.in_flight == 0
+
+
+def test_slots_timeout_and_cancellation_leave_no_slot_taken():
+    slots = _Slots(1)
+
+    async def main():
+        assert await slots.aacquire(timeout=1)
+        assert await slots.aacquire(timeout=0.01) is False
+
+        waiter = asyncio.create_task(slots.aacquire(timeout=5))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        slots.release()
+
+    asyncio.run(main())
+    assert slots.in_flight == 0
+    assert slots.acquire(timeout=0)
+
+
+def test_slots_release_hands_over_to_a_waiting_coroutine():
+    slots = _Slots(1)
+
+    async def main():
+        assert await slots.aacquire(timeout=1)
+        waiter = asyncio.create_task(slots.aacquire(timeout=5))
+        await asyncio.sleep(0.01)
+        slots.release()
+        assert await waiter
+        # The slot passed straight to the waiter; a thread cannot take it
+        assert slots.acquire(timeout=0) is False
+        slots.release()
+
+    asyncio.run(main())
+    assert slots.in_flight == 0
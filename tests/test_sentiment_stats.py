@@ -0,0 +1,90 @@
+from datetime import datetime
+
+import pytest
+
+from database import JournalEntry, SentimentAggregate
+from sentiment_stats import (
+    get_sentiment_aggregate,
+    group_names,
+    labelled_entries_for,
+    sentiment_columns,
+    store_sentiment_labels,
+    update_sentiment_aggregates,
+)
+
+CREATED_AT = datetime(2026, 10, 14, 12)
+
+
+def label(group: str, score: float = 0.8) -> dict:
+    return {"scores": {group: score}, "primary": group, "labels": [group]}
+
+
+def add_entries(db, user_id, messages, session_id="s", labelled=None) -> list[JournalEntry]:
+    entries = [
+        JournalEntry(
+            user_id=user_id,
+            session_id=session_id,
+            user_message=message,
+            ai_response="reply",
+            created_at=CREATED_AT,
+            **(sentiment_columns(labelled) if labelled else {})
+        )
+        for message in messages
+    ]
+    db.add_all(entries)
+    db.commit()
+    return entries
+
+
+def aggregate_counts(db) -> dict:
+    return {(row.scope, row.scope_key): row.entry_count for row in db.query(SentimentAggregate)}
+
+
+def test_add_then_remove_leaves_no_aggregates(db, user_id):
+    happy, sad = group_names[0], group_names[1]
+    entries = add_entries(db, user_id, ["one", "two", "three"])
+    store_sentiment_labels(db, [(entries[0], label(happy)), (entries[1], label(happy)), (entries[2], label(sad))])
+    db.commit()
+
+    assert aggregate_counts(db) == {("session", "s"): 3, ("day", "2026-10-14"): 3, ("week", "2026-W42"): 3}
+    summary = get_sentiment_aggregate(db, user_id, "session", "s")
+    assert summary["primary_counts"] == {happy: 2, sad: 1}
+    assert summary["average_scores"][happy] == pytest.approx(1.6 / 3)
+
+    update_sentiment_aggregates(db, labelled_entries_for(db, JournalEntry.session_id == "s"), sign=-1)
+    db.commit()
+    assert aggregate_counts(db) == {}
+
+
+def test_greetings_are_not_counted(db, user_id):
+    entries = add_entries(db, user_id, ["", "real"])
+    store_sentiment_labels(db, [(entry, label(group_names[0])) for entry in entries])
+    db.commit()
+    assert aggregate_counts(db)[("session", "s")] == 1
+
+
+def test_entries_are_claimed_once(db, user_id):
+    entries = add_entries(db, user_id, ["one", "two"])
+    pairs = [(entry, label(group_names[0])) for entry in entries]
+    assert store_sentiment_labels(db, pairs) == 2
+    db.commit()
+
+    # A second labeller that loaded the same unlabelled entries
+    assert store_sentiment_labels(db, pairs) == 0
+    db.commit()
+    assert aggregate_counts(db)[("session", "s")] == 2
+
+
+def test_new_row_is_seeded_from_entries_labelled_earlier(db, user_id):
+    happy = group_names[0]
+    add_entries(db, user_id, ["old one", "old two"], labelled=label(happy))
+    assert get_sentiment_aggregate(db, user_id, "session", "s")["entry_count"] == 2
+
+    [new] = add_entries(db, user_id, ["new"])
+    store_sentiment_labels(db, [(new, label(happy))])
+    db.commit()
+    assert aggregate_counts(db) == {("session", "s"): 3, ("day", "2026-10-14"): 3, ("week", "2026-W42"): 3}
+
+    update_sentiment_aggregates(db, labelled_entries_for(db, JournalEntry.session_id == "s"), sign=-1)
+    db.commit()
+    assert aggregate_counts(db) == {}
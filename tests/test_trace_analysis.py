@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from trace_analysis import _sample_by_recency, budget_entries_for_analysis
+
+NOW = datetime(2026, 10, 1)
+
+
+def entries(count: int, spacing_days: int = 2) -> list:
+    # Newest first, as get_user_journal_entries returns them
+    return [
+        SimpleNamespace(
+            id=count - i,
+            created_at=NOW - timedelta(days=i * spacing_days),
+            user_message=f"entry number {i}",
+            ai_response="a reply"
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("budget", [10, 25, 50, 200, 1000])
+def test_sampling_keeps_the_newest_entry_within_budget(budget):
+    sample = entries(100)
+    selected = _sample_by_recency(sample, [10] * len(sample), budget, NOW)
+    assert selected[0] == 0
+    assert len(selected) * 10 <= max(budget, 10)
+    assert selected == sorted(set(selected))
+
+
+def test_sampling_favours_recent_entries():
+    sample = entries(100)
+    selected = set(_sample_by_recency(sample, [10] * len(sample), 300, NOW))
+    assert len(selected & set(range(50))) > len(selected & set(range(50, 100)))
+
+
+def test_duplicates_and_greetings_are_removed():
+    sample = entries(3)
+    sample[1].user_message = "Entry number 0!"
+    sample[2].user_message = ""
+    _, report = budget_entries_for_analysis(sample, token_budget=10000, now=NOW)
+    assert (report["entries_included"], report["duplicates_removed"], report["empty_removed"]) == (1, 1, 1)
@@ -1,39 +1,84 @@
 """Trace analysis module for analyzing user journal entries with LLM."""
+import hashlib
 import os
+import re
+import threading
+from collections import OrderedDict
 from typing import Optional
 from datetime import datetime, timedelta
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
 from langsmith import traceable
+from sqlalchemy import Row
 from sqlalchemy.orm import Session
 
 from database import JournalEntry, SessionLocal
-from prompts.trace_analysis_prompt import TRACE_ANALYSIS_PROMPT
+from llm_gateway import llm_gateway
+from prompts.trace_analysis_prompt import (
+    CHUNK_SUMMARY_PROMPT,
+    REDUCE_ANALYSIS_INSTRUCTIONS,
+    TRACE_ANALYSIS_PROMPT,
+)
 
-# Initialize LLM for analysis
+# LLM for analysis, created on first use (assign analysis_model to override)
 gemini_api_key = os.getenv('GEMINI_API_KEY')
-analysis_model = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    google_api_key=gemini_api_key,
-    temperature=0.7,
-)
+analysis_model = None
+_analysis_model_lock = threading.Lock()
+
+
+def get_analysis_model() -> BaseChatModel:
+    """Return the analysis LLM, constructing the Gemini client on first call."""
+    global analysis_model
+    if analysis_model is None:
+        with _analysis_model_lock:
+            if analysis_model is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                analysis_model = ChatGoogleGenerativeAI(
+                    model="gemini-2.5-flash",
+                    google_api_key=gemini_api_key,
+                    temperature=0.7,
+                    # Retries are left to llm_gateway (1 means a single attempt here)
+                    max_retries=1,
+                )
+    return analysis_model
+
+# Hierarchical (map-reduce) analysis settings
+ANALYSIS_MODE = os.getenv('ANALYSIS_MODE', 'auto')  # auto, single or map_reduce
+ANALYSIS_MAP_REDUCE_MIN_ENTRIES = int(os.getenv('ANALYSIS_MAP_REDUCE_MIN_ENTRIES', '60'))
+ANALYSIS_CHUNK_BY = os.getenv('ANALYSIS_CHUNK_BY', 'week')  # day or week
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv('ANALYSIS_MAX_CONCURRENCY', '4'))
+ANALYSIS_CHUNK_CACHE_SIZE = int(os.getenv('ANALYSIS_CHUNK_CACHE_SIZE', '1024'))
+ANALYSIS_RECENCY_HALF_LIFE_DAYS = float(os.getenv('ANALYSIS_RECENCY_HALF_LIFE_DAYS', '14'))
+
+# Prompt token budgets for the entries section (single prompt and per map chunk)
+ANALYSIS_TOKEN_BUDGET = int(os.getenv('ANALYSIS_TOKEN_BUDGET', '12000'))
+ANALYSIS_CHUNK_TOKEN_BUDGET = int(os.getenv('ANALYSIS_CHUNK_TOKEN_BUDGET', '3000'))
+ANALYSIS_AI_RESPONSE_CHARS = int(os.getenv('ANALYSIS_AI_RESPONSE_CHARS', '200'))
+
+# Rough Gemini tokenization for English prose; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
 
 @traceable
 def get_user_journal_entries(
     user_id: int,
     days: int = 30,
     db: Optional[Session] = None
-) -> list[dict]:
+) -> list[Row]:
     """
     Retrieve user's journal entries from the database.
     
+    Only the columns the analysis reads are selected, as lightweight rows
+    rather than ORM objects.
+    
     Args:
         user_id: The user's ID
         days: Number of days to look back (default: 30)
         db: Database session (creates new one if not provided)
     
     Returns:
-        List of journal entries with timestamp and content
+        Rows with id, created_at, user_message and ai_response, newest first
     """
     if db is None:
         db = SessionLocal()
@@ -46,25 +91,16 @@ def get_user_journal_entries(
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
-        # Query journal entries
-        entries = db.query(JournalEntry).filter(
+        return db.query(
+            JournalEntry.id,
+            JournalEntry.created_at,
+            JournalEntry.user_message,
+            JournalEntry.ai_response
+        ).filter(
             JournalEntry.user_id == user_id,
             JournalEntry.created_at >= start_date,
             JournalEntry.created_at <= end_date
         ).order_by(JournalEntry.created_at.desc()).all()
-        
-        # Format entries for analysis
-        formatted_entries = [
-            {
-                "timestamp": entry.created_at.isoformat(),
-                "user_message": entry.user_message,
-                "ai_response": entry.ai_response,
-                "id": entry.id
-            }
-            for entry in entries
-        ]
-        
-        return formatted_entries
     
     finally:
         if should_close:
@@ -72,12 +108,12 @@ def get_user_journal_entries(
 
 
 @traceable
-def format_entries_for_analysis(entries: list[dict]) -> str:
+def format_entries_for_analysis(entries: list[Row]) -> str:
     """
     Format journal entries into a prompt-friendly string.
     
     Args:
-        entries: List of journal entry dictionaries
+        entries: Rows from get_user_journal_entries
     
     Returns:
         Formatted string of entries
@@ -85,50 +121,431 @@ def format_entries_for_analysis(entries: list[dict]) -> str:
     if not entries:
         return "No journal entries found for the specified period."
     
-    formatted_text = f"Total entries analyzed: {len(entries)}\n\n"
+    header = f"Total entries analyzed: {len(entries)}\n\n"
+    return header + "".join(
+        f"--- Entry {i} ({entry.created_at.isoformat()}) ---\n"
+        f"Your thoughts: {entry.user_message}\n"
+        f"Response: {entry.ai_response}\n\n"
+        for i, entry in enumerate(entries, 1)
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _normalize_message(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace, so entries differing only in those compare equal."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def _budget_response(ai_response: Optional[str], mode: str) -> Optional[str]:
+    if mode == "dropped" or not ai_response:
+        return None
+    if mode == "truncated" and len(ai_response) > ANALYSIS_AI_RESPONSE_CHARS:
+        return ai_response[:ANALYSIS_AI_RESPONSE_CHARS].rstrip() + "..."
+    return ai_response
+
+
+def _render_entry(number: int, entry: Row, ai_response: Optional[str]) -> str:
+    text = f"--- Entry {number} ({entry.created_at.isoformat()}) ---\nYour thoughts: {entry.user_message}\n"
+    if ai_response:
+        text = f"{text}Response: {ai_response}\n"
+    return text + "\n"
+
+
+def _sample_by_recency(entries: list[Row], costs: list[int], token_budget: int, now: datetime) -> list[int]:
+    """
+    Pick entry indices that fit the budget, keeping recent entries densely
+    and older ones more sparsely.
+    
+    The newest entry is always kept. Each other entry is kept with density
+    min(1, scale * recency_weight), spread evenly by accumulating
+    densities; scale is the largest value (found by bisection) whose
+    selection fits token_budget.
+    """
+    weights = [recency_weight(entry.created_at, now) for entry in entries]
     
-    for i, entry in enumerate(entries, 1):
-        formatted_text += f"--- Entry {i} ({entry['timestamp']}) ---\n"
-        formatted_text += f"Your thoughts: {entry['user_message']}\n"
-        formatted_text += f"Response: {entry['ai_response']}\n\n"
+    def select(scale: float) -> tuple[list[int], int]:
+        kept, tokens, acc = [0], costs[0], 0.0
+        for i, weight in enumerate(weights[1:], 1):
+            acc += min(1.0, scale * weight)
+            if acc >= 1.0 - 1e-9:
+                acc -= 1.0
+                kept.append(i)
+                tokens += costs[i]
+        return kept, tokens
     
-    return formatted_text
+    low, high = 0.0, 1.0 / max(min(weights), 1e-9)
+    best = [0]
+    for _ in range(30):
+        scale = (low + high) / 2
+        kept, tokens = select(scale)
+        if tokens <= token_budget:
+            if len(kept) >= len(best):
+                best = kept
+            low = scale
+        else:
+            high = scale
+    return best
+
+
+@traceable
+def budget_entries_for_analysis(
+    entries: list[Row],
+    token_budget: int = ANALYSIS_TOKEN_BUDGET,
+    now: Optional[datetime] = None
+) -> tuple[str, dict]:
+    """
+    Format journal entries into prompt text that fits a token budget.
+    
+    Session greetings (no user message) and exact duplicates (ignoring
+    case, punctuation and spacing) are always removed, keeping the newest
+    copy. If the rest is still over
+    budget, AI responses are truncated, then dropped, and finally older
+    entries are sampled more sparsely than recent ones.
+    
+    Args:
+        entries: Rows from get_user_journal_entries, newest first
+        token_budget: Maximum estimated tokens of the returned text
+        now: Reference time for recency (default: now)
+    
+    Returns:
+        Tuple of (formatted text, report of what was kept and tokens saved)
+    """
+    now = now or datetime.utcnow()
+    original_tokens = estimate_tokens(format_entries_for_analysis(entries))
+    
+    unique, seen = [], set()
+    duplicates = empty = 0
+    for entry in entries:
+        if not entry.user_message or not entry.user_message.strip():
+            empty += 1
+            continue
+        key = _normalize_message(entry.user_message)
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        unique.append(entry)
+    
+    for mode in ("full", "truncated", "dropped"):
+        costs = [
+            estimate_tokens(_render_entry(i, entry, _budget_response(entry.ai_response, mode)))
+            for i, entry in enumerate(unique, 1)
+        ]
+        if sum(costs) <= token_budget:
+            break
+    
+    selected = list(range(len(unique)))
+    if unique and sum(costs) > token_budget:
+        selected = _sample_by_recency(unique, costs, token_budget, now)
+    
+    if unique:
+        header = f"Total entries in period: {len(entries)}"
+        if len(selected) < len(unique):
+            header += f" ({len(selected)} shown; older entries are sampled more sparsely)"
+        text = header + "\n\n" + "".join(
+            _render_entry(number, unique[i], _budget_response(unique[i].ai_response, mode))
+            for number, i in enumerate(selected, 1)
+        )
+    else:
+        text = "No journal entries found for the specified period."
+    
+    prompt_tokens = estimate_tokens(text)
+    return text, {
+        "token_budget": token_budget,
+        "original_tokens": original_tokens,
+        "prompt_tokens": prompt_tokens,
+        "tokens_saved": max(original_tokens - prompt_tokens, 0),
+        "entries_total": len(entries),
+        "entries_included": len(selected),
+        "duplicates_removed": duplicates,
+        "empty_removed": empty,
+        "ai_responses": mode
+    }
+
+
+def build_analysis_prompt(entries: list[Row], token_budget: Optional[int] = ANALYSIS_TOKEN_BUDGET) -> tuple[str, dict]:
+    """
+    Single-prompt analysis input for a window of entries.
+    
+    Returns:
+        Tuple of (prompt, budget report); token_budget=None formats every
+        entry in full and reports no savings
+    """
+    if token_budget is None:
+        formatted_entries = format_entries_for_analysis(entries)
+        tokens = estimate_tokens(formatted_entries)
+        report = {"original_tokens": tokens, "prompt_tokens": tokens, "tokens_saved": 0}
+    else:
+        formatted_entries, report = budget_entries_for_analysis(entries, token_budget)
+    
+    prompt = f"""{TRACE_ANALYSIS_PROMPT}
+    Here are the journal entries to analyze:
+    {formatted_entries}
+    Please provide a thoughtful analysis of these entries, identifying the key patterns and insights."""
+    return prompt, report
+
+
+def merge_budget_reports(reports: list[dict]) -> dict:
+    """Sum per-chunk budget reports into one report for the whole window."""
+    merged = {}
+    for report in reports:
+        for key, value in report.items():
+            if isinstance(value, int) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+class ChunkSummaryCache:
+    """
+    Thread-safe LRU of chunk summaries keyed by a hash of the chunk's content.
+
+    Past days and weeks do not change, so after the first analysis only the
+    current chunk has to be summarized again.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return summary
+
+    def put(self, key: str, summary: str) -> None:
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+chunk_summary_cache = ChunkSummaryCache(ANALYSIS_CHUNK_CACHE_SIZE)
+
+# Running totals of prompt tokens sent and saved by budgeting
+_prompt_stats_lock = threading.Lock()
+_prompt_stats = {"analyses": 0, "prompt_tokens": 0, "tokens_saved": 0}
+
+
+def chunk_entries(entries: list[Row], chunk_by: str = ANALYSIS_CHUNK_BY) -> list[dict]:
+    """
+    Group entries into calendar chunks.
+    
+    Args:
+        entries: Rows from get_user_journal_entries (any order)
+        chunk_by: "day" or "week" (ISO week)
+    
+    Returns:
+        Chunks newest first, each with a "key", its "start" and "end"
+        datetimes and its "entries" in chronological order
+    """
+    chunks = {}
+    for entry in entries:
+        created_at = entry.created_at
+        if chunk_by == "day":
+            key = created_at.date().isoformat()
+        else:
+            year, week, _ = created_at.isocalendar()
+            key = f"{year}-W{week:02d}"
+        chunks.setdefault(key, []).append((created_at, entry))
+    
+    result = []
+    for key, items in chunks.items():
+        items.sort(key=lambda item: item[0])
+        result.append({
+            "key": key,
+            "start": items[0][0],
+            "end": items[-1][0],
+            "entries": [entry for _, entry in items]
+        })
+    result.sort(key=lambda chunk: chunk["end"], reverse=True)
+    return result
+
+
+def recency_weight(chunk_end: datetime, now: datetime, half_life_days: float = ANALYSIS_RECENCY_HALF_LIFE_DAYS) -> float:
+    """Exponential decay weight of a chunk by the age of its newest entry."""
+    if half_life_days <= 0:
+        return 1.0
+    age_days = max((now - chunk_end).total_seconds() / 86400, 0.0)
+    return 0.5 ** (age_days / half_life_days)
+
+
+def _chunk_cache_key(user_id: int, chunk_text: str) -> str:
+    digest = hashlib.sha256(CHUNK_SUMMARY_PROMPT.encode("utf-8"))
+    digest.update(f"{user_id}\n".encode("utf-8"))
+    digest.update(chunk_text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+@traceable
+def summarize_chunks(
+    user_id: int,
+    chunks: list[dict],
+    max_concurrency: int = ANALYSIS_MAX_CONCURRENCY
+) -> tuple[list[str], dict]:
+    """
+    Map step: summarize each chunk, reusing cached summaries.
+    
+    Each chunk's entries are fitted to ANALYSIS_CHUNK_TOKEN_BUDGET.
+    Uncached chunks are summarized in one batch call with bounded
+    concurrency. If some of them fail, the others are still cached before
+    the first error is raised, so a retry only pays for the failed ones.
+    
+    Args:
+        user_id: The user's ID (part of the cache key)
+        chunks: Output of chunk_entries
+        max_concurrency: Maximum concurrent LLM calls
+    
+    Returns:
+        Tuple of (one summary per chunk in the same order, merged budget report)
+    """
+    budgeted = [
+        # chunk_entries orders entries oldest first; budgeting expects newest first
+        budget_entries_for_analysis(chunk["entries"][::-1], ANALYSIS_CHUNK_TOKEN_BUDGET)
+        for chunk in chunks
+    ]
+    texts = [text for text, _ in budgeted]
+    keys = [_chunk_cache_key(user_id, text) for text in texts]
+    summaries = [chunk_summary_cache.get(key) for key in keys]
+    
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    if missing:
+        inputs = [
+            [HumanMessage(content=f"{CHUNK_SUMMARY_PROMPT}\n\nPeriod: {chunks[i]['key']}\n\n{texts[i]}")]
+            for i in missing
+        ]
+        model = get_analysis_model()
+        responses = RunnableLambda(lambda messages: llm_gateway.call("analysis", model.invoke, messages)).batch(
+            inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True
+        )
+        errors = []
+        for i, response in zip(missing, responses):
+            if isinstance(response, Exception):
+                errors.append(response)
+                continue
+            summaries[i] = response.content
+            chunk_summary_cache.put(keys[i], response.content)
+        if errors:
+            raise errors[0]
+    
+    return summaries, merge_budget_reports([report for _, report in budgeted])
+
+
+@traceable
+def reduce_chunk_summaries(chunks: list[dict], summaries: list[str], now: Optional[datetime] = None) -> str:
+    """
+    Reduce step: combine recency-weighted chunk summaries into the final insights.
+    
+    Args:
+        chunks: Output of chunk_entries (newest first)
+        summaries: One summary per chunk
+        now: Reference time for recency weights (default: now)
+    
+    Returns:
+        Analysis insights as a formatted string
+    """
+    now = now or datetime.utcnow()
+    periods = []
+    for chunk, summary in zip(chunks, summaries):
+        weight = recency_weight(chunk["end"], now)
+        periods.append(
+            f"--- Period {chunk['key']} ({len(chunk['entries'])} entries, recency weight {weight:.2f}) ---\n{summary}"
+        )
+    total = sum(len(chunk["entries"]) for chunk in chunks)
+    
+    analysis_prompt = f"""{TRACE_ANALYSIS_PROMPT}
+    {REDUCE_ANALYSIS_INSTRUCTIONS}
+    Total entries analyzed: {total}
+    Here are the period summaries to analyze:
+    {chr(10).join(periods)}
+    Please provide a thoughtful analysis of these periods, identifying the key patterns and insights."""
+    
+    response = llm_gateway.call("analysis", get_analysis_model().invoke, [HumanMessage(content=analysis_prompt)])
+    return response.content
+
+
+def use_map_reduce(entry_count: int) -> bool:
+    """Whether a window of entry_count entries is analyzed hierarchically."""
+    if ANALYSIS_MODE == "map_reduce":
+        return True
+    if ANALYSIS_MODE == "single":
+        return False
+    return entry_count >= ANALYSIS_MAP_REDUCE_MIN_ENTRIES
+
+
+def _record_prompt_tokens(report: dict) -> None:
+    with _prompt_stats_lock:
+        _prompt_stats["analyses"] += 1
+        _prompt_stats["prompt_tokens"] += report.get("prompt_tokens", 0)
+        _prompt_stats["tokens_saved"] += report.get("tokens_saved", 0)
+
+
+def analyze_entries(user_id: int, entries: list[Row]) -> tuple[str, dict]:
+    """
+    Run the analysis over already fetched entries.
+    
+    Returns:
+        Tuple of (insights, prompt budget report)
+    """
+    # Large windows: summarize calendar chunks in parallel, then combine them
+    if use_map_reduce(len(entries)):
+        chunks = chunk_entries(entries)
+        summaries, report = summarize_chunks(user_id, chunks)
+        insights = reduce_chunk_summaries(chunks, summaries)
+    else:
+        prompt, report = build_analysis_prompt(entries)
+        insights = llm_gateway.call("analysis", get_analysis_model().invoke, [HumanMessage(content=prompt)]).content
+    
+    _record_prompt_tokens(report)
+    print(f"Trace Me prompt: {report['prompt_tokens']} tokens, {report['tokens_saved']} saved by budgeting")
+    return insights, report
 
 
 @traceable
 def analyze_journal_entries(
     user_id: int,
     days: int = 30,
-    db: Optional[Session] = None
+    db: Optional[Session] = None,
+    entries: Optional[list[Row]] = None
 ) -> str:
     """
     Analyze user's journal entries using LLM with LangSmith tracing.
     
+    Windows with at least ANALYSIS_MAP_REDUCE_MIN_ENTRIES entries (or every
+    window when ANALYSIS_MODE=map_reduce) are analyzed hierarchically: one
+    cached summary per day or week, then a recency-weighted reduce.
+    
     Args:
         user_id: The user's ID
         days: Number of days to analyze (default: 30)
         db: Database session (creates new one if not provided)
+        entries: Already fetched entries for the window (fetched if None)
     
     Returns:
         Analysis insights as a formatted string
     """
     # Get journal entries from database
-    entries = get_user_journal_entries(user_id, days, db)
-    
-    # Format entries for the prompt
-    formatted_entries = format_entries_for_analysis(entries)
-    
-    # Create the analysis prompt
-    analysis_prompt = f"""{TRACE_ANALYSIS_PROMPT}
-    Here are the journal entries to analyze:
-    {formatted_entries}
-    Please provide a thoughtful analysis of these entries, identifying the key patterns and insights."""
+    if entries is None:
+        entries = get_user_journal_entries(user_id, days, db)
     
-    # Invoke the model with tracing
-    message = HumanMessage(content=analysis_prompt)
-    response = analysis_model.invoke([message])
-    
-    return response.content
+    insights, _ = analyze_entries(user_id, entries)
+    return insights
 
 
 @traceable
@@ -158,13 +575,22 @@ def get_analysis_summary(
             "insights": None
         }
     
-    # Perform analysis
-    insights = analyze_journal_entries(user_id, days, db)
+    # Perform analysis on the entries fetched above
+    insights, prompt_report = analyze_entries(user_id, entries)
     
     return {
         "success": True,
         "entry_count": len(entries),
         "analysis_period_days": days,
+        "mode": "map_reduce" if use_map_reduce(len(entries)) else "single",
         "timestamp": datetime.utcnow().isoformat(),
+        "prompt": prompt_report,
         "insights": insights
-    }
\ No newline at end of file
+    }
+
+
+def analysis_cache_stats() -> dict:
+    """Hit/miss counters for cached chunk summaries and prompt token totals."""
+    with _prompt_stats_lock:
+        prompt_stats = dict(_prompt_stats)
+    return {**chunk_summary_cache.stats(), "prompt_tokens": prompt_stats}
@@ -0,0 +1,159 @@
+"""
+Script to backfill input validation verdicts over stored journal entries.
+
+The validation_* columns come from migrate_sentiment_columns.py (or init.sql).
+"""
+import argparse
+import time
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from agent_core import llm_validator
+from database import JournalEntry, SessionLocal
+from input_validation import input_validator, text_hash
+
+
+def _page_verdicts(rows) -> tuple[dict, dict]:
+    """
+    Verdicts for a page of entries: local tiers first, then one batched LLM
+    pass over the distinct escalated texts.
+
+    Returns:
+        Tuple of ({entry id: verdict}, counters)
+    """
+    verdicts = {}
+    escalated = {}  # text hash -> (text, [entry ids])
+    for row in rows:
+        verdict = input_validator.check(row.user_message)
+        if verdict is not None:
+            verdicts[row.id] = verdict
+        else:
+            key = text_hash(row.user_message)
+            escalated.setdefault(key, (row.user_message, []))[1].append(row.id)
+
+    local = len(verdicts)
+    texts = [message for message, _ in escalated.values()]
+    for (message, ids), verdict in zip(escalated.values(), llm_validator.validate_batch(texts)):
+        if verdict is None:
+            # Left unvalidated; the next run picks these entries up again
+            continue
+        input_validator.remember(message, verdict)
+        for entry_id in ids:
+            verdicts[entry_id] = verdict
+
+    return verdicts, {"local": local, "escalated_texts": len(texts)}
+
+
+def validate_unvalidated_entries(
+    db: Session,
+    batch_size: int = 200,
+    start_after_id: int = 0,
+    limit: int | None = None
+) -> dict:
+    """
+    Validate entries without a verdict in pages, committing after every page.
+
+    Pages through rows with validated_at IS NULL using keyset pagination on
+    id. Each page is first checked by the local tiers; the remaining
+    distinct texts go to the LLM validator in batches of
+    INPUT_VALIDATION_BATCH_SIZE per call. Entries the LLM could not judge
+    within its retry budget stay NULL for a later run.
+
+    Args:
+        db: Database session
+        batch_size: Entries per page and per commit
+        start_after_id: Only consider entries with a larger id
+        limit: Stop after this many entries (None for all)
+
+    Returns:
+        Dictionary with processed/validated counts, tier split, last id and throughput
+    """
+    last_id = start_after_id
+    processed = 0
+    validated = 0
+    local = 0
+    escalated_texts = 0
+    calls_before = llm_validator.stats()["attempts"]
+    start = time.perf_counter()
+
+    while limit is None or processed < limit:
+        page_size = batch_size if limit is None else min(batch_size, limit - processed)
+        rows = db.query(
+            JournalEntry.id,
+            JournalEntry.user_message
+        ).filter(
+            JournalEntry.validated_at.is_(None),
+            # The greeting entry that opens a session has no user message
+            JournalEntry.user_message != "",
+            JournalEntry.id > last_id
+        ).order_by(JournalEntry.id).limit(page_size).all()
+
+        if not rows:
+            break
+
+        verdicts, counters = _page_verdicts(rows)
+        if verdicts:
+            validated_at = datetime.utcnow()
+            db.execute(update(JournalEntry), [
+                {
+                    "id": entry_id,
+                    "validation_is_valid": verdict["is_valid"],
+                    "validation_reason": verdict["reason"],
+                    "validated_at": validated_at
+                }
+                for entry_id, verdict in verdicts.items()
+            ])
+        db.commit()
+
+        last_id = rows[-1].id
+        processed += len(rows)
+        validated += len(verdicts)
+        local += counters["local"]
+        escalated_texts += counters["escalated_texts"]
+
+        elapsed = time.perf_counter() - start
+        print(f"Processed {processed} entries (last id {last_id}) - {processed / elapsed:.1f} entries/sec")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "processed": processed,
+        "validated": validated,
+        "decided_locally": local,
+        "escalated_texts": escalated_texts,
+        "llm_calls": llm_validator.stats()["attempts"] - calls_before,
+        "last_id": last_id,
+        "seconds": elapsed,
+        "entries_per_second": processed / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def validate_all_entries(batch_size: int = 200, start_after_id: int = 0, limit: int | None = None):
+    """Validate all unvalidated journal entries and store the verdicts."""
+    db: Session = SessionLocal()
+
+    try:
+        stats = validate_unvalidated_entries(db, batch_size=batch_size, start_after_id=start_after_id, limit=limit)
+        print(
+            f"\n✓ Validated {stats['validated']}/{stats['processed']} entries in {stats['seconds']:.1f}s "
+            f"({stats['decided_locally']} locally, {stats['escalated_texts']} distinct texts in {stats['llm_calls']} LLM calls)"
+        )
+        print(f"Validator counters: {llm_validator.stats()}")
+    except Exception as e:
+        db.rollback()
+        print(f"Error: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill input validation verdicts over journal entries.")
+    parser.add_argument("--batch-size", type=int, default=200, help="Entries per page and per commit")
+    parser.add_argument("--start-after-id", type=int, default=0, help="Skip entries with id <= this value")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of entries to process")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("JOURNAL INPUT VALIDATION BACKFILL")
+    print("="*60)
+    validate_all_entries(batch_size=args.batch_size, start_after_id=args.start_after_id, limit=args.limit)